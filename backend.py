@@ -1,190 +1,1892 @@
+import os
+import json
+import queue
 import pandas as pd
 import gspread
-import gspread.utils # [THÊM MỚI]
+import itertools
 import threading
-from flask import Flask, jsonify, request
+import time
+import gzip
+import unicodedata
+import uuid
+import numpy as np
+from collections import defaultdict
+from flask import Flask, jsonify, request, Response
 from google.oauth2.service_account import Credentials
 from datetime import datetime
 from flask_cors import CORS # Quan trọng: Cho phép frontend gọi
+from storage import GoogleSheetsStorage, SqliteStorage, SheetSyncJob, WriteBehindStorage
+from chunked_frame import ChunkedFrame, same_values
 
 # --- Cấu hình ---
-SERVICE_FILE = r"C:\Users\USER\Downloads\mindx_api_key.json"
-SHEET_ID = "11v7fwIN2YtrEIq3eAT_duAz-SMUaUIfFm2PEJGzTftI"
-# Yêu CẦU QUYỀN GHI
-SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+# Các thiết lập triển khai đọc từ biến môi trường; mặc định là chạy thử trên một máy
+APP_ENV = os.environ.get("APP_ENV", "development") # "production": chạy bằng waitress thay cho server dev
+SERVICE_FILE = os.environ.get("SERVICE_FILE", r"C:\Users\USER\Downloads\mindx_api_key.json")
+SHEET_ID = os.environ.get("SHEET_ID", "11v7fwIN2YtrEIq3eAT_duAz-SMUaUIfFm2PEJGzTftI")
+BACKEND_HOST = os.environ.get("BACKEND_HOST", "127.0.0.1")
+BACKEND_PORT = int(os.environ.get("BACKEND_PORT", "5000"))
+# Yêu CẦU QUYỀN GHI (Drive chỉ đọc metadata: hỏi thời điểm sửa cuối để biết Sheet có thay đổi)
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive.metadata.readonly",
+]
+# Thời gian (giây) giữ snapshot dữ liệu của mỗi tab trong bộ nhớ trước khi tải lại
+SNAPSHOT_TTL_SECONDS = 30
+# Luồng nền làm mới snapshot: chu kỳ (giây) hỏi Sheet có thay đổi không, có thì tải lại
+# (0 = tắt, request tự tải lại khi snapshot hết hạn). Khi bật, request chỉ đọc snapshot hiện có.
+SNAPSHOT_REFRESH_SECONDS = 10
+# Tải lại toàn bộ dù không thấy thay đổi sau chừng này giây (phòng khi không hỏi được thay đổi)
+SNAPSHOT_MAX_AGE_SECONDS = 300
+# Số dòng mỗi khúc của snapshot và bảng gộp: ghi vài dòng chỉ chép các khúc chứa các dòng đó
+SNAPSHOT_CHUNK_ROWS = 32768
+# Chỉ mục ngày của bảng gộp: các dòng ghi thêm/đổi ngày quá chừng này thì gộp lại vào phần chính
+DATE_INDEX_RECENT_MAX = 4096
+# Nơi lưu dữ liệu: "gsheets" (mặc định, đọc/ghi trực tiếp Google Sheets),
+# "journal" (đọc Google Sheets; ghi vào journal cục bộ rồi trả lời ngay, luồng nền đẩy lên Sheet theo lô:
+# request ghi báo thành công TRƯỚC khi dữ liệu lên Sheet, mất file journal là mất các lần ghi chưa đẩy)
+# hoặc "sqlite" (đọc/ghi file SQLite cục bộ, đồng bộ dần lên Google Sheets)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "gsheets")
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "pom_local.db")
+JOURNAL_PATH = os.environ.get("JOURNAL_PATH", "pom_writes.journal")
+# Chu kỳ (giây) đồng bộ dữ liệu SQLite lên Google Sheets (0 = không đồng bộ)
+SYNC_INTERVAL_SECONDS = 60
+# Chu kỳ (giây) đẩy các lần ghi đang chờ trong journal lên Google Sheets
+WRITE_FLUSH_SECONDS = 2
+# Dữ liệu dashboard dạng cột (client xin qua header Accept): gọn hơn mảng các dòng, đọc nhanh hơn
+COLUMNAR_MIMETYPE = "application/vnd.dashboard.columns+json"
+# Nén gzip phản hồi dữ liệu từ ngưỡng này (byte) nếu client chấp nhận
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 1 # Mức nhanh: backend và frontend thường cùng máy/mạng nội bộ
+# Số dòng đã xóa khỏi bảng gộp được nhớ cho /api/changes (client cũ hơn thì tải lại toàn bộ)
+CHANGE_LOG_MAX_DELETED = 10000
+# Đẩy sự kiện thay đổi tới dashboard đang mở (Server-Sent Events, /api/events)
+SSE_MAX_CLIENTS = 50
+SSE_QUEUE_SIZE = 100 # Sự kiện chờ gửi tối đa mỗi client; đầy thì gộp thành một sự kiện 'reload'
+SSE_KEEPALIVE_SECONDS = 15
+SSE_RETRY_MS = 3000 # Trình duyệt chờ bao lâu trước khi kết nối lại
+# Số luồng phục vụ request khi chạy production; mỗi dashboard đang nghe /api/events giữ một luồng
+BACKEND_THREADS = int(os.environ.get("BACKEND_THREADS", str(SSE_MAX_CLIENTS + 16)))
 
 # --- Khởi tạo ---
-try:
+def _authorize():
     creds = Credentials.from_service_account_file(SERVICE_FILE, scopes=SCOPES)
-    client = gspread.authorize(creds)
+    return gspread.authorize(creds)
+
+try:
+    sheets_storage = GoogleSheetsStorage(_authorize, SHEET_ID)
     print("Backend: Kết nối Google Sheets thành công!")
 except Exception as e:
     print(f"Backend LỖI: Không thể kết nối Google Sheets. Kiểm tra file key và quyền 'Editor'.")
     print(f"Chi tiết lỗi: {e}")
-    exit()
+    if STORAGE_BACKEND != "sqlite":
+        exit()
+    # Dữ liệu cục bộ vẫn dùng được, chỉ không nạp/đồng bộ với Google Sheets
+    sheets_storage = None
+
+if STORAGE_BACKEND == "sqlite":
+    storage = SqliteStorage(SQLITE_PATH, seed_from=sheets_storage)
+    sync_job = SheetSyncJob(storage, sheets_storage, ["pom", "dim_publisher"], SYNC_INTERVAL_SECONDS) \
+        if sheets_storage is not None and SYNC_INTERVAL_SECONDS > 0 else None
+elif STORAGE_BACKEND == "journal":
+    storage = WriteBehindStorage(sheets_storage, JOURNAL_PATH, WRITE_FLUSH_SECONDS)
+    sync_job = storage # Luồng nền đẩy journal lên Sheet
+else:
+    storage = sheets_storage
+    sync_job = None
+
+def start_background_jobs():
+    """Chạy các luồng nền (đồng bộ SQLite/journal -> Google Sheets, làm mới snapshot); gọi nhiều lần không sao."""
+    if sync_job is not None:
+        sync_job.start()
+    if SNAPSHOT_REFRESH_SECONDS > 0:
+        snapshot_refresher.start()
+
+def create_app():
+    """
+    Ứng dụng cho WSGI server (chạy luôn các luồng nền), vd:
+        waitress-serve --threads=66 --port=5000 --call backend:create_app
+        gunicorn -w 1 --threads 66 -b 0.0.0.0:5000 "backend:create_app()"
+    Backend giữ snapshot, bộ cấp ID và journal ghi trong bộ nhớ của tiến trình nên chỉ chạy
+    MỘT tiến trình (nhiều luồng); các worker của frontend dùng chung backend này.
+    """
+    start_background_jobs()
+    return app
 
-# Khóa luồng để tránh 2 người cùng tạo ID mới
-data_lock = threading.Lock()
+# Khóa luồng khi tạo pháp nhân: kiểm tra trùng mã và cấp ID đi liền một bước.
+# Tạo PO không cần khóa bảng (allocate_ids tự cấp ID nguyên tử), nên không chặn tạo pháp nhân.
+table_locks = {
+    "dim_publisher": threading.Lock(),
+}
 
 app = Flask(__name__)
 # Kích hoạt CORS cho phép frontend (port 8000) gọi
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 app.config['JSON_AS_ASCII'] = False
 
-# --- Hàm hỗ trợ Google Sheets ---
+# --- Hàm hỗ trợ đọc/ghi dữ liệu (qua storage) ---
 
-def get_worksheet(worksheet_name):
-    """Mở một tab (worksheet) từ Sheet."""
-    try:
-        sheet = client.open_by_key(SHEET_ID)
-        return sheet.worksheet(worksheet_name)
-    except Exception as e:
-        print(f"Lỗi khi mở tab '{worksheet_name}': {e}")
-        return None
+def get_headers(worksheet_name):
+    """Lấy dòng tiêu đề của tab (storage tự cache)."""
+    return storage.get_headers(worksheet_name)
+
+# --- Cache snapshot dữ liệu ---
+# Mỗi tab giữ một bảng dùng chung cho mọi request (ChunkedFrame, không bao giờ sửa tại chỗ: mọi thay đổi
+# tạo bảng mới dùng lại các khúc không đổi rồi thay vào). Không có luồng làm mới thì snapshot hết hạn
+# sau SNAPSHOT_TTL_SECONDS.
+# Các hàm ghi (append/update) cập nhật vào snapshot để lần đọc sau vẫn đúng: bảng mới (và bảng gộp)
+# được dựng khi chỉ giữ _snapshot_write_lock (các lần ghi lần lượt), _snapshot_lock chỉ giữ trong chốc
+# lát để thay vào, nên request đọc không phải chờ lần ghi.
+# Mỗi lần nội dung snapshot thay đổi (tải dữ liệu khác hoặc ghi) nó nhận version mới.
+# checked_at: lần gần nhất biết chắc snapshot khớp dữ liệu nguồn (tải xong / hỏi thấy không đổi).
+_snapshots = {}  # {worksheet_name: {"rows": ChunkedFrame, "loaded_at", "checked_at", "version"}}
+_snapshot_lock = threading.Lock()
+_snapshot_write_lock = threading.Lock() # Lấy trước _snapshot_lock
+_snapshot_load_locks = {}  # Mỗi tab một khóa, tránh nhiều request cùng tải lại một tab
+_snapshot_versions = itertools.count(1)
+
+def _get_snapshot_load_lock(worksheet_name):
+    with _snapshot_lock:
+        return _snapshot_load_locks.setdefault(worksheet_name, threading.Lock())
+
+def _load_records_as_df(worksheet_name):
+    """Tải toàn bộ dữ liệu từ tab trong storage (không qua cache)."""
+    return storage.load_df(worksheet_name)
+
+def _get_fresh_snapshot(worksheet_name):
+    """Trả về bảng snapshot còn hạn của tab (hoặc None); luồng làm mới đang chạy thì snapshot luôn còn hạn."""
+    with _snapshot_lock:
+        snap = _snapshots.get(worksheet_name)
+        if snap and (
+            snapshot_refresher.is_running() or time.monotonic() - snap["loaded_at"] < SNAPSHOT_TTL_SECONDS
+        ):
+            return snap["rows"]
+    return None
+
+def _load_snapshot_rows(worksheet_name, force_refresh=False):
+    """
+    Trả về bảng snapshot (ChunkedFrame) của tab, tải lại nếu hết hạn; None nếu tải lỗi.
+    Bảng này dùng chung: chỉ đọc, không sửa trực tiếp.
+    """
+    if not force_refresh:
+        rows = _get_fresh_snapshot(worksheet_name)
+        if rows is not None:
+            return rows
+
+    with _get_snapshot_load_lock(worksheet_name):
+        # Request khác có thể vừa tải xong trong lúc chờ khóa
+        if not force_refresh:
+            rows = _get_fresh_snapshot(worksheet_name)
+            if rows is not None:
+                return rows
+
+        # Ghi nhận version trước khi tải: tải chậm mà có lần ghi xen vào thì bản tải về có thể cũ hơn
+        with _snapshot_lock:
+            old = _snapshots.get(worksheet_name)
+            old_rows, old_version = (old["rows"], old["version"]) if old else (None, None)
+
+        df = _load_records_as_df(worksheet_name)
+        if df is None:
+            return None # Không cache khi lỗi, lần sau thử lại
+        rows = ChunkedFrame.from_frame(df, SNAPSHOT_CHUNK_ROWS)
+
+        # Dữ liệu tải lại giống hệt -> giữ version, các bảng dựng từ snapshot không phải dựng lại
+        unchanged = old_rows is not None and old_rows.frame().equals(df)
+        with _snapshot_lock:
+            current = _snapshots.get(worksheet_name)
+            if (current["version"] if current else None) != old_version:
+                # Snapshot đã được ghi (write-through) hoặc bị bỏ trong lúc tải -> không đè bản tải cũ lên
+                return rows if current is None else current["rows"]
+            version = old_version if unchanged else next(_snapshot_versions)
+            now = time.monotonic()
+            _snapshots[worksheet_name] = {"rows": rows, "loaded_at": now, "checked_at": now, "version": version}
+        _on_snapshot_loaded(worksheet_name, df)
+        return rows
+
+def _load_snapshot(worksheet_name, force_refresh=False):
+    """
+    Trả về DataFrame snapshot của tab (tải lại nếu hết hạn), hoặc None nếu tải lỗi.
+    DataFrame này dùng chung: chỉ đọc, không sửa trực tiếp.
+    """
+    rows = _load_snapshot_rows(worksheet_name, force_refresh=force_refresh)
+    return None if rows is None else rows.frame()
+
+def get_all_records_as_df(worksheet_name, force_refresh=False):
+    """Đọc toàn bộ dữ liệu từ tab (qua cache snapshot) và trả về bản sao DataFrame."""
+    df = _load_snapshot(worksheet_name, force_refresh=force_refresh)
+    return pd.DataFrame() if df is None else df.copy()
+
+def invalidate_snapshot(worksheet_name=None):
+    """Xóa snapshot của một tab (hoặc tất cả nếu không truyền tên)."""
+    with _snapshot_lock:
+        if worksheet_name is None:
+            _snapshots.clear()
+        else:
+            _snapshots.pop(worksheet_name, None)
+
+def _begin_snapshot_write(worksheet_name):
+    """
+    Bắt đầu ghi vào snapshot (gọi khi giữ _snapshot_write_lock): (entry snapshot, version, trạng thái
+    bảng gộp) để dựng bản mới ngoài _snapshot_lock; entry None nếu tab chưa có snapshot.
+    """
+    with _snapshot_lock:
+        snap = _snapshots.get(worksheet_name)
+        if snap is None:
+            return None, None, None
+        tables = {name: _snapshots[name]["rows"] for name in FACT_SOURCES if name in _snapshots}
+        return snap, snap["version"], {**_fact, "sources": _fact_source_versions(), "tables": tables}
+
+def _commit_snapshot_write(worksheet_name, snap, version, rows, fact_state, labels, action):
+    """
+    Thay bảng mới `rows` vào snapshot (rows None: bỏ snapshot, lần đọc sau tải lại) và vá bảng gộp theo
+    các dòng `labels` vừa đổi. Bảng gộp mới dựng ngoài _snapshot_lock; tải lại xen vào thì bỏ snapshot.
+    """
+    if rows is None:
+        invalidate_snapshot(worksheet_name)
+        return
+    new_version = next(_snapshot_versions)
+    fact_update = _fact_patch(fact_state, worksheet_name, version, new_version, rows, labels, action)
+    with _snapshot_lock:
+        if _snapshots.get(worksheet_name) is not snap or snap["version"] != version:
+            # Snapshot vừa được tải lại (có thể chưa có lần ghi này) -> bỏ, lần đọc sau tải lại
+            _snapshots.pop(worksheet_name, None)
+            return
+        snap["rows"], snap["version"] = rows, new_version
+        if fact_update is not None and _fact["df"] is fact_state["df"]:
+            _fact.update(fact_update)
+
+def _snapshot_append_rows(worksheet_name, rows, first_row_num=None):
+    """
+    Ghi thêm các dòng mới vào snapshot (write-through).
+    first_row_num: số dòng trên Sheet của dòng đầu tiên (nếu biết), để nhiều lần ghi
+    song song vẫn nằm đúng vị trí như trên Sheet.
+    """
+    with _snapshot_write_lock:
+        snap, version, fact_state = _begin_snapshot_write(worksheet_name)
+        if snap is None:
+            return
+        table = snap["rows"]
+        start = len(table) if first_row_num is None else first_row_num - 2
+        labels = list(range(start, start + len(rows)))
+        new_table = None
+        if (
+            not table.empty and all(len(row) == len(table.columns) for row in rows)
+            and not (table.positions(labels) >= 0).any()
+        ):
+            new_table = table.insert_sorted(pd.DataFrame(rows, columns=table.columns, index=labels))
+        # Không khớp số cột / vị trí dòng -> new_table None: bỏ snapshot, lần đọc sau tải lại
+        _commit_snapshot_write(worksheet_name, snap, version, new_table, fact_state, labels, "append")
+
+def _snapshot_update_rows(worksheet_name, id_column_name, row_changes):
+    """
+    Cập nhật các dòng trong snapshot (write-through).
+    row_changes = [(index DataFrame, id, {cột: giá trị}), ...]
+    """
+    with _snapshot_write_lock:
+        snap, version, fact_state = _begin_snapshot_write(worksheet_name)
+        if snap is None:
+            return
+        table = snap["rows"]
+        labels = [row_index for row_index, _, _ in row_changes]
+        positions = table.positions(labels)
+        new_table = None
+        if (positions >= 0).all() and id_column_name in table.columns:
+            current_ids = table.take(positions, columns=[id_column_name])[id_column_name].tolist()
+            if all(_normalize_id(current) == id_value for current, (_, id_value, _) in zip(current_ids, row_changes)):
+                # Bản mới chỉ chép các cột bị sửa ở các khúc chứa dòng sửa
+                changes = {}
+                for position, (_, _, values_by_col) in zip(positions, row_changes):
+                    for col_name, value in values_by_col.items():
+                        if col_name in table.columns:
+                            column = changes.setdefault(col_name, ([], []))
+                            column[0].append(position)
+                            column[1].append(value)
+                new_table = table.with_values(changes)
+        # Snapshot không khớp vị trí dòng trên Sheet -> new_table None: bỏ, lần đọc sau tải lại
+        _commit_snapshot_write(worksheet_name, snap, version, new_table, fact_state, labels, "update")
+
+def get_data_age():
+    """Số giây kể từ lần gần nhất biết chắc các snapshot khớp dữ liệu nguồn (lấy tab cũ nhất)."""
+    with _snapshot_lock:
+        checked = [snap["checked_at"] for snap in _snapshots.values()]
+    return time.monotonic() - min(checked) if checked else None
+
+class SnapshotRefresher:
+    """
+    Luồng nền làm mới snapshot: định kỳ hỏi storage có thay đổi không (change_token, rẻ),
+    có thì tải lại tab và thay snapshot; request không phải chờ đọc Google Sheets.
+    """
+
+    def __init__(self, worksheet_names, interval_seconds, max_age_seconds):
+        self.worksheet_names = list(worksheet_names)
+        self.interval_seconds = interval_seconds
+        self.max_age_seconds = max_age_seconds
+        self._tokens = {}  # {worksheet_name: change_token lúc tải snapshot hiện tại}
+        self._thread = None
 
-def get_all_records_as_df(worksheet_name):
-    """Đọc toàn bộ dữ liệu từ tab và chuyển sang DataFrame."""
-    ws = get_worksheet(worksheet_name)
-    if ws is None:
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def refresh_once(self):
+        """Làm mới một lượt; trả về danh sách tab đã tải lại."""
+        reloaded = []
+        version_before = _data_version()
+        for worksheet_name in self.worksheet_names:
+            try:
+                token = storage.change_token(worksheet_name)
+            except Exception as e:
+                print(f"Lỗi hỏi thay đổi của tab '{worksheet_name}': {e}")
+                token = None
+            with _snapshot_lock:
+                snap = _snapshots.get(worksheet_name)
+                age = time.monotonic() - snap["loaded_at"] if snap else None
+            max_age = SNAPSHOT_TTL_SECONDS if token is None else self.max_age_seconds
+            if age is None or age >= max_age or token != self._tokens.get(worksheet_name):
+                # Hỏi token trước khi tải: có sửa trong lúc tải thì lượt sau thấy token mới và tải lại
+                if _load_snapshot(worksheet_name, force_refresh=True) is not None:
+                    self._tokens[worksheet_name] = token
+                    reloaded.append(worksheet_name)
+            elif token is not None:
+                with _snapshot_lock:
+                    if _snapshots.get(worksheet_name) is snap:
+                        snap["checked_at"] = time.monotonic()
+        if set(reloaded) & set(FACT_SOURCES):
+            _get_fact() # Dựng sẵn bảng gộp nếu dữ liệu đổi
+            version = _data_version()
+            if version != version_before:
+                change_broadcaster.publish({"version": version, "action": "reload", "tables": reloaded})
+        return reloaded
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh_once()
+            except Exception as e:
+                print(f"Lỗi làm mới snapshot: {e}")
+            time.sleep(self.interval_seconds)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="snapshot-refresh", daemon=True)
+            self._thread.start()
+        return self
+
+snapshot_refresher = SnapshotRefresher(["pom", "dim_publisher"], SNAPSHOT_REFRESH_SECONDS, SNAPSHOT_MAX_AGE_SECONDS)
+
+class ChangeBroadcaster:
+    """
+    Phát sự kiện thay đổi dữ liệu tới các client đang nghe /api/events.
+    Mỗi client một hàng đợi riêng; client đọc chậm làm đầy hàng đợi thì các sự kiện đang chờ
+    được gộp thành một sự kiện 'reload' (client tải lại toàn bộ), không chặn luồng ghi.
+    """
+
+    def __init__(self, max_clients, queue_size):
+        self.max_clients = max_clients
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._queues = set()
+
+    def subscribe(self):
+        """Hàng đợi sự kiện cho một client mới; None nếu đã đủ số client."""
+        with self._lock:
+            if len(self._queues) >= self.max_clients:
+                return None
+            events = queue.Queue(self.queue_size)
+            self._queues.add(events)
+            return events
+
+    def unsubscribe(self, events):
+        with self._lock:
+            self._queues.discard(events)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._queues)
+        for events in subscribers:
+            try:
+                events.put_nowait(event)
+            except queue.Full:
+                try:
+                    while True:
+                        events.get_nowait()
+                except queue.Empty:
+                    pass
+                events.put_nowait({"version": event.get("version"), "action": "reload"})
+
+change_broadcaster = ChangeBroadcaster(SSE_MAX_CLIENTS, SSE_QUEUE_SIZE)
+
+def publish_change(worksheet_name, action, ids, fields):
+    """Báo cho các dashboard đang mở: tab `worksheet_name` vừa có dòng được tạo/sửa."""
+    change_broadcaster.publish({
+        "version": _data_version(),
+        "table": worksheet_name,
+        "action": action,
+        "ids": ids,
+        "fields": sorted(fields),
+    })
+
+# --- Bảng gộp cho dashboard (fact table) ---
+# pom gộp với dim_publisher, ép kiểu sẵn: po_amount float, po_created_at datetime,
+# loai_sp/ten_phap_nhan dạng category. Chỉ dựng lại khi snapshot nguồn đổi version
+# do tải lại; các lần ghi qua backend vá thẳng vào bảng (ChunkedFrame: chỉ chép các khúc chứa
+# dòng liên quan, dòng mới nối vào cuối), nên vị trí dòng không đổi khi sửa.
+# Index của bảng = index dòng trong snapshot pom (dòng ghi thêm nằm cuối bảng theo thứ tự ghi).
+# Kèm theo là các bảng dựng từ bảng gộp khi cần, vá cùng lúc với bảng gộp: R/F/M thô theo pháp nhân
+# (rfm) và cube theo (tháng × loai_sp × ID_phap_nhan) cho các pháp nhân có PO thay đổi, chỉ mục ngày
+# (dates) theo vị trí dòng, tên theo ID (publishers) khi có pháp nhân hoặc tên mới, vị trí dòng theo
+# pháp nhân (publisher_rows: để vá rfm/cube mà không quét cả bảng).
+# Nhật ký thay đổi (changes) ghi version lần đổi cuối của từng dòng (mảng theo vị trí dòng, vá bằng cách
+# ghi đè/ghi thêm) và các dòng đã xóa, để client chỉ tải lại các dòng đổi (/api/changes).
+FACT_SOURCES = ("pom", "dim_publisher")
+FACT_CATEGORY_COLUMNS = ("loai_sp", "ten_phap_nhan")
+FACT_DERIVED = ("rfm", "cube", "dates", "publishers", "publisher_rows")
+CUBE_KEYS = ['year_month', 'loai_sp', 'ID_phap_nhan']
+_fact = {"df": None, "versions": None, "changes": None, **dict.fromkeys(FACT_DERIVED)}  # Đọc/ghi khi giữ _snapshot_lock
+# Đổi mỗi lần chạy backend: version đếm lại từ đầu nên client phải biết để không dùng version cũ
+DATA_EPOCH = uuid.uuid4().hex[:12]
+_fact_build_lock = threading.Lock()
+
+def _fact_source_versions():
+    """Version hiện tại của các snapshot nguồn (gọi khi giữ _snapshot_lock)."""
+    return tuple(_snapshots[name]["version"] if name in _snapshots else None for name in FACT_SOURCES)
+
+def _build_fact_df(pom, dim):
+    """Gộp pom với dim_publisher và ép kiểu cho dashboard (không sửa DataFrame truyền vào)."""
+    if pom.empty:
         return pd.DataFrame()
-    records = ws.get_all_records()
-    df = pd.DataFrame(records)
-    if not df.empty:
-        df.columns = df.columns.str.strip()
+
+    # Dọn dẹp po_amount
+    if 'po_amount' in pom.columns:
+        amount = pom['po_amount'].astype(str).str.replace(",", "", regex=False)
+        pom = pom.assign(po_amount=pd.to_numeric(amount, errors='coerce').fillna(0))
+    else:
+        pom = pom.assign(po_amount=0.0)
+
+    # Gộp dữ liệu, giữ index dòng của pom
+    if not dim.empty and 'ID_phap_nhan' in pom.columns and 'ID_phap_nhan' in dim.columns:
+        pom = pom.assign(ID_phap_nhan=pd.to_numeric(pom['ID_phap_nhan'], errors='coerce'))
+        dim = dim.assign(ID_phap_nhan=pd.to_numeric(dim['ID_phap_nhan'], errors='coerce'))
+        df = pom.rename_axis('_row').reset_index().merge(dim, on='ID_phap_nhan', how='left')
+        df = df.set_index('_row').rename_axis(None)
+    else:
+        df = pom.copy()
+
+    # Chuẩn hóa ngày
+    if 'po_created_at' in df.columns:
+        df['po_created_at'] = pd.to_datetime(df['po_created_at'], errors='coerce')
+    for col in FACT_CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
     return df
 
+def _conform_fact_rows(fact, new_rows):
+    """
+    Đưa các dòng mới dựng về đúng cột/kiểu của bảng gộp `fact` (cột category: thêm danh mục mới vào
+    bảng nếu cần). Trả về (bảng gộp, dòng mới), hoặc None nếu không ép được mà không đổi giá trị.
+    """
+    if list(new_rows.columns) != list(fact.columns):
+        return None
+    dtypes = fact.dtypes
+    columns = {}
+    for col in new_rows.columns:
+        dtype, values = dtypes[col], new_rows[col]
+        if isinstance(dtype, pd.CategoricalDtype):
+            extra = values.astype(object).dropna().unique()
+            extra = pd.Index(extra).difference(dtype.categories)
+            if len(extra):
+                fact = fact.with_categories(col, extra)
+            columns[col] = pd.Categorical(values.astype(object), dtype=fact.dtypes[col])
+        elif values.dtype != dtype:
+            try:
+                converted = values.astype(dtype)
+            except (TypeError, ValueError):
+                return None
+            if not same_values(converted.to_numpy(dtype=object), values.to_numpy(dtype=object)).all():
+                return None
+            columns[col] = converted
+    return fact, new_rows.assign(**columns)
+
+def _build_rfm_aggregates(fact):
+    """
+    R/F/M thô theo pháp nhân (index = ID_phap_nhan), tính trên các PO có po_amount > 0:
+    last_po_at (ngày PO gần nhất), Frequency (số po_id khác nhau), Monetary (tổng po_amount).
+    """
+    if fact.empty or not {'ID_phap_nhan', 'po_id', 'po_amount', 'po_created_at'} <= set(fact.columns):
+        return pd.DataFrame()
+    df = fact.dropna(subset=['ID_phap_nhan'])
+    rfm = df[df['po_amount'] > 0].groupby('ID_phap_nhan').agg(
+        last_po_at=('po_created_at', 'max'),
+        Frequency=('po_id', 'nunique'),
+        Monetary=('po_amount', 'sum'),
+    )
+    if 'ten_phap_nhan' in df.columns:
+        # Tên lấy từ dòng đầu tiên của pháp nhân
+        names = df.drop_duplicates(subset=['ID_phap_nhan']).set_index('ID_phap_nhan')['ten_phap_nhan']
+        rfm['ten_phap_nhan'] = names.astype(object).reindex(rfm.index)
+    return rfm
+
+def _patch_rfm_aggregates(rfm, rows, ids):
+    """
+    Tính lại R/F/M của các pháp nhân `ids` từ `rows` (các dòng bảng gộp của họ) rồi thay vào bảng rfm
+    (bản mới): pháp nhân đã có thì ghi đè dòng của họ; chỉ khi có pháp nhân thêm/bớt mới ghép lại bảng.
+    """
+    new_rows = _build_rfm_aggregates(rows)
+    if new_rows.empty:
+        new_rows = rfm.iloc[:0]
+    if (
+        list(new_rows.columns) == list(rfm.columns)
+        and new_rows.index.isin(rfm.index).all() and rfm.index.intersection(ids).isin(new_rows.index).all()
+    ):
+        if new_rows.empty:
+            return rfm
+        rfm = rfm.copy()
+        rfm.loc[new_rows.index] = new_rows
+        return rfm
+    rfm = rfm.drop(index=ids, errors='ignore')
+    return rfm if new_rows.empty else pd.concat([rfm, new_rows]).sort_index()
+
+def _build_month_cube(fact):
+    """
+    Cube tổng hợp theo (tháng × loai_sp × ID_phap_nhan): tổng po_amount, số po_id, số dòng.
+    Tháng dạng 'YYYY-MM' ('NaT' nếu thiếu ngày), giống nhãn của biểu đồ tháng.
+    """
+    if fact.empty or not {'po_created_at', 'po_id', 'po_amount'} <= set(fact.columns):
+        return pd.DataFrame()
+    missing = pd.Series(float('nan'), index=fact.index)
+    rows = pd.DataFrame({
+        'year_month': fact['po_created_at'].dt.to_period('M').astype(str),
+        'loai_sp': fact['loai_sp'].astype(object) if 'loai_sp' in fact.columns else missing,
+        'ID_phap_nhan': fact['ID_phap_nhan'] if 'ID_phap_nhan' in fact.columns else missing,
+        'po_amount': fact['po_amount'],
+        'po_id': fact['po_id'],
+    })
+    return rows.groupby(CUBE_KEYS, dropna=False, sort=False).agg(
+        po_amount_sum=('po_amount', 'sum'),
+        po_id_count=('po_id', 'count'),
+        row_count=('po_amount', 'size'),
+    ).reset_index()
+
+CUBE_VALUES = ['po_amount_sum', 'po_id_count', 'row_count']
+
+class MonthCube:
+    """
+    Cube của bảng gộp (_build_month_cube) để vá từng ô: các ô nằm trong ChunkedFrame (vị trí ô không đổi,
+    ô mới nối vào cuối) kèm vị trí các ô của từng pháp nhân (by_publisher), nên vá chỉ tính lại ô của
+    các pháp nhân có PO đổi và chỉ chép các khúc chứa ô đổi. Ô không còn dòng nào giữ lại với row_count 0
+    (dùng lại nếu có dòng mới cùng ô); frame() bỏ các ô này.
+    """
+
+    def __init__(self, cells, by_publisher):
+        self.cells, self.by_publisher = cells, by_publisher
+        self._frame = None
+
+    @classmethod
+    def build(cls, fact):
+        """Dựng từ bảng gộp (DataFrame); ô của cùng pháp nhân nằm liền nhau (vá chỉ chép một hai khúc)."""
+        cells = _build_month_cube(fact)
+        if not cells.empty:
+            cells = cells.sort_values('ID_phap_nhan', kind='stable', ignore_index=True)
+        by_publisher = cells.groupby('ID_phap_nhan', sort=False).indices if not cells.empty else {}
+        return cls(ChunkedFrame.from_frame(cells, SNAPSHOT_CHUNK_ROWS), by_publisher)
+
+    def frame(self):
+        """Các ô cube (DataFrame, chỉ đọc) như _build_month_cube."""
+        if self._frame is None:
+            cells = self.cells.frame()
+            self._frame = cells[cells['row_count'] > 0] if not cells.empty else cells
+        return self._frame
+
+    def patched(self, rows, ids):
+        """
+        Cube mới sau khi PO của các pháp nhân `ids` đổi; rows: mọi dòng bảng gộp hiện tại của họ.
+        None nếu không vá được (cube rỗng, khác cột), để lần đọc sau dựng lại.
+        """
+        new_cells = _build_month_cube(rows)
+        columns = list(self.cells.columns)
+        if self.cells.empty or (not new_cells.empty and list(new_cells.columns) != columns):
+            return None
+        positions = _publisher_positions(self.by_publisher, ids)
+        old_cells = self.cells.take(positions, columns=CUBE_KEYS).assign(_position=positions)
+        merged = old_cells.merge(new_cells.reindex(columns=columns), on=CUBE_KEYS, how='outer')
+        dtypes = self.cells.dtypes
+        values = {col: merged[col].fillna(0).astype(dtypes[col]) for col in CUBE_VALUES}
+        known = merged['_position'].notna().to_numpy()
+        at = merged['_position'].to_numpy()[known].astype(np.intp)
+        cells = self.cells.with_values({col: (at, values[col].to_numpy()[known]) for col in CUBE_VALUES})
+        by_publisher = self.by_publisher
+        if not known.all():
+            added = merged.loc[~known, columns].assign(**{col: values[col][~known] for col in CUBE_VALUES})
+            added.index = pd.RangeIndex(len(cells), len(cells) + len(added))
+            by_publisher = _patch_publisher_rows(by_publisher, added.index, None, added['ID_phap_nhan'].tolist())
+            cells = cells.append(added.astype(dtypes.to_dict()))
+        return MonthCube(cells, by_publisher) if cells is not self.cells else self
+
+class DateIndex:
+    """
+    Chỉ mục ngày của bảng gộp: vị trí dòng xếp theo po_created_at (bỏ dòng không có ngày), để tìm
+    khoảng ngày bằng tìm kiếm nhị phân. Gồm phần chính và phần mới (các dòng ghi thêm/đổi ngày sau khi
+    dựng, ít), cả hai đã sắp xếp; dòng đổi ngày bị loại khỏi phần chính qua mask `alive` (theo vị trí dòng).
+    Vá thì tạo chỉ mục mới chỉ chép phần mới; phần mới quá DATE_INDEX_RECENT_MAX dòng thì gộp vào phần chính.
+    """
+
+    def __init__(self, dates, positions, recent_dates=None, recent_positions=None, alive=None):
+        self.dates, self.positions = dates, positions
+        self.recent_dates = dates[:0] if recent_dates is None else recent_dates
+        self.recent_positions = positions[:0] if recent_positions is None else recent_positions
+        self.alive = alive # None: mọi mục của phần chính còn dùng
+
+    @classmethod
+    def build(cls, dates):
+        """Dựng từ mảng ngày (datetime64) theo vị trí dòng."""
+        positions = np.flatnonzero(~np.isnat(dates))
+        positions = positions[np.argsort(dates[positions], kind='stable')]
+        return cls(dates[positions], positions)
+
+    def between(self, start=None, end=None, end_inclusive=True):
+        """Vị trí (chưa sắp xếp) các dòng có start <= ngày <= end (end_inclusive=False: < end); None = không chặn."""
+        parts = []
+        for dates, positions in ((self.dates, self.positions), (self.recent_dates, self.recent_positions)):
+            lo = _date_bound(dates, start, 'left') if start is not None else 0
+            hi = _date_bound(dates, end, 'right' if end_inclusive else 'left') if end is not None else len(dates)
+            parts.append(positions[lo:hi])
+        if self.alive is not None:
+            parts[0] = parts[0][self.alive[parts[0]]]
+        return np.concatenate(parts)
+
+    def patched(self, removed, positions, dates):
+        """
+        Chỉ mục mới sau khi các dòng `removed` bỏ mục cũ (đổi ngày) và các dòng `positions` có ngày
+        `dates` (dòng mới hoặc ngày mới); không sửa chỉ mục này.
+        """
+        recent_dates, recent_positions, alive = self.recent_dates, self.recent_positions, self.alive
+        removed = np.asarray(removed, dtype=np.intp)
+        if len(removed):
+            keep = ~np.isin(recent_positions, removed)
+            recent_dates, recent_positions = recent_dates[keep], recent_positions[keep]
+            size = len(alive) if alive is not None else int(self.positions.max(initial=-1)) + 1
+            in_main = removed[removed < size] # Dòng ghi thêm sau khi dựng không nằm trong phần chính
+            if len(in_main):
+                alive = np.ones(size, dtype=bool) if alive is None else alive.copy()
+                alive[in_main] = False
+        positions, dates = np.asarray(positions, dtype=np.intp), np.asarray(dates, dtype=self.dates.dtype)
+        valid = ~np.isnat(dates)
+        if valid.any():
+            recent_dates = np.concatenate([recent_dates, dates[valid]])
+            recent_positions = np.concatenate([recent_positions, positions[valid]])
+            order = np.lexsort((recent_positions, recent_dates))
+            recent_dates, recent_positions = recent_dates[order], recent_positions[order]
+        index = DateIndex(self.dates, self.positions, recent_dates, recent_positions, alive)
+        return index.compacted() if len(recent_positions) > DATE_INDEX_RECENT_MAX else index
+
+    def compacted(self):
+        """Chỉ mục chỉ còn phần chính: gộp phần mới vào (chép phần chính một lần)."""
+        dates, positions = self.dates, self.positions
+        if self.alive is not None:
+            keep = self.alive[positions]
+            dates, positions = dates[keep], positions[keep]
+        at = np.searchsorted(dates, self.recent_dates, side='right')
+        return DateIndex(np.insert(dates, at, self.recent_dates), np.insert(positions, at, self.recent_positions))
+
+def _build_date_index(fact):
+    """Chỉ mục ngày (DateIndex) của bảng gộp."""
+    if 'po_created_at' not in fact.columns:
+        return DateIndex.build(np.array([], dtype='datetime64[ns]'))
+    return DateIndex.build(fact['po_created_at'].to_numpy())
+
+def _build_publisher_names(fact):
+    """Tên pháp nhân theo ID_phap_nhan (category, như trong bảng gộp)."""
+    if not {'ID_phap_nhan', 'ten_phap_nhan'} <= set(fact.columns):
+        return pd.Series(dtype=object)
+    names = fact[['ID_phap_nhan', 'ten_phap_nhan']].dropna(subset=['ID_phap_nhan'])
+    return names.drop_duplicates('ID_phap_nhan').set_index('ID_phap_nhan')['ten_phap_nhan']
+
+def _patch_publisher_names(names, new_rows, dtype):
+    """
+    Tên theo ID sau khi các dòng `new_rows` của bảng gộp đổi (dtype: kiểu cột ten_phap_nhan của bảng).
+    Chỉ chép bảng tên khi có pháp nhân hoặc tên mới; chỉ mục tìm kiếm tên chỉ dựng lại khi có tên mới.
+    """
+    if not isinstance(names.dtype, pd.CategoricalDtype):
+        return None # Bảng tên dựng khi thiếu cột -> lần đọc sau dựng lại
+    if names.dtype != dtype:
+        names = names.cat.set_categories(dtype.categories) # Bảng gộp vừa thêm danh mục
+    rows = new_rows[['ID_phap_nhan', 'ten_phap_nhan']].dropna(subset=['ID_phap_nhan']).drop_duplicates('ID_phap_nhan')
+    current = names.reindex(rows['ID_phap_nhan'])
+    rows = rows[~same_values(current.to_numpy(dtype=object), rows['ten_phap_nhan'].to_numpy(dtype=object))]
+    if rows.empty:
+        return names
+    known = rows['ID_phap_nhan'].isin(names.index).to_numpy()
+    names = names.copy()
+    names.loc[rows['ID_phap_nhan'][known]] = rows['ten_phap_nhan'][known].to_numpy()
+    if not known.all():
+        added = pd.Series(rows['ten_phap_nhan'][~known].to_numpy(), index=rows['ID_phap_nhan'][~known], dtype=dtype)
+        names = pd.concat([names, added.rename_axis(names.index.name).rename(names.name)])
+    return names
+
+def _fact_retyped(old, new):
+    """Bảng gộp đổi cột hoặc kiểu cột (không tính danh mục của cột category): client phải nhận lại mọi dòng."""
+    if list(old.columns) != list(new.columns):
+        return True
+    for col in new.columns:
+        a, b = old[col].dtype, new[col].dtype
+        if a != b and not (isinstance(a, pd.CategoricalDtype) and isinstance(b, pd.CategoricalDtype)):
+            return True
+    return False
+
+def _diff_fact_rows(old, new):
+    """Nhãn các dòng của `new` mới thêm hoặc khác `old`, và nhãn các dòng chỉ có trong `old`."""
+    common = new.index.intersection(old.index)
+    if _fact_retyped(old, new):
+        changed = np.ones(len(common), dtype=bool)
+    else:
+        changed = np.zeros(len(common), dtype=bool)
+        for col in new.columns:
+            a, b = old[col].reindex(common), new[col].reindex(common)
+            if isinstance(a.dtype, pd.CategoricalDtype) or isinstance(b.dtype, pd.CategoricalDtype):
+                a, b = a.astype(object), b.astype(object)
+            changed |= ~same_values(a.to_numpy(), b.to_numpy())
+    return common[changed].union(new.index.difference(old.index)), old.index.difference(new.index)
+
+def _forget_deleted(deleted, floor, version, updated=(), removed=()):
+    """
+    Danh sách dòng đã xóa sau khi các nhãn `updated` có lại và `removed` bị xóa ở version `version`;
+    chỉ chép dict khi có nhãn đổi. Trả về (deleted, floor).
+    """
+    back = [label for label in updated if label in deleted]
+    if back or len(removed):
+        deleted = dict(deleted)
+        for label in back:
+            del deleted[label]
+        deleted.update(dict.fromkeys(removed, version))
+    if len(deleted) > CHANGE_LOG_MAX_DELETED:
+        # Quên các lần xóa cũ nhất; client đồng bộ trước đó phải tải lại toàn bộ
+        by_version = sorted(deleted.items(), key=lambda item: item[1])
+        dropped = by_version[:len(deleted) - CHANGE_LOG_MAX_DELETED]
+        floor = max(floor, dropped[-1][1])
+        deleted = dict(by_version[len(dropped):])
+    return deleted, floor
+
+def _new_fact_changes(row_versions, version, deleted=None, floor=None):
+    """Nhật ký thay đổi cho bảng gộp vừa dựng; row_versions: version theo vị trí dòng."""
+    return {
+        "row_versions": row_versions, "rows": len(row_versions),
+        "deleted": deleted or {}, "floor": version if floor is None else floor,
+    }
+
+def _track_fact_changes(changes, version, size, positions, updated):
+    """
+    Nhật ký thay đổi sau khi vá bảng gộp (vị trí dòng không đổi, dòng ghi thêm ở cuối; bảng mới có `size`
+    dòng) ở version `version`: dòng ở `positions` (nhãn `updated`) mang version này.
+    row_versions là mảng đệm dùng chung với nhật ký cũ, chỉ đọc `rows` phần tử đầu: dòng ghi thêm ghi vào
+    phần đệm sau `rows` (nhật ký cũ không đọc tới), dòng sửa ghi đè tại chỗ (người đang đọc nhật ký cũ
+    có thể thấy version mới của dòng đó, chỉ gửi thừa dòng đó). Hết chỗ thì chép sang mảng gấp đôi.
+    """
+    row_versions, rows = changes["row_versions"], changes["rows"]
+    if size > len(row_versions):
+        grown = np.empty(max(size, 2 * len(row_versions)), dtype=row_versions.dtype)
+        grown[:rows] = row_versions[:rows]
+        row_versions = grown
+    row_versions[rows:size] = version
+    row_versions[np.asarray(positions, dtype=np.intp)] = version
+    deleted, floor = _forget_deleted(changes["deleted"], changes["floor"], version, updated)
+    return {"row_versions": row_versions, "rows": size, "deleted": deleted, "floor": floor}
+
+def _rebase_fact_changes(changes, old_index, new_index, version, updated, removed):
+    """
+    Nhật ký thay đổi cho bảng gộp dựng lại (vị trí dòng có thể đổi): giữ version cũ theo nhãn dòng,
+    dòng `updated` (nhãn) mang version mới, dòng `removed` vào danh sách đã xóa.
+    """
+    old_versions = pd.Series(changes["row_versions"][:changes["rows"]], index=old_index)
+    row_versions = np.array(old_versions.reindex(new_index, fill_value=version), dtype=np.int64)
+    row_versions[new_index.get_indexer(updated)] = version
+    deleted, floor = _forget_deleted(changes["deleted"], changes["floor"], version, updated, removed)
+    return _new_fact_changes(row_versions, version, deleted, floor)
+
+def _build_publisher_rows(fact):
+    """Vị trí các dòng bảng gộp theo pháp nhân: {ID_phap_nhan: mảng vị trí tăng dần}, bỏ dòng không có ID."""
+    if fact.empty or 'ID_phap_nhan' not in fact.columns:
+        return {}
+    return fact.groupby('ID_phap_nhan', sort=False).indices
+
+def _patch_publisher_rows(index, positions, old_ids, new_ids):
+    """
+    Chỉ mục _build_publisher_rows mới (không sửa `index`) sau khi các dòng ở `positions` đổi pháp nhân
+    từ `old_ids` (None: dòng ghi thêm) sang `new_ids`; chỉ chép mảng vị trí của các pháp nhân đổi.
+    """
+    removed, added = {}, {}
+    for position, old, new in zip(positions, old_ids if old_ids is not None else [None] * len(positions), new_ids):
+        if old == new:
+            continue
+        if old is not None and not pd.isna(old):
+            removed.setdefault(old, []).append(position)
+        if not pd.isna(new):
+            added.setdefault(new, []).append(position)
+    if not removed and not added:
+        return index
+    index = dict(index)
+    for id_value, dropped in removed.items():
+        rows = np.setdiff1d(index.get(id_value, []), dropped).astype(np.intp)
+        if len(rows):
+            index[id_value] = rows
+        else:
+            index.pop(id_value, None)
+    for id_value, new in added.items():
+        index[id_value] = np.union1d(index.get(id_value, []), new).astype(np.intp)
+    return index
+
+def _publisher_positions(index, ids):
+    """Vị trí (tăng dần) các dòng bảng gộp của các pháp nhân `ids` theo chỉ mục _build_publisher_rows."""
+    parts = [index[id_value] for id_value in ids if id_value in index]
+    return np.sort(np.concatenate(parts)) if parts else np.array([], dtype=np.intp)
+
+def _fact_patch(state, worksheet_name, prev_version, new_version, table, labels, action):
+    """
+    Dựng bảng gộp mới sau khi snapshot `worksheet_name` đổi từ prev_version sang new_version ở các dòng
+    `labels` (action "append": dòng mới, "update": dòng sửa); gọi khi giữ _snapshot_write_lock, ngoài
+    _snapshot_lock. table: bảng snapshot mới; state: trạng thái bảng gộp lúc bắt đầu ghi.
+    Trả về dict để thay vào _fact, hoặc None nếu bảng gộp không khớp snapshot (để lần đọc sau dựng lại).
+    """
+    fact = state["df"]
+    if fact is None or fact.empty or worksheet_name not in FACT_SOURCES or state["versions"] != state["sources"]:
+        return None
+    versions = tuple(
+        new_version if name == worksheet_name else version for name, version in zip(FACT_SOURCES, state["sources"])
+    )
+    pom, dim = (table if name == worksheet_name else state["tables"].get(name) for name in FACT_SOURCES)
+    if pom is None or dim is None:
+        return None
+    labels = list(dict.fromkeys(labels))
+    publisher_rows = state["publisher_rows"]
+
+    if worksheet_name == "pom" and action == "append":
+        positions = None
+        pom_labels = labels
+    elif worksheet_name == "pom":
+        positions = fact.positions(labels)
+        pom_labels = labels
+    else:
+        if not set(dim.columns) <= set(fact.columns) or 'ID_phap_nhan' not in fact.columns:
+            return None # Bảng chưa gộp dim_publisher -> dựng lại
+        ids = pd.to_numeric(table.take(table.positions(labels))['ID_phap_nhan'], errors='coerce')
+        if ids.isna().any():
+            return None
+        if publisher_rows is None:
+            publisher_rows = _build_publisher_rows(fact.frame(columns=['ID_phap_nhan']))
+        positions = _publisher_positions(publisher_rows, ids.unique())
+        pom_labels = fact.take(positions, columns=[]).index
+    if positions is not None and (positions < 0).any():
+        return None
+    if not len(pom_labels):
+        return {"versions": versions}
+
+    # Dựng lại các dòng liên quan từ snapshot rồi thay vào bảng (bản mới, không sửa bảng cũ)
+    pom_positions = pom.positions(pom_labels)
+    if (pom_positions < 0).any():
+        return None
+    conformed = _conform_fact_rows(fact, _build_fact_df(pom.take(pom_positions), dim.frame()))
+    if conformed is None:
+        return None # Kiểu dữ liệu đổi -> dựng lại cả bảng
+    fact, new_rows = conformed
+    if positions is None:
+        old_rows = new_rows.iloc[:0]
+        positions = np.arange(len(fact), len(fact) + len(new_rows))
+        new_fact = fact.append(new_rows)
+    else:
+        old_rows = fact.take(positions)
+        new_fact = fact.with_rows(positions, new_rows)
+
+    update = {"df": new_fact, "versions": versions}
+    ids = None
+    if 'ID_phap_nhan' in new_rows.columns:
+        # Pháp nhân của các dòng trước và sau khi sửa
+        affected = pd.concat([old_rows['ID_phap_nhan'], new_rows['ID_phap_nhan']])
+        if not affected.isna().any():
+            ids = affected.unique().tolist()
+        if publisher_rows is not None:
+            old_ids = old_rows['ID_phap_nhan'].tolist() if len(old_rows) else None
+            publisher_rows = _patch_publisher_rows(publisher_rows, positions, old_ids, new_rows['ID_phap_nhan'].tolist())
+    else:
+        publisher_rows = None
+    # Không xác định được pháp nhân -> bỏ bảng tổng hợp, lần đọc sau dựng lại
+    rows_of_ids = None
+    for key, patch in (("rfm", _patch_rfm_aggregates), ("cube", MonthCube.patched)):
+        if state[key] is None or ids is None:
+            update[key] = None
+            continue
+        if rows_of_ids is None:
+            if publisher_rows is None:
+                publisher_rows = _build_publisher_rows(new_fact.frame(columns=['ID_phap_nhan']))
+            rows_of_ids = new_fact.take(_publisher_positions(publisher_rows, ids))
+        update[key] = patch(state[key], rows_of_ids, ids)
+    update["publisher_rows"] = publisher_rows
+
+    dates = state["dates"]
+    if dates is not None and 'po_created_at' in new_rows.columns:
+        new_dates = new_rows['po_created_at'].to_numpy()
+        if len(old_rows):
+            moved = ~same_values(old_rows['po_created_at'].to_numpy(), new_dates)
+            dates = dates.patched(positions[moved], positions[moved], new_dates[moved]) if moved.any() else dates
+        else:
+            dates = dates.patched((), positions, new_dates)
+    update["dates"] = dates
+    names = state["publishers"]
+    if names is not None:
+        names = (
+            _patch_publisher_names(names, new_rows, new_fact.dtypes['ten_phap_nhan'])
+            if {'ID_phap_nhan', 'ten_phap_nhan'} <= set(new_rows.columns) else None
+        )
+    update["publishers"] = names
+
+    changes = state["changes"]
+    if changes is not None:
+        changes = _track_fact_changes(changes, max(v or 0 for v in versions), len(new_fact), positions, new_rows.index)
+    update["changes"] = changes
+    return update
+
+def _data_version():
+    """Version dữ liệu dashboard theo các snapshot đang có (không tải lại)."""
+    with _snapshot_lock:
+        return max((version or 0) for version in _fact_source_versions())
+
+def get_data_version():
+    """
+    Version dữ liệu dashboard: tăng mỗi khi pom/dim_publisher thay đổi (ghi qua backend
+    hoặc tải lại thấy dữ liệu khác). Dùng để client biết khi nào cần tải/vẽ lại.
+    """
+    for name in FACT_SOURCES:
+        _load_snapshot_rows(name)
+    return _data_version()
+
+def _get_fact():
+    """
+    Bảng gộp pom + dim_publisher hiện tại (ChunkedFrame, dùng chung: chỉ đọc),
+    dựng lại nếu snapshot nguồn đã đổi mà chưa vá vào bảng.
+    """
+    for name in FACT_SOURCES:
+        _load_snapshot_rows(name)
+    with _snapshot_lock:
+        if _fact["df"] is not None and _fact["versions"] == _fact_source_versions():
+            return _fact["df"]
+
+    with _fact_build_lock:
+        with _snapshot_lock:
+            versions = _fact_source_versions()
+            if _fact["df"] is not None and _fact["versions"] == versions:
+                return _fact["df"]
+            pom, dim = (_snapshots[name]["rows"] if name in _snapshots else None for name in FACT_SOURCES)
+            old, changes = _fact["df"], _fact["changes"]
+        pom, dim = (pd.DataFrame() if rows is None else rows.frame() for rows in (pom, dim))
+        df = _build_fact_df(pom, dim)
+        fact = ChunkedFrame.from_frame(df, SNAPSHOT_CHUNK_ROWS)
+        # So với bảng cũ để biết dòng nào đổi (tải lại thấy dữ liệu khác)
+        version = max(v or 0 for v in versions)
+        if old is not None and changes is not None:
+            updated, removed = _diff_fact_rows(old.frame(), df)
+            changes = _rebase_fact_changes(changes, old.index, fact.index, version, updated, removed)
+        else:
+            changes = _new_fact_changes(np.full(len(fact), version, dtype=np.int64), version)
+        with _snapshot_lock:
+            # Có ghi/tải lại trong lúc dựng -> không lưu, lần đọc sau dựng lại
+            if _fact_source_versions() == versions and _fact["df"] is old:
+                _fact.update(df=fact, versions=versions, changes=changes, **dict.fromkeys(FACT_DERIVED))
+        return fact
+
+def get_fact_table():
+    """
+    Trả về bảng gộp pom + dim_publisher cho dashboard (DataFrame).
+    Bảng dùng chung giữa các request: chỉ đọc, muốn sửa thì tạo cột/bảng mới.
+    """
+    return _get_fact().frame()
+
+def _get_fact_derived(builders):
+    """
+    Lấy các bảng dựng từ bảng gộp ({key: hàm dựng nhận DataFrame}) kèm bảng gộp tương ứng (ChunkedFrame).
+    Chỉ dựng bảng còn thiếu; bảng gộp được dựng lại thì mọi bảng dựng lại theo.
+    """
+    fact = _get_fact()
+    derived = {}
+    with _snapshot_lock:
+        current = _fact["df"]
+        if current is not None and _fact["versions"] == _fact_source_versions():
+            fact = current
+            derived = {key: _fact[key] for key in builders if _fact[key] is not None}
+        else:
+            current = None # Bảng gộp chưa lưu được -> tính tạm, không lưu
+    missing = [key for key in builders if key not in derived]
+    for key in missing:
+        derived[key] = builders[key](fact.frame())
+    if missing:
+        with _snapshot_lock:
+            # Chỉ lưu nếu bảng gộp chưa bị vá/dựng lại trong lúc tính
+            if current is not None and _fact["df"] is current:
+                _fact.update((key, derived[key]) for key in missing)
+    return derived, fact
+
+def get_fact_changes(since=None):
+    """
+    Các dòng bảng gộp đổi sau version `since`.
+    Trả về (bảng gộp, vị trí các dòng thêm/sửa, nhãn các dòng đã xóa, version hiện tại); hai danh sách
+    là None nếu phải gửi lại toàn bộ (since thiếu, quá cũ hoặc mới hơn version hiện tại).
+    """
+    fact = _get_fact()
+    with _snapshot_lock:
+        changes = None
+        if _fact["df"] is not None and _fact["versions"] == _fact_source_versions():
+            fact, changes = _fact["df"], _fact["changes"]
+        version = max((v or 0) for v in _fact_source_versions())
+    if since is None or changes is None or not changes["floor"] <= since <= version:
+        return fact, None, None, version
+    updated = np.flatnonzero(changes["row_versions"][:changes["rows"]] > since)
+    removed = [label for label, v in changes["deleted"].items() if v > since]
+    return fact, updated, removed, version
+
+def get_fact_date_index(fact):
+    """
+    Chỉ mục ngày (_build_date_index) của đúng bảng gộp `fact`: dùng bản đã dựng nếu `fact` vẫn là
+    bảng gộp hiện tại, ngược lại (có lần ghi xen vào, bảng gộp đã đổi) thì dựng cho `fact`.
+    """
+    _get_fact_derived({"dates": _build_date_index}) # Dựng sẵn cho bảng gộp hiện tại nếu chưa có
+    with _snapshot_lock:
+        if _fact["df"] is fact and _fact["dates"] is not None:
+            return _fact["dates"]
+    return _build_date_index(fact.frame())
+
+def filter_fact(fact, date_index, start_date=None, end_date=None, loai_sp=None, ten_phap_nhan=None):
+    """
+    filter_dashboard_df trên bảng gộp (ChunkedFrame): khoảng ngày tìm qua chỉ mục ngày `date_index`
+    của đúng bảng đó rồi chỉ lấy các dòng trong khoảng; lọc chuỗi thì xét từng khúc.
+    """
+    if (start_date or end_date) and 'po_created_at' in fact.columns:
+        df = fact.take(np.sort(date_index.between(start_date or None, end_date or None)))
+        return filter_dashboard_df(df, loai_sp=loai_sp, ten_phap_nhan=ten_phap_nhan)
+    if loai_sp or ten_phap_nhan:
+        return fact.select(lambda chunk: filter_dashboard_df(chunk, loai_sp=loai_sp, ten_phap_nhan=ten_phap_nhan))
+    return fact.frame()
+
+def get_rfm_aggregates():
+    """Bảng R/F/M thô theo pháp nhân trên toàn bộ PO (chỉ đọc)."""
+    return _get_fact_derived({"rfm": _build_rfm_aggregates})[0]["rfm"]
+
+def summarize_months(start_date=None, end_date=None, loai_sp=None, ten_phap_nhan=None):
+    """
+    Tổng hợp cho biểu đồ tháng và biểu đồ loại SP theo bộ lọc dashboard (giống filter_dashboard_df),
+    lấy từ cube: tháng nằm trọn trong khoảng ngày dùng ô cube, tháng bị cắt dở tính từ các dòng
+    của bảng gộp; loai_sp/ten_phap_nhan đổi thành tập loai_sp/ID_phap_nhan rồi lọc ô bằng isin.
+    Trả về None nếu không dựng được cube (thiếu cột).
+    """
+    derived, fact = _get_fact_derived({
+        "cube": MonthCube.build, "dates": _build_date_index, "publishers": _build_publisher_names,
+    })
+    cube = derived["cube"].frame()
+    if cube.empty:
+        return None if not fact.empty else {"row_count": 0, "po_amount_total": 0, "monthly": [], "campaign": []}
+
+    cells = cube
+    if start_date or end_date:
+        start = pd.Timestamp(start_date) if start_date else None
+        end = pd.Timestamp(end_date) if end_date else None
+        # Xét trên các tháng khác nhau (ít) rồi mới lọc ô cube
+        months = cube['year_month'].drop_duplicates()
+        periods = pd.PeriodIndex(months[months != 'NaT'], freq='M')
+        full = periods.notna()
+        if start is not None:
+            full &= periods.start_time >= start
+        if end is not None:
+            full &= periods.end_time <= end
+        full_periods = periods[full]
+        cells = cube[cube['year_month'].isin(full_periods.astype(str))]
+
+        # Dòng trong khoảng ngày nhưng thuộc tháng bị cắt dở (các tháng trọn vẹn liền nhau)
+        dates = derived["dates"]
+        if len(full_periods):
+            partial = np.concatenate([
+                dates.between(start, full_periods.min().start_time, end_inclusive=False),
+                dates.between((full_periods.max() + 1).start_time, end),
+            ])
+        else:
+            partial = dates.between(start, end)
+        if len(partial):
+            cells = pd.concat([cells, _build_month_cube(fact.take(np.sort(partial)))], ignore_index=True)
+
+    if loai_sp and 'loai_sp' in fact.columns:
+        matched = _match_values(fact.dtypes['loai_sp'].categories, loai_sp, key='loai_sp')
+        mask = cells['loai_sp'].isin(matched)
+        if _matches_missing(loai_sp):
+            mask |= cells['loai_sp'].isna()
+        cells = cells[mask]
+    if ten_phap_nhan and 'ten_phap_nhan' in fact.columns:
+        names = derived["publishers"]
+        ids = names.index[_contains_mask(names, ten_phap_nhan, key='ten_phap_nhan')]
+        mask = cells['ID_phap_nhan'].isin(ids)
+        if _matches_missing(ten_phap_nhan):
+            mask |= cells['ID_phap_nhan'].isna() # PO không có ID -> không có tên
+        cells = cells[mask]
+
+    monthly = cells.groupby('year_month')[['po_amount_sum', 'po_id_count']].sum().sort_index()
+    campaign = cells.groupby('loai_sp')['po_amount_sum'].sum()
+    return {
+        "row_count": int(cells['row_count'].sum()),
+        "po_amount_total": cells['po_amount_sum'].sum().item(),
+        "monthly": monthly.reset_index().to_dict('records'),
+        "campaign": campaign.reset_index().to_dict('records'),
+    }
+
+# --- Chỉ mục ID -> số dòng trên Sheet ---
+# Dựng lại mỗi khi snapshot của tab được tải, cập nhật thêm khi ghi dòng mới,
+# nên update không phải tải cả tab rồi quét tìm dòng.
+_id_indexes = {}  # {(worksheet_name, id_column_name): {id: sheet_row_num}}
+_id_index_lock = threading.Lock()
+
+def _normalize_id(value):
+    """Chuẩn hóa ID để so sánh (123, '123', 123.0 -> 123)."""
+    num = pd.to_numeric(value, errors='coerce')
+    if pd.isna(num):
+        return None
+    return int(num) if float(num).is_integer() else float(num)
+
+def _build_id_index(df, id_column_name):
+    """GSheet row = DataFrame index + 2 (1 cho header, 1 cho index bắt đầu từ 0)."""
+    if df.empty or id_column_name not in df.columns:
+        return {}
+    index = {}
+    for row_index, value in zip(df.index.tolist(), df[id_column_name].tolist()):
+        key = _normalize_id(value)
+        if key is not None:
+            index.setdefault(key, row_index + 2) # Trùng ID thì giữ dòng đầu tiên như trước
+    return index
+
+def _rebuild_id_indexes(worksheet_name, df):
+    """Dựng lại các chỉ mục đã đăng ký của tab từ snapshot vừa tải."""
+    with _id_index_lock:
+        for (name, id_column_name) in list(_id_indexes):
+            if name == worksheet_name:
+                _id_indexes[(name, id_column_name)] = _build_id_index(df, id_column_name)
+
+def _index_append_rows(worksheet_name, first_row_num, rows):
+    """Thêm các dòng vừa ghi (bắt đầu từ first_row_num) vào chỉ mục ID."""
+    headers = [str(h).strip() for h in get_headers(worksheet_name)]
+    with _id_index_lock:
+        for (name, id_column_name), index in _id_indexes.items():
+            if name != worksheet_name:
+                continue
+            if first_row_num is None or id_column_name not in headers:
+                index.clear() # Không xác định được vị trí -> dựng lại ở lần tra sau
+                continue
+            pos = headers.index(id_column_name)
+            for offset, row in enumerate(rows):
+                key = _normalize_id(row[pos]) if pos < len(row) else None
+                if key is not None:
+                    index.setdefault(key, first_row_num + offset)
+
+def _get_id_index(worksheet_name, id_column_name, force_refresh=False):
+    """Lấy chỉ mục ID của tab, dựng từ snapshot nếu chưa có."""
+    key = (worksheet_name, id_column_name)
+    with _id_index_lock:
+        index = _id_indexes.get(key)
+    if index and not force_refresh:
+        return index
+    df = _load_snapshot(worksheet_name, force_refresh=force_refresh) # Chỉ đọc, không cần chép
+    index = _build_id_index(pd.DataFrame() if df is None else df, id_column_name)
+    with _id_index_lock:
+        _id_indexes[key] = index
+    return index
+
+def get_values_by_id(worksheet_name, id_column_name, column_name, id_values):
+    """
+    {id: giá trị cột column_name} của các dòng có ID trong id_values.
+    Tra qua chỉ mục ID trên snapshot (không chép cả bảng); ID chỉ mục không khớp thì tìm trên cột ID.
+    """
+    df = _load_snapshot(worksheet_name)
+    if df is None or df.empty or id_column_name not in df.columns or column_name not in df.columns:
+        return {}
+    index = _get_id_index(worksheet_name, id_column_name)
+    values, missing = {}, set()
+    for key in map(_normalize_id, id_values):
+        if key is None or key in values:
+            continue
+        row_num = index.get(key)
+        label = row_num - 2 if row_num is not None else None
+        if label in df.index and _normalize_id(df.at[label, id_column_name]) == key:
+            values[key] = df.at[label, column_name]
+        else:
+            missing.add(key)
+    if missing:
+        # Chỉ mục đang dựng lại hoặc lệch snapshot -> tìm thẳng, giữ dòng đầu tiên như chỉ mục
+        ids = pd.to_numeric(df[id_column_name], errors='coerce')
+        found = ids.isin(missing)
+        for id_value, value in zip(ids[found].tolist(), df.loc[found, column_name].tolist()):
+            values.setdefault(_normalize_id(id_value), value)
+    return values
+
+def get_publisher_client_codes(id_values):
+    """{ID_phap_nhan: client_code} của các pháp nhân có trong dim_publisher."""
+    return get_values_by_id("dim_publisher", "ID_phap_nhan", "client_code", id_values)
+
 def append_row_to_sheet(worksheet_name, row_data_list):
     """Ghi một dòng mới vào cuối tab."""
+    return append_rows_to_sheet(worksheet_name, [row_data_list])
+
+def append_rows_to_sheet(worksheet_name, rows):
+    """Ghi nhiều dòng mới vào cuối tab trong một lần gọi API."""
     try:
-        ws = get_worksheet(worksheet_name)
-        if ws:
-            ws.append_row(row_data_list, value_input_option='USER_ENTERED')
-            return True
-        return False
+        first_row_num = storage.append_rows(worksheet_name, rows)
+        _snapshot_append_rows(worksheet_name, rows, first_row_num)
+        _index_append_rows(worksheet_name, first_row_num, rows)
+        headers = [str(col).strip() for col in get_headers(worksheet_name)]
+        id_column_name = TABLE_ID_COLUMNS.get(worksheet_name, (None,))[0]
+        position = headers.index(id_column_name) if id_column_name in headers else None
+        ids = [_normalize_id(row[position]) for row in rows] if position is not None else []
+        publish_change(worksheet_name, "create", ids, headers)
+        return True
     except Exception as e:
         print(f"Lỗi khi ghi vào Sheet '{worksheet_name}': {e}")
         raise
 
+# --- Cấp phát ID & kiểm tra trùng mã ---
+# ID kế tiếp được tính một lần từ snapshot (max + 1) rồi chỉ tăng dần trong bộ nhớ;
+# các mã cần duy nhất (vd: ma_phap_nhan) được giữ trong một set.
+_next_ids = {}        # {(worksheet_name, id_column_name): ID kế tiếp}
+_unique_values = {}   # {(worksheet_name, column_name): set các giá trị đã dùng}
+_pending_unique = {}  # {(worksheet_name, column_name): set giá trị đã giữ chỗ, đang ghi}
+_alloc_lock = threading.Lock()
+
+def _max_id(df, id_column_name):
+    if df.empty or id_column_name not in df.columns:
+        return 0
+    max_id = pd.to_numeric(df[id_column_name], errors='coerce').max()
+    return 0 if pd.isna(max_id) else int(max_id)
+
+def _normalize_code(value):
+    """Chuẩn hóa mã để so sánh chính xác (tránh lỗi 123 vs '123')."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+    return str(value).strip()
+
+def _unique_set_from_df(df, column_name):
+    if df.empty or column_name not in df.columns:
+        return set()
+    return {code for code in map(_normalize_code, df[column_name].tolist()) if code}
+
+def _current_snapshot_df(worksheet_name, default):
+    """DataFrame snapshot hiện tại của tab (default nếu snapshot vừa bị bỏ)."""
+    with _snapshot_lock:
+        snap = _snapshots.get(worksheet_name)
+        rows = snap["rows"] if snap is not None else None
+    return rows.frame() if rows is not None else default
+
+def _seed_unique_values(key, df):
+    """
+    Dựng set mã duy nhất (gọi khi giữ _alloc_lock) từ snapshot HIỆN TẠI chứ không phải `df` đã đọc
+    trước khi lấy khóa: lần sửa mã xen vào (đã ghi vào snapshot) không bị set cũ đè mất.
+    """
+    worksheet_name, column_name = key
+    current = _current_snapshot_df(worksheet_name, df)
+    _unique_values[key] = _unique_set_from_df(current, column_name) | _pending_unique.get(key, set())
+
+def _on_snapshot_loaded(worksheet_name, df):
+    """Đồng bộ chỉ mục ID, bộ cấp ID và set mã duy nhất với snapshot vừa tải."""
+    _rebuild_id_indexes(worksheet_name, df)
+    with _alloc_lock:
+        for (name, id_column_name) in list(_next_ids):
+            if name == worksheet_name:
+                # Chỉ tăng, không giảm: có thể có ID vừa cấp nhưng chưa ghi xong
+                _next_ids[(name, id_column_name)] = max(
+                    _next_ids[(name, id_column_name)], _max_id(df, id_column_name) + 1
+                )
+        for key in list(_unique_values):
+            if key[0] == worksheet_name:
+                _seed_unique_values(key, df)
+
+def allocate_ids(worksheet_name, id_column_name, count=1):
+    """Cấp `count` ID liên tiếp, tăng dần và không dùng lại; trả về ID đầu tiên."""
+    key = (worksheet_name, id_column_name)
+    with _alloc_lock:
+        seeded = key in _next_ids
+    if not seeded:
+        seed = _max_id(get_all_records_as_df(worksheet_name), id_column_name) + 1
+        with _alloc_lock:
+            _next_ids[key] = max(_next_ids.get(key, 1), seed)
+    with _alloc_lock:
+        first_id = _next_ids[key]
+        _next_ids[key] += count
+    return first_id
+
+def reserve_unique_value(worksheet_name, column_name, value):
+    """Giữ chỗ một mã duy nhất; trả về False nếu mã đã tồn tại."""
+    key = (worksheet_name, column_name)
+    with _alloc_lock:
+        seeded = key in _unique_values
+    # Tải snapshot ngoài khóa (tải xong lại lấy _alloc_lock trong _on_snapshot_loaded)
+    df = None if seeded else _load_snapshot(worksheet_name)
+    code = _normalize_code(value)
+    with _alloc_lock:
+        if key not in _unique_values:
+            _seed_unique_values(key, pd.DataFrame() if df is None else df)
+        if code in _unique_values[key]:
+            return False
+        _unique_values[key].add(code)
+        _pending_unique.setdefault(key, set()).add(code)
+        return True
+
+def finish_unique_value(worksheet_name, column_name, value, committed):
+    """Kết thúc giữ chỗ: giữ mã nếu đã ghi thành công, trả lại nếu ghi lỗi."""
+    key = (worksheet_name, column_name)
+    code = _normalize_code(value)
+    with _alloc_lock:
+        _pending_unique.get(key, set()).discard(code)
+        if not committed:
+            _unique_values.get(key, set()).discard(code)
+
+def replace_unique_value(worksheet_name, column_name, old_value, new_value):
+    """Sau khi sửa mã của một dòng: bỏ mã cũ và thêm mã mới vào set mã duy nhất (nếu set đã dựng)."""
+    key = (worksheet_name, column_name)
+    old_code, new_code = _normalize_code(old_value), _normalize_code(new_value)
+    with _alloc_lock:
+        codes = _unique_values.get(key)
+        if codes is None:
+            return # Chưa dựng: lần kiểm tra đầu dựng từ snapshot (đã có mã mới)
+        if old_code != new_code:
+            codes.discard(old_code)
+        if new_code:
+            codes.add(new_code)
+
 # --- [HÀM HỖ TRỢ MỚI] ---
 def update_sheet_row_by_id(worksheet_name, id_column_name, id_value, new_data_dict):
     """
     Cập nhật một dòng trong sheet dựa vào ID.
-    LƯU Ý: Rất quan trọng là new_data_dict PHẢI giữ đúng thứ tự cột như trên GSheet.
+    Chỉ ghi các cột có trong new_data_dict (một lần gọi API); số dòng lấy từ chỉ mục ID.
     """
-    ws = get_worksheet(worksheet_name)
-    if not ws:
-        raise Exception(f"Không tìm thấy worksheet: {worksheet_name}")
+    missing = update_sheet_rows_by_id(worksheet_name, id_column_name, [(id_value, new_data_dict)])
+    if missing:
+        raise Exception(f"Không tìm thấy ID {missing[0]} trong cột {id_column_name}")
+    return True
 
-    df = get_all_records_as_df(worksheet_name) # Dùng hàm cũ
-    if df.empty:
-        raise Exception(f"Không có dữ liệu trong {worksheet_name}")
-        
-    # Đảm bảo kiểu dữ liệu ID khớp để so sánh
-    df[id_column_name] = pd.to_numeric(df[id_column_name], errors='coerce')
-    id_value = pd.to_numeric(id_value, errors='coerce')
+def update_sheet_rows_by_id(worksheet_name, id_column_name, updates):
+    """
+    Cập nhật nhiều dòng theo ID: updates = [(id_value, new_data_dict), ...].
+    Tất cả các ô thay đổi được gửi trong MỘT lần batch_update.
+    Trả về danh sách ID không tìm thấy (các dòng đó bị bỏ qua).
+    """
+    keys = [_normalize_id(id_value) for id_value, _ in updates]
 
-    # Tìm index của dòng trong DataFrame
-    try:
-        row_index = df.index[df[id_column_name] == id_value].tolist()[0]
-    except IndexError:
-        raise Exception(f"Không tìm thấy ID {id_value} trong cột {id_column_name}")
-
-    # GSheet row = DataFrame index + 2 (1 for header, 1 for 0-based index)
-    sheet_row_num = row_index + 2
-    
-    # Lấy header từ sheet (để đảm bảo đúng thứ tự)
-    headers = ws.row_values(1)
-    
-    # Lấy dữ liệu dòng CŨ từ DataFrame (để fill những cột không được update)
-    # Phải convert về dict để .get() hoạt động
-    old_row_data = df.iloc[row_index].to_dict()
-    
-    # Tạo list giá trị mới theo đúng thứ tự header
-    new_row_values = []
-    for col_name in headers:
-        col_name_stripped = col_name.strip()
-        if col_name_stripped in new_data_dict:
-            # Lấy giá trị mới nếu có
-            new_row_values.append(new_data_dict[col_name_stripped])
-        else:
-            # Giữ giá trị cũ nếu không được cung cấp
-            new_row_values.append(old_row_data.get(col_name_stripped, "")) # Dùng "" làm default
-    
-    # Cập nhật GSheet
-    cell_range = f'A{sheet_row_num}:{gspread.utils.rowcol_to_a1(sheet_row_num, len(headers))}'
-    ws.update(cell_range, [new_row_values], value_input_option='USER_ENTERED')
-    return True
+    # Tra số dòng cho tất cả ID trên cùng một chỉ mục; thiếu ID thì tải lại tab một lần
+    index = _get_id_index(worksheet_name, id_column_name)
+    if any(key not in index for key in keys):
+        index = _get_id_index(worksheet_name, id_column_name, force_refresh=True)
+    missing = [key for key in keys if key not in index]
+
+    # Lấy header (đã cache khi tải dữ liệu) để biết vị trí từng cột
+    headers = get_headers(worksheet_name)
+
+    cells = [] # [(số dòng, số cột, giá trị)]
+    row_changes = [] # [(số dòng, id, {cột: giá trị})] để ghi vào snapshot
+    for key, (_, new_data_dict) in zip(keys, updates):
+        if key not in index:
+            continue
+        sheet_row_num = index[key]
+        changes = {}
+        for col_idx, col_name in enumerate(headers, start=1):
+            col_name_stripped = str(col_name).strip()
+            if col_name_stripped in new_data_dict:
+                value = new_data_dict[col_name_stripped]
+                changes[col_name_stripped] = value
+                cells.append((sheet_row_num, col_idx, value))
+        row_changes.append((sheet_row_num, key, changes))
+
+    if cells:
+        # Cập nhật storage: các ô thay đổi gửi chung trong một request
+        storage.update_cells(worksheet_name, cells)
+        _snapshot_update_rows(
+            worksheet_name, id_column_name,
+            [(sheet_row_num - 2, key, changes) for sheet_row_num, key, changes in row_changes]
+        )
+        publish_change(
+            worksheet_name, "update",
+            [key for _, key, _ in row_changes],
+            set().union(*(changes for _, _, changes in row_changes)),
+        )
+    return missing
 # --- [HẾT HÀM MỚI] ---
 
+# --- Tạo dòng mới (dùng chung cho API tạo đơn lẻ và tạo hàng loạt) ---
+
+def build_publisher_row(data, new_id):
+    """Dòng dim_publisher: ID_phap_nhan, ma_phap_nhan, ten_phap_nhan, loai_phap_nhan, client_code"""
+    return [
+        new_id,
+        data.get('ma_phap_nhan'),
+        data.get('ten_phap_nhan'),
+        data.get('loai_phap_nhan'),
+        data.get('client_code')
+    ]
+
+def build_po_row(data, new_po_id, id_phap_nhan, client_code, now):
+    """Dòng pom: ID_phap_nhan, po_id, po_code, po_amount, po_available_amount, po_created_at, po_status, loai_sp, type_po"""
+    created_at_str = now.strftime("%Y-%m-%d %H:%M:%S") # Format cho Google Sheets
+    # po_code (theo yêu cầu: client_code + _001_ + yymmdd)
+    new_po_code = f"{client_code}_001_{now.strftime('%y%m%d')}"
+    return [
+        id_phap_nhan,
+        new_po_id,
+        new_po_code,
+        float(data.get('po_amount', 0)),
+        float(data.get('po_available_amount', 0)), # Giả định po_available_amount = po_amount khi mới tạo
+        created_at_str,
+        data.get('po_status'),
+        data.get('loai_sp'),
+        data.get('type_po')
+    ]
+
+def clean_publisher_changes(data):
+    """Bỏ các cột không được sửa khỏi dữ liệu cập nhật pháp nhân."""
+    data = dict(data)
+    # ID_phap_nhan không được sửa
+    data.pop('ID_phap_nhan', None)
+    return data
+
+def clean_po_changes(data):
+    """Bỏ các cột không được sửa và ép kiểu dữ liệu cập nhật PO."""
+    data = dict(data)
+    # po_id và ID_phap_nhan không được sửa
+    data.pop('po_id', None)
+    data.pop('ID_phap_nhan', None)
+
+    # Cột pom: ID_phap_nhan, po_id, po_code, po_amount, po_available_amount, po_created_at, po_status, loai_sp, type_po
+    # Cần ép kiểu
+    if 'po_amount' in data:
+        data['po_amount'] = float(data.get('po_amount', 0))
+    if 'po_available_amount' in data:
+        data['po_available_amount'] = float(data.get('po_available_amount', 0))
+    return data
+
+def read_bulk_records():
+    """Đọc danh sách bản ghi từ body JSON (mảng) hoặc file CSV upload (field 'file')."""
+    if 'file' in request.files:
+        df = pd.read_csv(request.files['file'], dtype=str, keep_default_na=False, encoding='utf-8-sig')
+        df.columns = df.columns.str.strip()
+        return df.to_dict('records')
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('rows')
+    if not isinstance(data, list):
+        raise ValueError("Dữ liệu phải là mảng JSON hoặc file CSV (field 'file').")
+    return data
+
+def filter_dashboard_df(df, start_date=None, end_date=None, loai_sp=None, ten_phap_nhan=None):
+    """
+    Lọc dữ liệu dashboard (giống bộ lọc trên trang Dashboard):
+    khoảng ngày theo po_created_at, loai_sp/ten_phap_nhan chứa chuỗi (không phân biệt hoa thường, không dấu).
+    Bảng gộp thì lọc qua filter_fact (tìm khoảng ngày trên chỉ mục ngày).
+    """
+    if (start_date or end_date) and 'po_created_at' in df.columns:
+        if start_date:
+            df = df[df['po_created_at'] >= start_date]
+        if end_date:
+            df = df[df['po_created_at'] <= end_date]
+    if loai_sp and 'loai_sp' in df.columns:
+        df = df[_contains_mask(df['loai_sp'], loai_sp, key='loai_sp')]
+    if ten_phap_nhan and 'ten_phap_nhan' in df.columns:
+        df = df[_contains_mask(df['ten_phap_nhan'], ten_phap_nhan, key='ten_phap_nhan')]
+    return df
+
+def _date_bound(sorted_dates, value, side):
+    """Vị trí chèn `value` vào mảng ngày đã sắp xếp (side='left': ngày >= value bắt đầu từ đây)."""
+    return int(np.searchsorted(sorted_dates, pd.Timestamp(value).to_datetime64(), side=side))
+
+# --- Tìm kiếm chuỗi cho bộ lọc ---
+# loai_sp/ten_phap_nhan có ít giá trị khác nhau: chỉ tìm trên các giá trị đó (qua chỉ mục n-gram,
+# đã bỏ dấu và chữ thường) rồi lọc dòng bằng isin, không so chuỗi trên từng dòng.
+NGRAM_SIZE = 3
+_search_indexes = {}  # {key: (pd.Index các giá trị, SubstringIndex)}
+_search_index_lock = threading.Lock()
+
+def fold_text(text):
+    """Chữ thường, bỏ dấu tiếng Việt ('Ngân hàng Đông Á' -> 'ngan hang dong a')."""
+    text = unicodedata.normalize('NFD', str(text).lower().replace('đ', 'd'))
+    return ''.join(ch for ch in text if not unicodedata.combining(ch))
+
+class SubstringIndex:
+    """Chỉ mục n-gram trên một danh sách giá trị để tìm các giá trị chứa một chuỗi con."""
+
+    def __init__(self, values):
+        self.values = list(values)
+        self._folded = [fold_text(value) for value in self.values]
+        self._grams = defaultdict(set)
+        for pos, text in enumerate(self._folded):
+            for i in range(len(text) - NGRAM_SIZE + 1):
+                self._grams[text[i:i + NGRAM_SIZE]].add(pos)
+
+    def search(self, text):
+        """Các giá trị chứa `text` (so trên dạng bỏ dấu, chữ thường)."""
+        query = fold_text(text)
+        if len(query) < NGRAM_SIZE:
+            candidates = range(len(self.values))
+        else:
+            grams = {query[i:i + NGRAM_SIZE] for i in range(len(query) - NGRAM_SIZE + 1)}
+            candidates = sorted(set.intersection(*(self._grams.get(gram, set()) for gram in grams)))
+        return [self.values[pos] for pos in candidates if query in self._folded[pos]]
+
+def _match_values(values, text, key=None):
+    """Các giá trị trong `values` (pd.Index các giá trị khác nhau) chứa `text`; key: giữ lại chỉ mục."""
+    if key is None:
+        return SubstringIndex(values).search(text)
+    with _search_index_lock:
+        cached = _search_indexes.get(key)
+    if cached is None or not (cached[0] is values or cached[0].equals(values)):
+        cached = (values, SubstringIndex(values))
+        with _search_index_lock:
+            _search_indexes[key] = cached
+    return cached[1].search(text)
+
+def _matches_missing(text):
+    """Ô trống được coi như chuỗi 'nan' (giống astype(str))."""
+    return fold_text(text) in 'nan'
+
+def _contains_mask(series, text, key=None):
+    """Mask các dòng có giá trị chứa `text`: tìm trên các giá trị khác nhau rồi lọc bằng isin."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        values = series.cat.categories
+    else:
+        values = pd.Index(series.dropna().unique())
+        key = None # Danh sách giá trị tính lại mỗi lần, không giữ chỉ mục
+    mask = series.isin(_match_values(values, text, key))
+    if _matches_missing(text):
+        mask |= series.isna()
+    return mask
+
+# --- Bảng phân trang cho trang quản lý ---
+# Trang quản lý chỉ tải từng trang dữ liệu: lọc theo cột, sắp xếp theo cột ID rồi cắt trang
+# ngay trên snapshot. Cột số và cột chữ đã bỏ dấu được giữ lại theo version snapshot.
+TABLE_ID_COLUMNS = {"pom": ("po_id", "ID_phap_nhan"), "dim_publisher": ("ID_phap_nhan",)}
+TABLE_PAGE_MAX = 500 # Số dòng tối đa mỗi trang
+TABLE_QUERY_ARGS = ("limit", "offset", "sort", "order")
+_table_columns = {}  # {(worksheet_name, kiểu, cột): (version snapshot, mảng giá trị)}
+_table_columns_lock = threading.Lock()
+
+def _get_snapshot_with_version(worksheet_name):
+    """Snapshot của tab kèm version của đúng DataFrame đó (None nếu vừa bị thay)."""
+    rows = _load_snapshot_rows(worksheet_name)
+    with _snapshot_lock:
+        snap = _snapshots.get(worksheet_name)
+        version = snap["version"] if snap is not None and snap["rows"] is rows else None
+    return (None if rows is None else rows.frame()), version
+
+def _table_column(worksheet_name, version, kind, column, build):
+    """Mảng dựng từ một cột của snapshot (cột số / chữ bỏ dấu), dùng lại khi version chưa đổi."""
+    key = (worksheet_name, kind, column)
+    with _table_columns_lock:
+        cached = _table_columns.get(key)
+    if version is not None and cached is not None and cached[0] == version:
+        return cached[1]
+    values = build()
+    if version is not None:
+        with _table_columns_lock:
+            _table_columns[key] = (version, values)
+    return values
+
+def query_table(worksheet_name, filters=None, sort=None, descending=True, offset=0, limit=None):
+    """
+    Lọc, sắp xếp và cắt trang dữ liệu của tab (từ snapshot).
+    filters = {cột: chuỗi}: cột ID so khớp đúng giá trị, cột khác tìm chuỗi con không phân biệt dấu.
+    sort: cột ID để sắp xếp (theo số, ô trống xếp cuối); None = giữ thứ tự trên Sheet.
+    Trả về (DataFrame của trang, tổng số dòng sau khi lọc).
+    """
+    df, version = _get_snapshot_with_version(worksheet_name)
+    if df is None or df.empty:
+        return pd.DataFrame(), 0
+    id_columns = TABLE_ID_COLUMNS.get(worksheet_name, ())
+
+    def numbers(column):
+        return _table_column(
+            worksheet_name, version, "number", column,
+            lambda: pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float)
+        )
+
+    mask = np.ones(len(df), dtype=bool)
+    for column, text in (filters or {}).items():
+        if column not in df.columns or not str(text).strip():
+            continue
+        if column in id_columns:
+            mask &= numbers(column) == pd.to_numeric(str(text).strip(), errors='coerce')
+        else:
+            folded = _table_column(
+                worksheet_name, version, "folded", column,
+                lambda: pd.Series([fold_text(value) for value in df[column].astype(str)], dtype=object)
+            )
+            mask &= folded.str.contains(fold_text(text).strip(), regex=False).to_numpy()
+
+    if sort in id_columns and sort in df.columns:
+        values = numbers(sort)
+        order = _table_column(
+            worksheet_name, version, "desc" if descending else "asc", sort,
+            lambda: np.argsort(-values if descending else values, kind='stable') # NaN luôn ở cuối
+        )
+        positions = order[mask[order]]
+    else:
+        positions = np.flatnonzero(mask)
+
+    stop = None if limit is None else offset + limit
+    return df.iloc[positions[offset:stop]], len(positions)
+
+def _table_response(worksheet_name, format_page=None):
+    """
+    Trả dữ liệu tab cho trang quản lý theo query: lọc theo tên cột (?po_code=...),
+    sort=<cột ID>&order=asc|desc, limit/offset để phân trang.
+    Có limit -> {"items", "total", "offset", "limit"}; không có -> mảng toàn bộ dòng như trước.
+    """
+    args = request.args
+    try:
+        offset = max(int(args.get('offset', 0)), 0)
+        limit = int(args['limit']) if 'limit' in args else None
+    except ValueError:
+        return jsonify({"error": "offset/limit phải là số nguyên"}), 400
+    if limit is not None:
+        limit = min(max(limit, 1), TABLE_PAGE_MAX)
+    sort = args.get('sort')
+    if sort and sort not in TABLE_ID_COLUMNS.get(worksheet_name, ()):
+        return jsonify({"error": f"Không hỗ trợ sắp xếp theo cột '{sort}'"}), 400
+    filters = {key: value for key, value in args.items() if key not in TABLE_QUERY_ARGS}
+
+    page, total = query_table(
+        worksheet_name, filters, sort=sort, descending=args.get('order', 'desc') != 'asc',
+        offset=offset, limit=limit
+    )
+    if format_page is not None and not page.empty:
+        page = format_page(page)
+    records = page.to_dict('records')
+    if limit is None:
+        return jsonify(records)
+    return jsonify({"items": records, "total": total, "offset": offset, "limit": limit})
+
 # --- API Endpoints ---
 
+@app.after_request
+def add_data_age_header(response):
+    """Gắn tuổi dữ liệu (giây, X-Data-Age) vào phản hồi của các API đọc."""
+    if request.method == 'GET' and request.path.startswith('/api/'):
+        age = get_data_age()
+        if age is not None:
+            response.headers['X-Data-Age'] = f"{age:.1f}"
+    return response
+
+def _iso_datetimes(series):
+    """Ngày dạng 'YYYY-MM-DDTHH:MM:SS' (như dt.strftime nhưng nhanh hơn nhiều), thiếu ngày -> NaN."""
+    values = series.to_numpy(dtype='datetime64[s]')
+    text = np.datetime_as_string(values, unit='s').astype(object)
+    text[np.isnat(values)] = np.nan
+    return pd.Series(text, index=series.index)
+
+def _frame_response(df, data_version):
+    """
+    Trả DataFrame cho client: mặc định là mảng các dòng; nếu header Accept có COLUMNAR_MIMETYPE
+    thì trả dạng cột {"columns": [tên cột], "data": [[giá trị cột 1], ...]}.
+    Nén gzip nếu client chấp nhận và dữ liệu đủ lớn.
+    """
+    if COLUMNAR_MIMETYPE in request.accept_mimetypes.values():
+        payload = {"columns": df.columns.tolist(), "data": [df[col].tolist() for col in df.columns]}
+        mimetype = COLUMNAR_MIMETYPE
+    else:
+        payload, mimetype = df.to_dict('records'), "application/json"
+    return _json_response(payload, mimetype, {"X-Data-Version": str(data_version), "Vary": "Accept, Accept-Encoding"})
+
+def _json_response(payload, mimetype="application/json", headers=None):
+    """Phản hồi JSON, nén gzip nếu client chấp nhận và dữ liệu đủ lớn."""
+    body = app.json.dumps(payload).encode('utf-8')
+    headers = dict(headers or {})
+    if len(body) >= GZIP_MIN_BYTES and 'gzip' in request.accept_encodings:
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, mimetype=mimetype, headers=headers)
+
 @app.route('/api/all-data', methods=['GET'])
 def api_get_all_data():
-    """API: Lấy dữ liệu gộp cho dashboard."""
+    """
+    API: Lấy dữ liệu gộp cho dashboard.
+    Query (tùy chọn): start_date, end_date, loai_sp, ten_phap_nhan để lọc;
+    fields=cot1,cot2 để chỉ lấy các cột cần dùng.
+    """
     try:
-        pom = get_all_records_as_df("pom")
-        dim = get_all_records_as_df("dim_publisher")
+        # Lấy version trước dữ liệu: có ghi xen giữa thì client chỉ tải lại thừa một lần
+        data_version = get_data_version()
+        # Bảng gộp dựng sẵn (đã ép kiểu) kèm chỉ mục ngày, chỉ dựng lại khi dữ liệu nguồn thay đổi
+        derived, fact = _get_fact_derived({"dates": _build_date_index})
+        if fact.empty:
+            return _frame_response(pd.DataFrame(), data_version) # Trả về mảng rỗng nếu không có dữ liệu
 
-        if pom.empty:
-            return jsonify([]) # Trả về mảng rỗng nếu không có dữ liệu
+        # Lọc và chọn cột ngay tại backend để giảm dữ liệu trả về
+        df = filter_fact(
+            fact, derived["dates"],
+            start_date=request.args.get('start_date'),
+            end_date=request.args.get('end_date'),
+            loai_sp=request.args.get('loai_sp'),
+            ten_phap_nhan=request.args.get('ten_phap_nhan'),
+        )
+        fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+        if fields:
+            df = df[[f for f in fields if f in df.columns]]
 
-        # Dọn dẹp po_amount
-        if 'po_amount' in pom.columns:
-            pom['po_amount'] = (
-                pom['po_amount'].astype(str).str.replace(",", "", regex=False)
-            )
-            pom['po_amount'] = pd.to_numeric(pom['po_amount'], errors='coerce').fillna(0)
-        else:
-            pom['po_amount'] = 0.0
+        if 'po_created_at' in df.columns:
+            df = df.assign(po_created_at=_iso_datetimes(df['po_created_at'])) # Không sửa bảng dùng chung
+
+        return _frame_response(df, data_version)
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/data-version', methods=['GET'])
+def api_get_data_version():
+    """API: Version hiện tại của dữ liệu dashboard (rẻ, không trả dữ liệu)."""
+    try:
+        return jsonify({"version": get_data_version()})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        # Gộp dữ liệu
-        if not dim.empty and 'ID_phap_nhan' in pom.columns and 'ID_phap_nhan' in dim.columns:
-            pom['ID_phap_nhan'] = pd.to_numeric(pom['ID_phap_nhan'], errors='coerce')
-            dim['ID_phap_nhan'] = pd.to_numeric(dim['ID_phap_nhan'], errors='coerce')
-            df = pom.merge(dim, on='ID_phap_nhan', how='left')
+@app.route('/api/changes', methods=['GET'])
+def api_get_changes():
+    """
+    API: Các dòng dữ liệu dashboard thêm/sửa/xóa sau một version, để client chỉ đồng bộ phần đổi.
+    Query: since, epoch (lấy từ lần gọi trước; thiếu hoặc không khớp -> gửi toàn bộ, reset=true),
+    start_date, end_date, loai_sp, ten_phap_nhan, fields như /api/all-data.
+    Trả về {"version", "epoch", "reset", "deleted", "labels", "columns", "data"}: labels là nhãn các dòng
+    (đủ cột, khớp bộ lọc) trong data; deleted là nhãn các dòng đã xóa hoặc không còn khớp bộ lọc.
+    """
+    try:
+        since = request.args.get('since', type=int)
+        if request.args.get('epoch') != DATA_EPOCH:
+            since = None
+        filters = {key: request.args.get(key) for key in ('start_date', 'end_date', 'loai_sp', 'ten_phap_nhan')}
+        fact, updated, removed, version = get_fact_changes(since)
+        reset = updated is None
+        if reset:
+            # Chỉ mục ngày phải dựng trên chính `fact` (vị trí dòng), không phải bảng gộp mới hơn
+            df = filter_fact(fact, get_fact_date_index(fact), **filters) if not fact.empty else pd.DataFrame()
+            deleted = []
         else:
-            df = pom.copy()
+            changed = fact.take(updated)
+            df = filter_dashboard_df(changed, **filters)
+            # Dòng đổi mà không còn khớp bộ lọc: client bỏ khỏi bản sao
+            deleted = sorted(removed) + changed.index.difference(df.index).tolist()
 
-        # Chuẩn hóa ngày
+        fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+        if fields:
+            df = df[[f for f in fields if f in df.columns]]
         if 'po_created_at' in df.columns:
-             df['po_created_at'] = pd.to_datetime(df['po_created_at'], errors='coerce').dt.strftime('%Y-%m-%dT%H:%M:%S')
+            df = df.assign(po_created_at=_iso_datetimes(df['po_created_at']))
+        return _json_response({
+            "version": version,
+            "epoch": DATA_EPOCH,
+            "reset": reset,
+            "deleted": deleted,
+            "labels": df.index.tolist(),
+            "columns": df.columns.tolist(),
+            "data": [df[col].tolist() for col in df.columns],
+        }, headers={"X-Data-Version": str(version)})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        return jsonify(df.to_dict('records'))
-        
+def _sse_message(event):
+    """Một sự kiện text/event-stream; id = version dữ liệu để kết nối lại gửi kèm Last-Event-ID."""
+    return f"id: {event.get('version')}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+@app.route('/api/events', methods=['GET'])
+def api_events():
+    """
+    API (Server-Sent Events): mỗi lần tạo/sửa PO hoặc pháp nhân gửi một sự kiện
+    {"version", "table", "action": "create"|"update", "ids", "fields"}; tải lại từ nguồn thấy
+    dữ liệu khác thì gửi {"version", "action": "reload"}.
+    Sự kiện đầu tiên là {"version", "action": "connected"}; kết nối lại với Last-Event-ID khác
+    version hiện tại (đã lỡ sự kiện) thì sự kiện đầu tiên là 'reload'.
+    """
+    events = change_broadcaster.subscribe()
+    if events is None:
+        return jsonify({"error": "Quá nhiều kết nối nhận sự kiện, thử lại sau."}), 503
+    last_version = request.headers.get('Last-Event-ID', type=int)
+    version = get_data_version()
+
+    def stream():
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            missed = last_version is not None and last_version != version
+            yield _sse_message({"version": version, "action": "reload" if missed else "connected"})
+            while True:
+                try:
+                    event = events.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": ping\n\n" # Giữ kết nối; client đã đóng thì lần ghi này báo lỗi
+                    continue
+                yield _sse_message(event)
+        finally:
+            change_broadcaster.unsubscribe(events)
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no", # Proxy (nginx) không gom sự kiện lại
+    })
+
+@app.route('/api/rfm-aggregates', methods=['GET'])
+def api_get_rfm_aggregates():
+    """
+    API: R/F/M thô theo pháp nhân trên toàn bộ PO (last_po_at, Frequency, Monetary).
+    Query (tùy chọn): ten_phap_nhan để lọc. Không hỗ trợ lọc theo ngày/loại SP.
+    """
+    try:
+        data_version = get_data_version()
+        rfm = get_rfm_aggregates()
+        ten_phap_nhan = request.args.get('ten_phap_nhan')
+        if ten_phap_nhan and 'ten_phap_nhan' in rfm.columns:
+            rfm = rfm[_contains_mask(rfm['ten_phap_nhan'], ten_phap_nhan)]
+
+        df = rfm.reset_index()
+        if 'last_po_at' in df.columns:
+            df['last_po_at'] = _iso_datetimes(df['last_po_at'])
+        return _frame_response(df, data_version)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/month-summary', methods=['GET'])
+def api_get_month_summary():
+    """
+    API: Tổng hợp theo tháng và theo loại SP (từ cube) cho biểu đồ dashboard.
+    Query (tùy chọn): start_date, end_date, loai_sp, ten_phap_nhan (như /api/all-data).
+    """
+    try:
+        data_version = get_data_version()
+        summary = summarize_months(
+            start_date=request.args.get('start_date'),
+            end_date=request.args.get('end_date'),
+            loai_sp=request.args.get('loai_sp'),
+            ten_phap_nhan=request.args.get('ten_phap_nhan'),
+        )
+        if summary is None:
+            return jsonify({"error": "Thiếu cột để tổng hợp theo tháng"}), 404
+        return jsonify(summary), 200, {"X-Data-Version": str(data_version)}
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/publishers', methods=['GET'])
 def api_get_publishers():
-    """API: Lấy danh sách pháp nhân cho dropdown (PO form) VÀ bảng quản lý."""
+    """
+    API: Lấy danh sách pháp nhân cho dropdown (PO form) VÀ bảng quản lý.
+    Query (tùy chọn): lọc theo cột, sort/order, limit/offset (xem _table_response).
+    """
     try:
-        df = get_all_records_as_df("dim_publisher")
-        if df.empty:
-            return jsonify([])
-        
-        # Chỉ trả về các cột cần thiết (cho form)
-        # Bảng quản lý cần tất cả, nên chúng ta sẽ trả về tất cả
-        # cols = ['ID_phap_nhan', 'ten_phap_nhan', 'client_code']
-        # df = df[cols]
-        return jsonify(df.to_dict('records'))
+        return _table_response("dim_publisher")
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 # --- [API MỚI] ---
 @app.route('/api/pos', methods=['GET'])
 def api_get_pos():
-    """API: Lấy danh sách PO (chỉ bảng pom) cho trang quản lý."""
-    try:
-        df = get_all_records_as_df("pom")
-        if df.empty:
-            return jsonify([])
-        
-        # Chuẩn hóa ngày
-        if 'po_created_at' in df.columns:
+    """
+    API: Lấy danh sách PO (chỉ bảng pom) cho trang quản lý.
+    Query (tùy chọn): lọc theo cột, sort/order, limit/offset (xem _table_response).
+    """
+    def format_page(page):
+        if 'po_created_at' in page.columns:
             # Trả về format ISO để JS có thể parse
-             df['po_created_at'] = pd.to_datetime(df['po_created_at'], errors='coerce').dt.strftime('%Y-%m-%dT%H:%M:%S')
+            page = page.assign(po_created_at=_iso_datetimes(pd.to_datetime(page['po_created_at'], errors='coerce')))
+        return page
 
-        return jsonify(df.to_dict('records'))
+    try:
+        return _table_response("pom", format_page)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 # --- [HẾT API MỚI] ---
@@ -193,162 +1895,288 @@ def api_get_pos():
 @app.route('/api/create-publisher', methods=['POST'])
 def api_create_publisher():
     """API: Tạo pháp nhân mới."""
-    with data_lock: # Khóa để đảm bảo an toàn khi tính ID
+    try:
+        data = request.json
+        new_ma_phap_nhan = data.get('ma_phap_nhan')
+
+        reserved = False
+        committed = False
         try:
-            data = request.json
-            df = get_all_records_as_df("dim_publisher")
-            
-            # --- [PHẦN THÊM MỚI] KIỂM TRA TÍNH DUY NHẤT ---
-            new_ma_phap_nhan = data.get('ma_phap_nhan')
-            
-            # Chỉ kiểm tra nếu người dùng có nhập mã pháp nhân (không rỗng)
-            if new_ma_phap_nhan and (not df.empty):
-                # Chuyển đổi cột 'ma_phap_nhan' trong DataFrame sang kiểu string
-                # để so sánh chính xác (tránh lỗi 123 vs '123')
-                existing_codes = df['ma_phap_nhan'].astype(str)
-                
-                # Kiểm tra xem mã mới (dưới dạng string) đã tồn tại chưa
-                if existing_codes.str.fullmatch(str(new_ma_phap_nhan)).any():
+            with table_locks["dim_publisher"]: # Chỉ khóa lúc kiểm tra mã và cấp ID
+                # --- KIỂM TRA TÍNH DUY NHẤT ---
+                # Chỉ kiểm tra nếu người dùng có nhập mã pháp nhân (không rỗng)
+                if new_ma_phap_nhan and not reserve_unique_value("dim_publisher", "ma_phap_nhan", new_ma_phap_nhan):
                     # Nếu TỒN TẠI, trả về lỗi ngay lập tức
                     return jsonify({
                         "success": False, 
                         "message": f"Lỗi: Mã pháp nhân '{new_ma_phap_nhan}' đã tồn tại. Vui lòng kiểm tra lại."
                     }), 400 # 400 Bad Request
-            # --- [HẾT PHẦN THÊM MỚI] ---
-            
-            # Tính ID mới (giữ nguyên logic cũ)
-            if df.empty or 'ID_phap_nhan' not in df.columns:
-                new_id = 1
-            else:
-                new_id = pd.to_numeric(df['ID_phap_nhan'], errors='coerce').max() + 1
-            
-            # Cột: ID_phap_nhan, ma_phap_nhan, ten_phap_nhan, loai_phap_nhan, client_code
-            new_row = [
-                int(new_id),
-                new_ma_phap_nhan, # Sử dụng biến đã lấy ở trên
-                data.get('ten_phap_nhan'),
-                data.get('loai_phap_nhan'),
-                data.get('client_code')
-            ]
-            
+                reserved = bool(new_ma_phap_nhan)
+
+                new_id = allocate_ids("dim_publisher", "ID_phap_nhan")
+
+            new_row = build_publisher_row(data, new_id)
             append_row_to_sheet("dim_publisher", new_row)
-            return jsonify({"success": True, "message": f"Tạo pháp nhân '{data.get('ten_phap_nhan')}' thành công!", "new_id": new_id})
-            
-        except Exception as e:
-            return jsonify({"success": False, "message": str(e)}), 500
+            committed = True
+        finally:
+            # Cấp ID hoặc ghi lỗi -> trả lại mã đã giữ chỗ
+            if reserved:
+                finish_unique_value("dim_publisher", "ma_phap_nhan", new_ma_phap_nhan, committed)
+        return jsonify({"success": True, "message": f"Tạo pháp nhân '{data.get('ten_phap_nhan')}' thành công!", "new_id": new_id})
+
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
 
 # --- [API MỚI] ---
 @app.route('/api/publisher/<int:id_phap_nhan>', methods=['PUT'])
 def api_update_publisher(id_phap_nhan):
     """API: Cập nhật pháp nhân."""
-    with data_lock:
-        try:
-            data = request.json
-            # ID_phap_nhan không được sửa
-            if 'ID_phap_nhan' in data:
-                del data['ID_phap_nhan']
-            
-            update_sheet_row_by_id(
-                "dim_publisher", 
-                "ID_phap_nhan", 
-                id_phap_nhan, 
-                data 
-            )
-            return jsonify({"success": True, "message": f"Cập nhật pháp nhân ID {id_phap_nhan} thành công."})
-        except Exception as e:
-            return jsonify({"success": False, "message": str(e)}), 500
+    try:
+        data = clean_publisher_changes(request.json)
+        # Mã cũ để trả lại cho set mã duy nhất sau khi sửa
+        old_codes = get_values_by_id("dim_publisher", "ID_phap_nhan", "ma_phap_nhan", [id_phap_nhan]) \
+            if 'ma_phap_nhan' in data else {}
+
+        update_sheet_row_by_id(
+            "dim_publisher", 
+            "ID_phap_nhan", 
+            id_phap_nhan, 
+            data 
+        )
+        if 'ma_phap_nhan' in data:
+            replace_unique_value("dim_publisher", "ma_phap_nhan", old_codes.get(id_phap_nhan), data['ma_phap_nhan'])
+        return jsonify({"success": True, "message": f"Cập nhật pháp nhân ID {id_phap_nhan} thành công."})
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
 # --- [HẾT API MỚI] ---
 
 @app.route('/api/create-po', methods=['POST'])
 def api_create_po():
     """API: Tạo PO mới."""
-    with data_lock: # Khóa để đảm bảo an toàn
-        try:
-            data = request.json
-            
-            pom_df = get_all_records_as_df("pom")
-            dim_df = get_all_records_as_df("dim_publisher")
-            
-            if dim_df.empty:
-                return jsonify({"success": False, "message": "Lỗi: Không có dữ liệu pháp nhân."}), 400
-
-            # 1. Tính po_id
-            if pom_df.empty or 'po_id' not in pom_df.columns:
-                new_po_id = 1
-            else:
-                new_po_id = pd.to_numeric(pom_df['po_id'], errors='coerce').max() + 1
-            
-            # 2. Lấy client_code
-            id_phap_nhan = int(data.get('id_phap_nhan'))
-            dim_df['ID_phap_nhan'] = pd.to_numeric(dim_df['ID_phap_nhan'], errors='coerce')
-            publisher = dim_df[dim_df['ID_phap_nhan'] == id_phap_nhan]
-            
-            if publisher.empty:
-                return jsonify({"success": False, "message": f"Lỗi: Không tìm thấy pháp nhân với ID {id_phap_nhan}"}), 400
-            client_code = publisher.iloc[0]['client_code']
-            
-            # 3. Tính po_created_at
-            now = datetime.now()
-            created_at_str = now.strftime("%Y-%m-%d %H:%M:%S") # Format cho Google Sheets
-            
-            # 4. Tính po_code (theo yêu cầu: client_code + _001_ + yymmdd)
-            date_code_str = now.strftime("%y%m%d")
-            new_po_code = f"{client_code}_001_{date_code_str}"
-            
-            # 5. Chuẩn bị dòng mới
-            # Cột: ID_phap_nhan, po_id, po_code, po_amount, po_available_amount, po_created_at, po_status, loai_sp, type_po
-            new_row = [
-                id_phap_nhan,
-                int(new_po_id),
-                new_po_code,
-                float(data.get('po_amount', 0)),
-                float(data.get('po_available_amount', 0)), # Giả định po_available_amount = po_amount khi mới tạo
-                created_at_str,
-                data.get('po_status'),
-                data.get('loai_sp'),
-                data.get('type_po')
-            ]
-            
-            append_row_to_sheet("pom", new_row)
-            return jsonify({"success": True, "message": "Tạo PO thành công!", "new_po_id": new_po_id, "new_po_code": new_po_code})
-
-        except Exception as e:
-            return jsonify({"success": False, "message": str(e)}), 500
+    try:
+        data = request.json
+
+        dim_df = _load_snapshot("dim_publisher") # Chỉ đọc, không chép bảng
+
+        if dim_df is None or dim_df.empty:
+            return jsonify({"success": False, "message": "Lỗi: Không có dữ liệu pháp nhân."}), 400
+
+        # 1. Lấy client_code (tra qua chỉ mục ID)
+        id_phap_nhan = int(data.get('id_phap_nhan'))
+        client_codes = get_publisher_client_codes([id_phap_nhan])
+
+        if id_phap_nhan not in client_codes:
+            return jsonify({"success": False, "message": f"Lỗi: Không tìm thấy pháp nhân với ID {id_phap_nhan}"}), 400
+        client_code = client_codes[id_phap_nhan]
+
+        # 2. Chuẩn bị dòng mới (po_created_at = bây giờ, po_code theo client_code)
+        new_row = build_po_row(data, None, id_phap_nhan, client_code, datetime.now())
+        new_po_code = new_row[2]
+
+        # 3. Cấp po_id
+        new_po_id = allocate_ids("pom", "po_id")
+        new_row[1] = new_po_id
+
+        append_row_to_sheet("pom", new_row)
+        return jsonify({"success": True, "message": "Tạo PO thành công!", "new_po_id": new_po_id, "new_po_code": new_po_code})
+
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+@app.route('/api/bulk-create-publisher', methods=['POST'])
+def api_bulk_create_publisher():
+    """API: Tạo nhiều pháp nhân một lần (mảng JSON hoặc file CSV), ghi bằng một lần append_rows."""
+    try:
+        records = read_bulk_records()
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Lỗi đọc dữ liệu: {e}"}), 400
+
+    errors = []
+    reserved_codes = []
+    committed = False
+    try:
+        valid = [] # [(số thứ tự dòng, data)]
+        with table_locks["dim_publisher"]:
+            for row_num, data in enumerate(records, start=1):
+                if not isinstance(data, dict):
+                    errors.append({"row": row_num, "message": "Dòng không hợp lệ."})
+                    continue
+                code = data.get('ma_phap_nhan')
+                if code and not reserve_unique_value("dim_publisher", "ma_phap_nhan", code):
+                    errors.append({"row": row_num, "message": f"Mã pháp nhân '{code}' đã tồn tại."})
+                    continue
+                if code:
+                    reserved_codes.append(code)
+                valid.append((row_num, data))
+            first_id = allocate_ids("dim_publisher", "ID_phap_nhan", len(valid)) if valid else None
+
+        if not valid:
+            return jsonify({"success": False, "message": "Không có dòng hợp lệ.", "created": [], "errors": errors}), 400
+
+        rows = [build_publisher_row(data, first_id + i) for i, (_, data) in enumerate(valid)]
+        append_rows_to_sheet("dim_publisher", rows)
+        committed = True
+
+        created = [{"row": row_num, "new_id": first_id + i} for i, (row_num, _) in enumerate(valid)]
+        return jsonify({
+            "success": not errors,
+            "message": f"Đã tạo {len(created)} pháp nhân, {len(errors)} dòng lỗi.",
+            "created": created,
+            "errors": errors
+        })
+
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e), "created": [], "errors": errors}), 500
+    finally:
+        # Cấp ID hoặc ghi lỗi -> trả lại các mã đã giữ chỗ
+        for code in reserved_codes:
+            finish_unique_value("dim_publisher", "ma_phap_nhan", code, committed)
+
+@app.route('/api/bulk-create-po', methods=['POST'])
+def api_bulk_create_po():
+    """API: Tạo nhiều PO một lần (mảng JSON hoặc file CSV), ghi bằng một lần append_rows."""
+    try:
+        records = read_bulk_records()
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Lỗi đọc dữ liệu: {e}"}), 400
+
+    errors = []
+    try:
+        # Tra client_code cho mọi pháp nhân trong file một lần (qua chỉ mục ID)
+        client_codes = get_publisher_client_codes(
+            data.get('id_phap_nhan', data.get('ID_phap_nhan')) for data in records if isinstance(data, dict)
+        )
+
+        now = datetime.now()
+        valid = [] # [(số thứ tự dòng, dòng mới chưa có po_id)]
+        for row_num, data in enumerate(records, start=1):
+            try:
+                if not isinstance(data, dict):
+                    raise ValueError("Dòng không hợp lệ.")
+                id_phap_nhan = _normalize_id(data.get('id_phap_nhan', data.get('ID_phap_nhan')))
+                if id_phap_nhan not in client_codes:
+                    raise ValueError(f"Không tìm thấy pháp nhân với ID {id_phap_nhan}")
+                valid.append((row_num, build_po_row(data, None, id_phap_nhan, client_codes[id_phap_nhan], now)))
+            except (TypeError, ValueError) as e:
+                errors.append({"row": row_num, "message": str(e)})
+
+        if not valid:
+            return jsonify({"success": False, "message": "Không có dòng hợp lệ.", "created": [], "errors": errors}), 400
+
+        # Cấp po_id theo khối
+        first_id = allocate_ids("pom", "po_id", len(valid))
+        for i, (_, row) in enumerate(valid):
+            row[1] = first_id + i
+
+        append_rows_to_sheet("pom", [row for _, row in valid])
+
+        created = [
+            {"row": row_num, "new_po_id": row[1], "new_po_code": row[2]}
+            for row_num, row in valid
+        ]
+        return jsonify({
+            "success": not errors,
+            "message": f"Đã tạo {len(created)} PO, {len(errors)} dòng lỗi.",
+            "created": created,
+            "errors": errors
+        })
+
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e), "created": [], "errors": errors}), 500
 
 # --- [API MỚI] ---
 @app.route('/api/po/<int:po_id>', methods=['PUT'])
 def api_update_po(po_id):
     """API: Cập nhật PO."""
-    with data_lock:
-        try:
-            data = request.json
-            # po_id không được sửa
-            if 'po_id' in data:
-                del data['po_id']
-
-            if 'ID_phap_nhan' in data:
-                del data['ID_phap_nhan']
-                        
-            # Cột pom: ID_phap_nhan, po_id, po_code, po_amount, po_available_amount, po_created_at, po_status, loai_sp, type_po
-            # Cần ép kiểu
-            if 'po_amount' in data:
-                data['po_amount'] = float(data.get('po_amount', 0))
-            if 'po_available_amount' in data:
-                data['po_available_amount'] = float(data.get('po_available_amount', 0))
-            if 'ID_phap_nhan' in data:
-                data['ID_phap_nhan'] = int(data.get('ID_phap_nhan'))
-
-            update_sheet_row_by_id(
-                "pom", 
-                "po_id", 
-                po_id, 
-                data
-            )
-            return jsonify({"success": True, "message": f"Cập nhật PO ID {po_id} thành công."})
-        except Exception as e:
-            return jsonify({"success": False, "message": str(e)}), 500
+    try:
+        data = clean_po_changes(request.json)
+
+        update_sheet_row_by_id(
+            "pom", 
+            "po_id", 
+            po_id, 
+            data
+        )
+        return jsonify({"success": True, "message": f"Cập nhật PO ID {po_id} thành công."})
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
 # --- [HẾT API MỚI] ---
 
+@app.route('/api/bulk-update-publisher', methods=['PUT'])
+def api_bulk_update_publisher():
+    """API: Cập nhật nhiều pháp nhân một lần: [{"id": ..., "changes": {...}}, ...]."""
+    return _bulk_update("dim_publisher", "ID_phap_nhan", clean_publisher_changes)
+
+@app.route('/api/bulk-update-po', methods=['PUT'])
+def api_bulk_update_po():
+    """API: Cập nhật nhiều PO một lần: [{"id": ..., "changes": {...}}, ...]."""
+    return _bulk_update("pom", "po_id", clean_po_changes)
+
+def _bulk_update(worksheet_name, id_column_name, clean_changes):
+    """Kiểm tra từng dòng, rồi ghi tất cả thay đổi bằng một lần batch_update."""
+    try:
+        records = read_bulk_records()
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Lỗi đọc dữ liệu: {e}"}), 400
+
+    errors = []
+    try:
+        updates = [] # [(số thứ tự dòng, id, changes)]
+        for row_num, item in enumerate(records, start=1):
+            try:
+                if not isinstance(item, dict) or not isinstance(item.get('changes'), dict):
+                    raise ValueError("Dòng không hợp lệ (cần 'id' và 'changes').")
+                item_id = _normalize_id(item.get('id'))
+                if item_id is None:
+                    raise ValueError(f"ID không hợp lệ: {item.get('id')}")
+                updates.append((row_num, item_id, clean_changes(item['changes'])))
+            except (TypeError, ValueError) as e:
+                errors.append({"row": row_num, "message": str(e)})
+
+        if not updates:
+            return jsonify({"success": False, "message": "Không có dòng hợp lệ.", "updated": [], "errors": errors}), 400
+
+        renamed = worksheet_name == "dim_publisher" and any('ma_phap_nhan' in changes for _, _, changes in updates)
+        # Mã cũ để trả lại cho set mã duy nhất sau khi sửa
+        codes = get_values_by_id(worksheet_name, id_column_name, "ma_phap_nhan", [item_id for _, item_id, _ in updates]) \
+            if renamed else {}
+
+        missing = set(update_sheet_rows_by_id(
+            worksheet_name,
+            id_column_name,
+            [(item_id, changes) for _, item_id, changes in updates]
+        ))
+        updated = []
+        for row_num, item_id, _ in updates:
+            if item_id in missing:
+                errors.append({"row": row_num, "message": f"Không tìm thấy ID {item_id} trong cột {id_column_name}"})
+            else:
+                updated.append(item_id)
+
+        if renamed:
+            for _, item_id, changes in updates:
+                if item_id not in missing and 'ma_phap_nhan' in changes:
+                    # Cùng ID sửa nhiều lần trong một lô: mã cũ của lần sau là mã mới của lần trước
+                    replace_unique_value("dim_publisher", "ma_phap_nhan", codes.get(item_id), changes['ma_phap_nhan'])
+                    codes[item_id] = changes['ma_phap_nhan']
+
+        return jsonify({
+            "success": not errors,
+            "message": f"Đã cập nhật {len(updated)} dòng, {len(errors)} dòng lỗi.",
+            "updated": updated,
+            "errors": sorted(errors, key=lambda err: err["row"])
+        })
+
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e), "updated": [], "errors": errors}), 500
+
 if __name__ == '__main__':
-    # Chạy backend trên port 5000
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    if APP_ENV == "production":
+        from waitress import serve
+        serve(create_app(), host=BACKEND_HOST, port=BACKEND_PORT, threads=BACKEND_THREADS)
+    else:
+        # Reloader của chế độ debug chạy file này 2 lần; chỉ tiến trình con (phục vụ request) chạy job nền
+        if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+            start_background_jobs()
+        # Chạy backend trên port 5000
+        app.run(debug=True, host=BACKEND_HOST, port=BACKEND_PORT)
\ No newline at end of file
@@ -0,0 +1,6 @@
+"""
+Bộ đo hiệu năng chạy offline: Google Sheets giả trong bộ nhớ (có độ trễ giả lập)
+và dữ liệu pom/dim_publisher sinh ngẫu nhiên, không cần key service account.
+
+    python -m bench.run --size 100k --requests 200 --concurrency 8
+"""
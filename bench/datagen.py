@@ -0,0 +1,68 @@
+"""
+Sinh dữ liệu giả cho tab pom và dim_publisher (cùng cột với storage.DEFAULT_HEADERS).
+Giá trị có kiểu giống get_all_records() của Sheets trả về: số là int/float, ngày là chuỗi.
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from storage import DEFAULT_HEADERS
+
+# Số PO theo cỡ dữ liệu
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+PO_PER_PUBLISHER = 50 # Trung bình mỗi pháp nhân có chừng này PO
+# Các lựa chọn giống form trong templates/
+LOAI_SP = ["Quà vật lý", "Voucher", "Others"]
+TYPE_PO = ["normal", "not-in-revenue", "testing"]
+PO_STATUS = ["Pending", "Activate", "Deactivate"]
+LOAI_PHAP_NHAN = ["CÔNG TY TNHH", "CÔNG TY CỔ PHẦN", "CHI NHÁNH", "NGÂN HÀNG", "KHÁC", "NHÀ NƯỚC"]
+DATE_RANGE_DAYS = 730 # PO rải đều trong 2 năm gần nhất
+
+
+def generate_publishers(n_publishers, rng):
+    """Các dòng dim_publisher (không kèm tiêu đề)."""
+    kinds = rng.choice(LOAI_PHAP_NHAN, size=n_publishers).tolist()
+    return [
+        [i, f"MST{i:08d}", f"Pháp nhân {i}", kinds[i - 1], f"C{i:06d}"]
+        for i in range(1, n_publishers + 1)
+    ]
+
+
+def generate_pos(n_pos, n_publishers, rng, now=None):
+    """Các dòng pom (không kèm tiêu đề); số tiền lệch về phía nhỏ như dữ liệu thật."""
+    now = now or datetime.now().replace(microsecond=0)
+    start = now - timedelta(days=DATE_RANGE_DAYS)
+    publisher_ids = rng.integers(1, n_publishers + 1, size=n_pos).tolist()
+    amounts = (np.round(rng.lognormal(mean=15, sigma=1.5, size=n_pos), -3)).tolist()
+    available = (np.round(np.array(amounts) * rng.uniform(0, 1, size=n_pos), -3)).tolist()
+    offsets = rng.integers(0, DATE_RANGE_DAYS * 86400, size=n_pos).tolist()
+    statuses = rng.choice(PO_STATUS, size=n_pos).tolist()
+    loai_sp = rng.choice(LOAI_SP, size=n_pos).tolist()
+    type_po = rng.choice(TYPE_PO, size=n_pos, p=[0.8, 0.15, 0.05]).tolist()
+
+    rows = []
+    for i in range(n_pos):
+        created_at = start + timedelta(seconds=offsets[i])
+        publisher_id = publisher_ids[i]
+        rows.append([
+            publisher_id,
+            i + 1,
+            f"C{publisher_id:06d}_001_{created_at:%y%m%d}",
+            amounts[i],
+            available[i],
+            f"{created_at:%Y-%m-%d %H:%M:%S}",
+            statuses[i],
+            loai_sp[i],
+            type_po[i],
+        ])
+    return rows
+
+
+def generate_sheets(n_pos, n_publishers=None, seed=0):
+    """{tên tab: [tiêu đề, dòng...]} cho bench.fake_gspread.FakeSpreadsheet."""
+    rng = np.random.default_rng(seed)
+    n_publishers = n_publishers or max(1, n_pos // PO_PER_PUBLISHER)
+    return {
+        "dim_publisher": [DEFAULT_HEADERS["dim_publisher"]] + generate_publishers(n_publishers, rng),
+        "pom": [DEFAULT_HEADERS["pom"]] + generate_pos(n_pos, n_publishers, rng),
+    }
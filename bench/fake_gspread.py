@@ -0,0 +1,185 @@
+"""
+gspread giả trong bộ nhớ cho bộ đo hiệu năng và test.
+
+Chỉ cài các hàm mà storage.GoogleSheetsStorage gọi (open_by_key, worksheet, row_values,
+get_all_records, append_rows, batch_update, get_lastUpdateTime). Mỗi lần gọi ngủ một khoảng
+giả lập độ trễ mạng của Sheets API; lần đọc cả tab ngủ thêm theo số dòng trả về.
+Có thể cài lỗi cho các lần gọi kế tiếp (429 hết hạn mức, 5xx) và đếm số lần gọi từng hàm.
+"""
+import json
+import threading
+import time
+from collections import Counter
+
+import gspread
+import requests
+from gspread.utils import a1_range_to_grid_range, numericise, rowcol_to_a1
+
+
+class Latency:
+    """Độ trễ giả lập: call_seconds mỗi request, cộng row_seconds cho mỗi dòng đọc về."""
+
+    def __init__(self, call_seconds=0.0, row_seconds=0.0):
+        self.call_seconds = call_seconds
+        self.row_seconds = row_seconds
+
+    def wait(self, rows=0):
+        delay = self.call_seconds + self.row_seconds * rows
+        if delay > 0:
+            time.sleep(delay)
+
+
+class FakeWorksheet:
+    """Một tab: rows[0] là dòng tiêu đề, các dòng sau là dữ liệu (giá trị đã có kiểu như Sheets trả về)."""
+
+    def __init__(self, spreadsheet, title, rows):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.rows = [list(row) for row in rows]
+        self._lock = threading.Lock()
+
+    def row_values(self, row, **kwargs):
+        self.spreadsheet.latency.wait()
+        self.spreadsheet.call("row_values")
+        with self._lock:
+            values = self.rows[row - 1] if row <= len(self.rows) else []
+            return [str(value) for value in values]
+
+    def get_all_values(self, **kwargs):
+        with self._lock:
+            values = [[str(value) for value in row] for row in self.rows]
+        self.spreadsheet.latency.wait(len(values))
+        self.spreadsheet.call("get_all_values")
+        return values
+
+    def get_all_records(self, **kwargs):
+        with self._lock:
+            if not self.rows:
+                records = []
+            else:
+                headers = self.rows[0]
+                width = len(headers)
+                records = [
+                    dict(zip(headers, (list(row) + [""] * width)[:width]))
+                    for row in self.rows[1:]
+                ]
+        self.spreadsheet.latency.wait(len(records))
+        self.spreadsheet.call("get_all_records")
+        return records
+
+    def append_rows(self, values, value_input_option=None, **kwargs):
+        self.spreadsheet.latency.wait()
+        self.spreadsheet.call("append_rows")
+        with self._lock:
+            start = len(self.rows) + 1
+            self.rows.extend([_user_entered(value) for value in row] for row in values)
+            end = len(self.rows)
+        self.spreadsheet.touch()
+        self.spreadsheet.call("append_rows", written=True)
+        last_cell = rowcol_to_a1(end, max((len(row) for row in values), default=1))
+        return {"updates": {"updatedRange": f"'{self.title}'!A{start}:{last_cell}", "updatedRows": len(values)}}
+
+    def batch_update(self, data, value_input_option=None, **kwargs):
+        self.spreadsheet.latency.wait()
+        self.spreadsheet.call("batch_update")
+        with self._lock:
+            for item in data:
+                self._set_range(item["range"], item["values"])
+        self.spreadsheet.touch()
+        self.spreadsheet.call("batch_update", written=True)
+        return {}
+
+    def _set_range(self, a1_range, values):
+        grid = a1_range_to_grid_range(a1_range.split("!")[-1])
+        first_row, first_col = grid["startRowIndex"], grid["startColumnIndex"]
+        for i, row_values in enumerate(values):
+            while len(self.rows) <= first_row + i:
+                self.rows.append([])
+            row = self.rows[first_row + i]
+            for j, value in enumerate(row_values):
+                while len(row) <= first_col + j:
+                    row.append("")
+                row[first_col + j] = _user_entered(value)
+
+
+def _user_entered(value):
+    """Giống USER_ENTERED: chuỗi số được Sheets hiểu thành số."""
+    return numericise(value) if isinstance(value, str) else value
+
+
+def api_error(code):
+    """gspread APIError với mã HTTP `code`, giống phản hồi lỗi của Google API."""
+    response = requests.Response()
+    response.status_code = code
+    status = "RESOURCE_EXHAUSTED" if code == 429 else "UNAVAILABLE"
+    response._content = json.dumps({"error": {"code": code, "message": f"Lỗi giả lập {code}", "status": status}}).encode("utf-8")
+    return gspread.exceptions.APIError(response)
+
+
+class FakeSpreadsheet:
+    def __init__(self, sheets, latency=None):
+        self.latency = latency or Latency()
+        self.calls = Counter() # Số lần gọi từng hàm (kể cả lần bị lỗi)
+        self._errors = {}      # {tên hàm: [(mã lỗi, written)]} lỗi cài cho các lần gọi kế tiếp
+        self._modified = 0 # Tăng mỗi lần ghi (thay cho modifiedTime trên Drive)
+        self._lock = threading.Lock()
+        self.worksheets = {title: FakeWorksheet(self, title, rows) for title, rows in sheets.items()}
+
+    def inject_error(self, method, code, times=1, written=False):
+        """
+        `times` lần gọi `method` kế tiếp báo lỗi HTTP `code`.
+        written=True: thao tác ghi vẫn được thực hiện rồi mới báo lỗi (server ghi xong nhưng phản hồi lỗi).
+        """
+        with self._lock:
+            self._errors.setdefault(method, []).extend([(code, written)] * times)
+
+    def clear_errors(self):
+        with self._lock:
+            self._errors.clear()
+
+    def call(self, method, written=False):
+        """Ghi nhận một lần gọi (written=False) và báo lỗi đã cài cho thời điểm này nếu có."""
+        with self._lock:
+            if not written:
+                self.calls[method] += 1
+            errors = self._errors.get(method)
+            if not errors or errors[0][1] != written:
+                return
+            code, _ = errors.pop(0)
+        raise api_error(code)
+
+    def worksheet(self, title):
+        self.latency.wait()
+        self.call("worksheet")
+        if title not in self.worksheets:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self.worksheets[title]
+
+    def touch(self):
+        with self._lock:
+            self._modified += 1
+
+    def get_lastUpdateTime(self):
+        self.latency.wait()
+        self.call("get_lastUpdateTime")
+        with self._lock:
+            return f"modified-{self._modified}"
+
+
+class FakeClient:
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def open_by_key(self, key):
+        self.spreadsheet.latency.wait()
+        return self.spreadsheet
+
+
+def install(spreadsheet):
+    """
+    Thay xác thực Google bằng client giả trỏ tới spreadsheet.
+    Phải gọi TRƯỚC khi import backend (backend kết nối Sheets ngay lúc import).
+    """
+    from google.oauth2 import service_account
+    service_account.Credentials.from_service_account_file = classmethod(lambda cls, *args, **kwargs: None)
+    gspread.authorize = lambda credentials, *args, **kwargs: FakeClient(spreadsheet)
@@ -0,0 +1,273 @@
+"""
+Đo hiệu năng backend + frontend trên Google Sheets giả (bench.fake_gspread), không cần mạng/key.
+
+    python -m bench.run --size 1k
+    python -m bench.run --size 100k --latency-ms 300 --row-latency-us 20 --requests 500 --concurrency 16
+    python -m bench.run --size 1m --only all-data,rfm-data --json bench-1m.json
+    python -m bench.run --size 100k --baseline bench-100k.json   # Chậm hơn baseline quá ngưỡng -> exit 1
+
+Mỗi kịch bản gửi --requests request qua --concurrency luồng, xoay vòng qua một bộ lọc dashboard
+cố định (như người dùng bấm đi bấm lại), rồi in số request/giây và độ trễ p50/p99.
+Request đầu tiên của mỗi kịch bản (nạp dữ liệu, cache còn trống) được đo riêng ở cột "đầu".
+Mặc định --storage gsheets như khi triển khai: create-po/update-po ghi thẳng lên Sheet nên bị chặn bởi
+hạn mức ghi (storage.SHEETS_WRITES_PER_MINUTE, TokenBucket), kết quả in kèm ghi chú về giới hạn này.
+Các biến môi trường của backend.py/frontend.py (PLOT_PROCESSES, SHARED_CACHE_DIR...) vẫn có tác dụng.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import requests
+from werkzeug.serving import make_server
+
+from bench import fake_gspread
+from storage import SHEETS_BURST, SHEETS_WRITES_PER_MINUTE
+from bench.datagen import LOAI_SP, PO_STATUS, SIZES, generate_sheets
+
+# Các cột frontend xin khi dựng dashboard (frontend.DASHBOARD_FIELDS)
+ALL_DATA_FIELDS = "po_created_at,po_amount,po_id,loai_sp,ID_phap_nhan,ten_phap_nhan"
+COLUMNAR_MIMETYPE = "application/vnd.dashboard.columns+json"
+SCENARIOS = [
+    "all-data", "rfm-data", "plot-monthly", "plot-campaign", "plot-pareto", "create-po", "update-po",
+]
+WRITE_SCENARIOS = ("create-po", "update-po")
+
+
+def dashboard_filters(n_publishers, now=None):
+    """Bộ lọc dashboard dùng xoay vòng: không lọc, theo khoảng ngày, loại SP, tên pháp nhân."""
+    now = now or datetime.now()
+    filters = [{}]
+    for days in (30, 90, 365):
+        filters.append({"start_date": f"{now - timedelta(days=days):%Y-%m-%d}", "end_date": f"{now:%Y-%m-%d}"})
+    filters += [{"loai_sp": loai_sp} for loai_sp in LOAI_SP]
+    filters += [{"ten_phap_nhan": f"Pháp nhân {i}"} for i in (1, max(1, n_publishers // 2))]
+    return filters
+
+
+class Target:
+    """Địa chỉ backend/frontend đang chạy và kích thước dữ liệu để dựng request."""
+
+    def __init__(self, backend_url, frontend_url, n_pos, n_publishers):
+        self.backend_url = backend_url
+        self.frontend_url = frontend_url
+        self.n_pos = n_pos
+        self.n_publishers = n_publishers
+        self.filters = dashboard_filters(n_publishers)
+
+    def request(self, session, scenario, i):
+        params = self.filters[i % len(self.filters)]
+        if scenario == "all-data":
+            return session.get(
+                f"{self.backend_url}/api/all-data", params={**params, "fields": ALL_DATA_FIELDS},
+                headers={"Accept": COLUMNAR_MIMETYPE},
+            )
+        if scenario == "rfm-data":
+            return session.get(f"{self.frontend_url}/api/rfm-data", params=params)
+        if scenario.startswith("plot-"):
+            return session.get(f"{self.frontend_url}/plot/{scenario[len('plot-'):]}.png", params=params)
+        if scenario == "create-po":
+            return session.post(f"{self.backend_url}/api/create-po", json={
+                "id_phap_nhan": i % self.n_publishers + 1,
+                "po_amount": 1000 * (i % 997 + 1),
+                "po_available_amount": 1000 * (i % 997 + 1),
+                "po_status": PO_STATUS[i % len(PO_STATUS)],
+                "loai_sp": LOAI_SP[i % len(LOAI_SP)],
+                "type_po": "normal",
+            })
+        if scenario == "update-po":
+            po_id = (i * 7919) % self.n_pos + 1 # Rải đều trên các PO
+            return session.put(f"{self.backend_url}/api/po/{po_id}", json={"po_amount": 1000 * (i % 997 + 1)})
+        raise ValueError(f"Kịch bản không hợp lệ: {scenario}")
+
+
+def _is_ok(response):
+    if not response.ok:
+        return False
+    if response.headers.get("Content-Type", "").startswith("application/json"):
+        body = response.json()
+        return not (isinstance(body, dict) and body.get("success") is False)
+    return True
+
+
+def run_scenario(target, scenario, n_requests, concurrency):
+    """Gửi n_requests request (sau 1 request đầu đo riêng); trả về dict kết quả (thời gian tính bằng ms)."""
+    local = threading.local()
+
+    def one(i):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            ok = _is_ok(target.request(session, scenario, i))
+        except (requests.RequestException, ValueError):
+            ok = False
+        return time.perf_counter() - started, ok
+
+    first_seconds, first_ok = one(0)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(1, n_requests + 1)))
+    wall_seconds = time.perf_counter() - started
+
+    latencies = np.array([seconds for seconds, _ in results]) * 1000
+    return {
+        "scenario": scenario,
+        "requests": n_requests,
+        "errors": sum(not ok for _, ok in results) + (not first_ok),
+        "throughput": n_requests / wall_seconds if wall_seconds > 0 else 0.0,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "first_ms": first_seconds * 1000,
+    }
+
+
+def write_limit_notes(storage, scenarios, concurrency):
+    """Ghi chú cho các kịch bản ghi bị chặn bởi hạn mức ghi Sheets (chỉ khi ghi thẳng lên Sheet)."""
+    writes = [s for s in scenarios if s in WRITE_SCENARIOS]
+    if storage != "gsheets" or not writes:
+        return []
+    seconds = 60 / SHEETS_WRITES_PER_MINUTE
+    return [
+        f"{', '.join(writes)}: mỗi request ghi lên Sheet qua TokenBucket {SHEETS_WRITES_PER_MINUTE} lần ghi/phút"
+        f" (dồn tối đa {SHEETS_BURST}), sau {SHEETS_BURST} request đầu tối đa ~{1 / seconds:.1f} req/s;"
+        f" {concurrency} request đồng thời xếp hàng chờ lượt nên p50 ~{concurrency * seconds:.0f}s"
+        " là thời gian chờ hạn mức, không phải thời gian xử lý (--storage journal/sqlite để đo phần xử lý).",
+    ]
+
+
+def print_results(results, storage=None, notes=(), out=sys.stdout):
+    if storage:
+        print(f"storage: {storage}", file=out)
+    header = f"{'kịch bản':<14} {'n':>6} {'lỗi':>5} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'đầu ms':>9}"
+    print(header, file=out)
+    print("-" * len(header), file=out)
+    for r in results:
+        print(
+            f"{r['scenario']:<14} {r['requests']:>6} {r['errors']:>5} {r['throughput']:>9.1f}"
+            f" {r['p50_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['first_ms']:>9.1f}",
+            file=out,
+        )
+    for note in notes:
+        print(f"Ghi chú: {note}", file=out)
+
+
+def compare_with_baseline(results, baseline, max_regression):
+    """Các dòng mô tả kịch bản chậm hơn baseline quá max_regression (tỉ lệ, vd 0.2 = 20%)."""
+    previous = {r["scenario"]: r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        old = previous.get(r["scenario"])
+        if old is None:
+            continue
+        for key in ("p50_ms", "p99_ms"):
+            if old[key] > 0 and r[key] > old[key] * (1 + max_regression):
+                regressions.append(f"{r['scenario']}: {key} {old[key]:.1f} -> {r[key]:.1f}")
+        if old["throughput"] > 0 and r["throughput"] < old["throughput"] / (1 + max_regression):
+            regressions.append(f"{r['scenario']}: req/s {old['throughput']:.1f} -> {r['throughput']:.1f}")
+        if r["errors"] > old["errors"]:
+            regressions.append(f"{r['scenario']}: lỗi {old['errors']} -> {r['errors']}")
+    return regressions
+
+
+def _serve(app):
+    """Chạy app trên một port trống (server đa luồng của werkzeug) ở luồng nền; trả về URL gốc."""
+    logging.getLogger("werkzeug").setLevel(logging.WARNING) # Không in log từng request
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Đo hiệu năng trên Google Sheets giả.")
+    parser.add_argument("--size", choices=sorted(SIZES), default="1k", help="Số PO sinh ra")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Độ trễ giả lập mỗi lần gọi Sheets API")
+    parser.add_argument("--row-latency-us", type=float, default=0.0, help="Độ trễ thêm cho mỗi dòng đọc về")
+    parser.add_argument("--requests", type=int, default=100, help="Số request mỗi kịch bản")
+    parser.add_argument("--concurrency", type=int, default=4, help="Số request gửi đồng thời")
+    parser.add_argument("--storage", choices=["gsheets", "journal", "sqlite"], default="gsheets",
+                        help="STORAGE_BACKEND của backend (gsheets: ghi bị chặn bởi hạn mức ghi Sheets)")
+    parser.add_argument("--only", default="", help=f"Chỉ chạy các kịch bản này (phẩy): {','.join(SCENARIOS)}")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", help="Ghi kết quả ra file JSON (dùng làm baseline)")
+    parser.add_argument("--baseline", help="File JSON của lần chạy trước để so sánh")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Ngưỡng chậm hơn baseline được chấp nhận (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+    args.scenarios = [s.strip() for s in args.only.split(",") if s.strip()] or SCENARIOS
+    unknown = [s for s in args.scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"Kịch bản không hợp lệ: {', '.join(unknown)}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    started = time.perf_counter()
+    sheets = generate_sheets(SIZES[args.size], seed=args.seed)
+    n_publishers = len(sheets["dim_publisher"]) - 1
+    print(f"Sinh {SIZES[args.size]} PO, {n_publishers} pháp nhân: {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    latency = fake_gspread.Latency(args.latency_ms / 1000, args.row_latency_us / 1_000_000)
+    fake_gspread.install(fake_gspread.FakeSpreadsheet(sheets, latency))
+    del sheets
+
+    # File dữ liệu cục bộ của backend để trong thư mục tạm, không đụng dữ liệu thật
+    workdir = tempfile.mkdtemp(prefix="pom-bench-")
+    os.environ["STORAGE_BACKEND"] = args.storage
+    os.environ["JOURNAL_PATH"] = os.path.join(workdir, "pom_writes.journal")
+    os.environ["SQLITE_PATH"] = os.path.join(workdir, "pom_local.db")
+    import backend
+    backend_url = _serve(backend.create_app())
+    os.environ["BACKEND_API_URL"] = f"{backend_url}/api"
+    import frontend
+    frontend_url = _serve(frontend.create_app())
+
+    target = Target(backend_url, frontend_url, SIZES[args.size], n_publishers)
+    results = []
+    for scenario in args.scenarios:
+        print(f"Chạy {scenario}...", file=sys.stderr)
+        results.append(run_scenario(target, scenario, args.requests, args.concurrency))
+    notes = write_limit_notes(args.storage, args.scenarios, args.concurrency)
+    print_results(results, args.storage, notes)
+
+    report = {
+        "config": {
+            "size": args.size, "latency_ms": args.latency_ms, "row_latency_us": args.row_latency_us,
+            "requests": args.requests, "concurrency": args.concurrency, "storage": args.storage,
+        },
+        "results": results,
+        "notes": notes,
+    }
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != report["config"]:
+            print("Cảnh báo: cấu hình khác baseline, so sánh có thể không có ý nghĩa.", file=sys.stderr)
+        regressions = compare_with_baseline(results, baseline, args.max_regression)
+        for line in regressions:
+            print(f"CHẬM HƠN BASELINE: {line}")
+        exit_code = 1 if regressions else 0
+    return exit_code
+
+
+if __name__ == "__main__":
+    # Luồng nền của backend (đồng bộ journal, làm mới snapshot) không dừng -> thoát thẳng
+    code = main()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(code)
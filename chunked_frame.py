@@ -0,0 +1,200 @@
+"""
+Bảng chỉ đọc lưu thành các khúc DataFrame liền nhau, mỗi khúc tối đa chunk_rows dòng.
+
+Ghi thêm hay sửa vài dòng tạo bảng mới chỉ chép khúc chứa các dòng đó (ghi thêm: khúc cuối),
+các khúc khác dùng chung với bảng cũ; người đang đọc bảng cũ vẫn thấy bảng cũ nguyên vẹn.
+Vị trí dòng (0..len-1) không đổi khi sửa, dòng ghi thêm nằm ở cuối.
+Cần cả bảng thì frame() ghép các khúc một lần rồi giữ lại.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+def same_values(a, b):
+    """Mask các phần tử bằng nhau của hai mảng (hai ô cùng trống cũng coi là bằng)."""
+    a, b = np.asarray(a, dtype=object), np.asarray(b, dtype=object)
+    return (a == b) | (pd.isna(a) & pd.isna(b))
+
+
+class ChunkedFrame:
+    """DataFrame chỉ đọc chia khúc; các hàm with_*/append trả về bảng mới, không sửa bảng này."""
+
+    def __init__(self, chunks, chunk_rows, frame=None):
+        self.chunks = tuple(chunks)
+        self.chunk_rows = chunk_rows
+        self.offsets = np.cumsum([0] + [len(chunk) for chunk in self.chunks]) # Vị trí dòng đầu từng khúc
+        self._frame = frame
+        self._index = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_frame(cls, df, chunk_rows):
+        """Chia df thành các khúc (không chép dữ liệu); df được giữ làm bảng đầy đủ."""
+        chunks = [df.iloc[start:start + chunk_rows] for start in range(0, len(df), chunk_rows)]
+        return cls(chunks or [df], chunk_rows, frame=df)
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    @property
+    def columns(self):
+        return self.chunks[0].columns
+
+    @property
+    def dtypes(self):
+        """Kiểu cột (của khúc đầu; cột category có cùng danh mục ở mọi khúc)."""
+        return self.chunks[0].dtypes
+
+    @property
+    def empty(self):
+        return len(self) == 0 or len(self.columns) == 0
+
+    @property
+    def index(self):
+        """Nhãn các dòng theo vị trí (ghép một lần rồi giữ lại)."""
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self.chunks[0].index.append([chunk.index for chunk in self.chunks[1:]])
+        return self._index
+
+    def frame(self, columns=None):
+        """DataFrame đầy đủ (chỉ đọc); columns: chỉ lấy các cột này (không giữ lại)."""
+        if columns is not None:
+            if self._frame is not None:
+                return self._frame[columns]
+            return self._concat([chunk[columns] for chunk in self.chunks])
+        if self._frame is None:
+            with self._lock:
+                if self._frame is None:
+                    self._frame = self._concat(self.chunks)
+        return self._frame
+
+    @staticmethod
+    def _concat(pieces):
+        return pieces[0] if len(pieces) == 1 else pd.concat(pieces)
+
+    def _split(self, positions):
+        """[(số khúc, vị trí trong khúc)] cho các vị trí đã sắp xếp tăng dần."""
+        cuts = np.searchsorted(positions, self.offsets)
+        return [
+            (i, positions[cuts[i]:cuts[i + 1]] - self.offsets[i])
+            for i in range(len(self.chunks)) if cuts[i + 1] > cuts[i]
+        ]
+
+    def take(self, positions, columns=None):
+        """DataFrame các dòng ở `positions` (đúng thứ tự đó); columns: chỉ lấy các cột này."""
+        positions = np.asarray(positions, dtype=np.intp)
+        if self._frame is not None:
+            df = self._frame.iloc[positions]
+            return df if columns is None else df[columns]
+        order = None
+        if len(positions) > 1 and (np.diff(positions) < 0).any():
+            order = np.argsort(positions, kind='stable')
+            positions = positions[order]
+        pieces = []
+        for i, local in self._split(positions):
+            chunk = self.chunks[i] if columns is None else self.chunks[i][columns]
+            pieces.append(chunk.iloc[local])
+        if not pieces:
+            chunk = self.chunks[0] if columns is None else self.chunks[0][columns]
+            return chunk.iloc[:0]
+        df = self._concat(pieces)
+        if order is not None:
+            df = df.iloc[np.argsort(order, kind='stable')]
+        return df
+
+    def select(self, func):
+        """Ghép func(khúc) của từng khúc (func lọc dòng/chọn cột, vd: lambda df: df[mask]), không ghép cả bảng trước."""
+        if self._frame is not None:
+            return func(self._frame)
+        return self._concat([func(chunk) for chunk in self.chunks])
+
+    def positions(self, labels):
+        """Vị trí của các nhãn dòng (-1 nếu không có)."""
+        labels = pd.Index(labels)
+        result = np.full(len(labels), -1, dtype=np.intp)
+        for offset, chunk in zip(self.offsets, self.chunks):
+            found = chunk.index.get_indexer(labels)
+            hit = found >= 0
+            result[hit] = found[hit] + offset
+        return result
+
+    def append(self, rows):
+        """Bảng mới có thêm `rows` ở cuối: chỉ chép khúc cuối (đầy thì mở khúc mới)."""
+        if len(rows) == 0:
+            return self
+        if len(self) == 0:
+            return ChunkedFrame.from_frame(rows, self.chunk_rows)
+        chunks = list(self.chunks)
+        room = self.chunk_rows - len(chunks[-1])
+        if room > 0:
+            chunks[-1] = pd.concat([chunks[-1], rows.iloc[:room]])
+            rows = rows.iloc[room:]
+        for start in range(0, len(rows), self.chunk_rows):
+            chunks.append(rows.iloc[start:start + self.chunk_rows])
+        return ChunkedFrame(chunks, self.chunk_rows)
+
+    def insert_sorted(self, rows):
+        """
+        Bảng mới có thêm `rows` theo thứ tự nhãn dòng (bảng đang xếp theo nhãn); nhãn mới thường lớn nhất
+        nên chỉ chép khúc cuối. None nếu phải chèn vào trước khúc cuối (bên gọi tự dựng lại bảng).
+        """
+        if len(rows) == 0 or len(self) == 0:
+            return self.append(rows)
+        last = self.chunks[-1]
+        if rows.index.min() > last.index[-1]:
+            return self.append(rows.sort_index(kind='stable'))
+        if len(last) == 0 or rows.index.min() < last.index[0]:
+            return None
+        merged = pd.concat([last, rows]).sort_index(kind='stable')
+        head = ChunkedFrame(self.chunks[:-1], self.chunk_rows) if len(self.chunks) > 1 else None
+        if head is None:
+            return ChunkedFrame.from_frame(merged, self.chunk_rows)
+        return head.append(merged)
+
+    def with_values(self, changes):
+        """
+        Bảng mới với các ô đã sửa: changes = {cột: (vị trí, giá trị)}. Chỉ chép cột của các khúc có ô
+        thực sự đổi; giá trị khác kiểu cột (vd: chuỗi vào cột số) thì cột của khúc đó chuyển sang object.
+        """
+        chunks = list(self.chunks)
+        new_columns = {} # {số khúc: {cột: Series mới}}
+        for col, (positions, values) in changes.items():
+            positions = np.asarray(positions, dtype=np.intp)
+            values = np.asarray(values, dtype=object) if isinstance(values, list) else np.asarray(values)
+            order = np.argsort(positions, kind='stable')
+            positions, values = positions[order], values[order]
+            cuts = np.searchsorted(positions, self.offsets)
+            for i, local in self._split(positions):
+                part = values[cuts[i]:cuts[i + 1]]
+                column = new_columns.get(i, {}).get(col)
+                current = chunks[i][col] if column is None else column
+                if column is None and same_values(current.iloc[local].to_numpy(dtype=object), part).all():
+                    continue # Giá trị không đổi, không chép cột
+                if column is None:
+                    column = current.copy()
+                try:
+                    column.iloc[local] = part
+                except (TypeError, ValueError):
+                    column = column.astype(object)
+                    column.iloc[local] = part
+                new_columns.setdefault(i, {})[col] = column
+        if not new_columns:
+            return self
+        for i, columns in new_columns.items():
+            chunks[i] = chunks[i].assign(**columns)
+        return ChunkedFrame(chunks, self.chunk_rows)
+
+    def with_rows(self, positions, rows):
+        """Bảng mới: các dòng ở `positions` thay bằng `rows` (cùng cột, theo thứ tự)."""
+        return self.with_values({col: (positions, rows[col].to_numpy()) for col in rows.columns})
+
+    def with_categories(self, column, categories):
+        """Bảng mới: cột category `column` thêm các danh mục `categories` (mã cũ giữ nguyên)."""
+        chunks = [
+            chunk.assign(**{column: chunk[column].cat.add_categories(categories)}) for chunk in self.chunks
+        ]
+        return ChunkedFrame(chunks, self.chunk_rows)
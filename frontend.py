@@ -1,19 +1,99 @@
 import io
+import os
+import hashlib
+import functools
+import multiprocessing
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 from flask import Flask, render_template, jsonify, Response, request
-from datetime import datetime # Cần thiết cho tính Recency
+from datetime import datetime, timezone # Cần thiết cho tính Recency
+from shared_cache import SharedFileCache
 
 # --- Khởi tạo ứng dụng ---
 app = Flask(__name__, template_folder="templates", static_folder="static")
 
 # --- Cấu hình ---
-BACKEND_API_URL = "http://127.0.0.1:5000/api"
+# Các thiết lập triển khai đọc từ biến môi trường; mặc định là chạy thử trên một máy
+APP_ENV = os.environ.get("APP_ENV", "development") # "production": chạy bằng waitress thay cho server dev
+BACKEND_API_URL = os.environ.get("BACKEND_API_URL", "http://127.0.0.1:5000/api")
+# Địa chỉ backend mà trình duyệt gọi (main.js); khác BACKEND_API_URL khi backend nằm sau proxy
+PUBLIC_BACKEND_API_URL = os.environ.get("PUBLIC_BACKEND_API_URL", BACKEND_API_URL)
+FRONTEND_HOST = os.environ.get("FRONTEND_HOST", "127.0.0.1")
+FRONTEND_PORT = int(os.environ.get("FRONTEND_PORT", "8000"))
+FRONTEND_THREADS = int(os.environ.get("FRONTEND_THREADS", "8"))
+# Số tiến trình vẽ ảnh PNG (matplotlib giữ GIL khi vẽ); 0 = vẽ ngay trong luồng xử lý request
+PLOT_PROCESSES = int(os.environ.get("PLOT_PROCESSES", "0"))
+# Thư mục cache dùng chung giữa các worker (bản sao dữ liệu, ảnh đã vẽ); trống = mỗi worker tự cache
+SHARED_CACHE_DIR = os.environ.get("SHARED_CACHE_DIR", "")
+SHARED_CACHE_MAX_BYTES = int(os.environ.get("SHARED_CACHE_MAX_MB", "256")) * 1024 * 1024
+# Kết nối tới backend: giữ kết nối (keep-alive) để dùng lại, tự thử lại GET khi lỗi tạm thời
+BACKEND_POOL_SIZE = 16
+BACKEND_RETRIES = 3
+# Xin dữ liệu dạng cột (gọn hơn mảng các dòng), phải khớp COLUMNAR_MIMETYPE của backend.py
+COLUMNAR_MIMETYPE = "application/vnd.dashboard.columns+json"
+FRAME_ACCEPT = f"{COLUMNAR_MIMETYPE}, application/json;q=0.9"
+# Tham số lọc của Dashboard (được chuyển thẳng cho backend lọc)
+FILTER_PARAMS = ('start_date', 'end_date', 'loai_sp', 'ten_phap_nhan')
+# Các cột mỗi biểu đồ/bảng cần lấy từ backend
+MONTHLY_FIELDS = ['po_created_at', 'po_amount', 'po_id']
+CAMPAIGN_FIELDS = ['loai_sp', 'po_amount']
+RFM_FIELDS = ['ID_phap_nhan', 'ten_phap_nhan', 'po_id', 'po_amount', 'po_created_at']
+# Gói dữ liệu Dashboard: lấy một lần các cột cho mọi biểu đồ/bảng, dùng lại trong thời gian ngắn
+DASHBOARD_FIELDS = list(dict.fromkeys(MONTHLY_FIELDS + CAMPAIGN_FIELDS + RFM_FIELDS))
+BUNDLE_TTL_SECONDS = 5
+# Bộ lọc mà backend áp dụng được trên bảng R/F/M theo pháp nhân (không cần tải từng PO để tính RFM)
+RFM_AGGREGATE_FILTERS = ('ten_phap_nhan',)
+# Bộ lọc mà backend trả được biểu đồ tháng/loại SP từ cube tổng hợp (không cần tải từng PO)
+MONTH_SUMMARY_FILTERS = FILTER_PARAMS
+BUNDLE_MAX_ENTRIES = 32
+# Bản sao dữ liệu PO theo (bộ lọc, cột): chỉ tải các dòng đổi qua /api/changes
+REPLICA_MAX_ENTRIES = 16
+# Cache ảnh PNG của biểu đồ (theo route + bộ lọc + version dữ liệu)
+PNG_CACHE_MAX_ENTRIES = 64
+# Chart.js (4.4.1) phục vụ từ static/ của chính frontend, không tải từ CDN (xem README);
+# chưa có file thì trang không nạp Chart.js và dashboard dùng ảnh PNG
+CHARTJS_FILE = "js/vendor/chart.umd.min.js"
 
 # --- Hàm hỗ trợ (Helpers) ---
+def create_backend_session():
+    """Session dùng chung cho mọi lần gọi backend: pool kết nối keep-alive, thử lại GET lỗi tạm thời."""
+    retry = Retry(
+        total=BACKEND_RETRIES, backoff_factor=0.2,
+        status_forcelist=(502, 503, 504), allowed_methods=frozenset({'GET'}),
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=BACKEND_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+backend_session = create_backend_session()
+
+try:
+    shared_cache = SharedFileCache(SHARED_CACHE_DIR, SHARED_CACHE_MAX_BYTES) if SHARED_CACHE_DIR else None
+except PermissionError as e:
+    print(f"LỖI: không dùng cache dùng chung: {e}")
+    shared_cache = None
+
+def read_frame(resp):
+    """DataFrame từ phản hồi của backend (dạng cột nếu backend trả dạng cột, ngược lại mảng các dòng)."""
+    payload = resp.json()
+    if resp.headers.get('Content-Type', '').startswith(COLUMNAR_MIMETYPE):
+        return pd.DataFrame(dict(zip(payload["columns"], payload["data"])), columns=payload["columns"])
+    return pd.DataFrame(payload)
+
 def create_error_plot(message):
     fig, ax = plt.subplots(figsize=(6, 4))
     ax.text(0.5, 0.5, f"LỖI: {message}", ha='center', va='center', color='red')
@@ -28,52 +108,204 @@ def fig_to_png_bytes(fig):
     plt.close(fig)
     return buf.getvalue()
 
-def fetch_data():
+def get_filter_params():
+    """Lấy các tham số lọc (start_date, end_date, loai_sp, ten_phap_nhan) từ query của request."""
+    return {key: request.args.get(key) for key in FILTER_PARAMS if request.args.get(key)}
+
+def get_min_version():
+    """
+    Version dữ liệu tối thiểu mà request cần (query min_version): dashboard gửi kèm khi nhận
+    sự kiện thay đổi từ backend, để không nhận lại gói dữ liệu cũ còn trong cache.
+    """
+    return request.args.get('min_version', type=int)
+
+# --- Bản sao dữ liệu dashboard ---
+# Mỗi (bộ lọc, cột) giữ bảng PO đã tải (chỉ mục = nhãn dòng của backend) cùng version/epoch;
+# lần sau chỉ hỏi backend các dòng thêm/sửa/xóa kể từ version đó rồi vá vào bảng (LRU).
+_replicas = OrderedDict()  # {(filter_key, fields): {"df", "version", "epoch"}}
+_replica_lock = threading.Lock()
+
+def _prepare_rows(df):
+    """Tiền xử lý kiểu dữ liệu các dòng vừa tải."""
+    if 'po_created_at' in df.columns:
+        df['po_created_at'] = pd.to_datetime(df['po_created_at'], errors='coerce')
+    if 'po_amount' in df.columns:
+        df['po_amount'] = pd.to_numeric(df['po_amount'], errors='coerce').fillna(0)
+    # Đảm bảo có cột ID_phap_nhan
+    if 'ID' in df.columns and 'ID_phap_nhan' not in df.columns:
+        df = df.rename(columns={'ID': 'ID_phap_nhan'})
+    return df
+
+def _apply_changes(df, rows, deleted):
+    """Bảng mới từ bản sao df: bỏ dòng đã xóa/đổi, thêm các dòng mới tải (không sửa df)."""
+    drop = df.index.intersection(pd.Index(deleted).union(rows.index))
+    if len(drop):
+        df = df.drop(index=drop)
+    if df.empty:
+        return rows # Bảng rỗng không giữ được kiểu cột, lấy theo các dòng mới
+    if not rows.empty:
+        df = pd.concat([df, rows]).sort_index()
+    return df
+
+def _replica_to_json(entry):
+    """Bản sao -> giá trị JSON cho cache dùng chung (cùng dạng cột như /api/changes)."""
+    df = entry["df"]
+    data = []
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            values = values.dt.strftime('%Y-%m-%dT%H:%M:%S')
+        data.append(values.astype(object).where(values.notna(), None).tolist())
+    return {
+        "version": entry["version"], "epoch": entry["epoch"],
+        "labels": df.index.tolist(), "columns": df.columns.tolist(), "data": data,
+    }
+
+def _replica_from_json(value):
+    """Bản sao từ giá trị của _replica_to_json (None nếu không đúng dạng)."""
+    try:
+        df = pd.DataFrame(dict(zip(value["columns"], value["data"])), columns=value["columns"], index=value["labels"])
+        return {"df": _prepare_rows(df), "version": int(value["version"]), "epoch": value["epoch"]}
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def fetch_data(filters=None, fields=None, with_version=False):
     """
     Gọi API backend (port 5000) để lấy dữ liệu dashboard.
+    Backend lọc theo `filters` và chỉ trả về các cột trong `fields` (nếu có).
+    Đã có bản sao cho cùng bộ lọc/cột thì chỉ tải các dòng đổi từ lần trước.
+    with_version=True: trả về (df, version dữ liệu) thay vì chỉ df (version None nếu lỗi).
+    Bảng trả về dùng chung với bản sao: chỉ đọc.
     """
+    key = (_filter_key(filters), tuple(fields or ()))
+    params = dict(filters or {})
+    if fields:
+        params['fields'] = ",".join(fields)
+    with _replica_lock:
+        replica = _replicas.get(key)
+    if replica is None and shared_cache is not None:
+        # Worker khác có thể đã tải bản sao này: chỉ cần lấy phần đổi từ đó
+        value = shared_cache.get_json(("replica",) + key)
+        replica = _replica_from_json(value) if value is not None else None
+    if replica is not None:
+        params.update(since=replica["version"], epoch=replica["epoch"])
     try:
-        resp = requests.get(f"{BACKEND_API_URL}/all-data", timeout=10)
+        resp = backend_session.get(f"{BACKEND_API_URL}/changes", params=params, timeout=10)
         resp.raise_for_status()
-        data = resp.json()
-        df = pd.DataFrame(data)
-        
-        # Tiền xử lý kiểu dữ liệu sau khi tải
-        if 'po_created_at' in df.columns:
-            df['po_created_at'] = pd.to_datetime(df['po_created_at'], errors='coerce')
-        if 'po_amount' in df.columns:
-            df['po_amount'] = pd.to_numeric(df['po_amount'], errors='coerce').fillna(0)
-            
-        # Đảm bảo có cột ID_phap_nhan
-        if 'ID' in df.columns and 'ID_phap_nhan' not in df.columns:
-             df = df.rename(columns={'ID': 'ID_phap_nhan'})
-            
-        return df
+        payload = resp.json()
+        rows = pd.DataFrame(
+            dict(zip(payload["columns"], payload["data"])), columns=payload["columns"], index=payload["labels"]
+        )
+        rows = _prepare_rows(rows)
+        if payload["reset"] or replica is None:
+            df = rows
+        else:
+            df = _apply_changes(replica["df"], rows, payload["deleted"])
+        version = int(payload["version"])
+        entry = {"df": df, "version": version, "epoch": payload["epoch"]}
+        if shared_cache is not None and (replica is None or payload["reset"] or replica["version"] != version):
+            shared_cache.set_json(("replica",) + key, _replica_to_json(entry))
+
+        with _replica_lock:
+            current = _replicas.get(key)
+            # Request song song có thể đã lưu bản mới hơn
+            if current is None or current["epoch"] != payload["epoch"] or current["version"] <= version:
+                _replicas[key] = entry
+            _replicas.move_to_end(key)
+            while len(_replicas) > REPLICA_MAX_ENTRIES:
+                _replicas.popitem(last=False)
+        return (df, version) if with_version else df
     except requests.RequestException as e:
         print(f"Lỗi kết nối Backend hoặc API: {e}")
-        return pd.DataFrame()
     except Exception as e:
         print(f"Lỗi xử lý dữ liệu: {e}")
-        return pd.DataFrame()
+    return (pd.DataFrame(), None) if with_version else pd.DataFrame()
 
-def apply_filters_to_df(df):
-    df_filtered = df.copy()
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    loai_sp = request.args.get('loai_sp')
-    ten_phap_nhan = request.args.get('ten_phap_nhan')
-    if start_date:
-        df_filtered = df_filtered[df_filtered['po_created_at'] >= start_date]
-    if end_date:
-        df_filtered = df_filtered[df_filtered['po_created_at'] <= end_date]
-    if loai_sp:
-        df_filtered = df_filtered[df_filtered['loai_sp'].astype(str).str.contains(loai_sp, case=False, na=False)]
-    if ten_phap_nhan:
-        df_filtered = df_filtered[df_filtered['ten_phap_nhan'].astype(str).str.contains(ten_phap_nhan, case=False, na=False)]
-    return df_filtered
+def fetch_rfm_aggregates(filters=None, with_version=False):
+    """
+    Lấy bảng R/F/M thô theo pháp nhân (backend cập nhật dần khi tạo/sửa PO).
+    Trả về None nếu lỗi; with_version=True: trả về (bảng, version dữ liệu), (None, None) nếu lỗi.
+    """
+    try:
+        resp = backend_session.get(
+            f"{BACKEND_API_URL}/rfm-aggregates", params=dict(filters or {}), headers={'Accept': FRAME_ACCEPT}, timeout=10
+        )
+        resp.raise_for_status()
+        df = read_frame(resp)
+        if 'last_po_at' in df.columns:
+            df['last_po_at'] = pd.to_datetime(df['last_po_at'], errors='coerce')
+        version = resp.headers.get('X-Data-Version')
+        return (df, int(version) if version else None) if with_version else df
+    except Exception as e:
+        print(f"Lỗi lấy bảng R/F/M: {e}")
+        return (None, None) if with_version else None
+
+def fetch_month_summary(filters=None):
+    """
+    Lấy tổng hợp theo tháng và theo loại SP (backend tính từ cube).
+    Trả về (summary, version dữ liệu); (None, None) nếu lỗi.
+    """
+    try:
+        resp = backend_session.get(f"{BACKEND_API_URL}/month-summary", params=dict(filters or {}), timeout=10)
+        resp.raise_for_status()
+        version = resp.headers.get('X-Data-Version')
+        return resp.json(), (int(version) if version else None)
+    except Exception as e:
+        print(f"Lỗi lấy tổng hợp theo tháng: {e}")
+        return None, None
+
+def fetch_data_version():
+    """Hỏi backend version dữ liệu hiện tại (None nếu lỗi)."""
+    try:
+        resp = backend_session.get(f"{BACKEND_API_URL}/data-version", timeout=5)
+        resp.raise_for_status()
+        return int(resp.json()["version"])
+    except Exception as e:
+        print(f"Lỗi lấy version dữ liệu: {e}")
+        return None
+
+def quintile_scores(series, labels, ascending=True):
+    """Chia điểm 1-5 theo ngũ phân vị (qcut); không chia đủ 5 nhóm thì chia theo thứ hạng."""
+    try:
+        return pd.qcut(series, 5, labels=labels, duplicates='drop').astype('Int64')
+    except Exception:
+        rank = series.rank(method='first', ascending=ascending)
+        # Ánh xạ rank sang điểm 1-5: min(5, max(1, int(rank / n * 5) + 1))
+        scores = (np.floor(rank / len(series) * 5) + 1).clip(1, 5)
+        return scores.astype('Int64') if scores.isna().any() else scores.astype('int64')
+
+def assign_rfm_segments(rfm_df):
+    """Gán Segment theo điểm R, F, M (thiếu điểm thì điều kiện tương ứng coi như sai)."""
+    r, f, m = rfm_df['R_score'], rfm_df['F_score'], rfm_df['M_score']
+    conditions = [
+        (r >= 4) & (f >= 4) & (m >= 4),
+        (r >= 4) & (f >= 3),
+        (r >= 3) & (m >= 3),
+        (r <= 2) & (f <= 2),
+    ]
+    conditions = [cond.fillna(False).to_numpy(dtype=bool) for cond in conditions]
+    segments = np.select(conditions, ['Champion', 'Loyal', 'Potential', 'At risk'], default='Others')
+    return pd.Series(segments, index=rfm_df.index)
+
+def score_rfm(rfm_df):
+    """Tính R_score, F_score, M_score và Segment từ bảng Recency/Frequency/Monetary theo pháp nhân."""
+    rfm_df['R_score'] = quintile_scores(rfm_df['Recency'], labels=[5, 4, 3, 2, 1], ascending=False)
+    rfm_df['F_score'] = quintile_scores(rfm_df['Frequency'], labels=[1, 2, 3, 4, 5])
+    rfm_df['M_score'] = quintile_scores(rfm_df['Monetary'], labels=[1, 2, 3, 4, 5])
+    rfm_df['Segment'] = assign_rfm_segments(rfm_df)
+    return rfm_df[['ID_phap_nhan', 'Recency', 'Frequency', 'Monetary', 'R_score', 'F_score', 'M_score', 'Segment']]
+
+def calculate_rfm_from_aggregates(rfm_aggregates):
+    """Tính RFM từ bảng R/F/M thô theo pháp nhân (kết quả giống calculate_rfm trên các PO tương ứng)."""
+    if rfm_aggregates.empty:
+        return pd.DataFrame()
+    NOW = pd.to_datetime(datetime.now().date())
+    rfm_df = rfm_aggregates[['ID_phap_nhan', 'last_po_at', 'Frequency', 'Monetary']].copy()
+    rfm_df['Recency'] = (NOW - rfm_df['last_po_at']).dt.days
+    return score_rfm(rfm_df)
 
 def calculate_rfm(df):
-    df = df[df['po_amount'] > 0].copy()
+    df = df[df['po_amount'] > 0]
     if 'ID_phap_nhan' not in df.columns:
         df = df.rename(columns={'ID': 'ID_phap_nhan'})
     df = df.dropna(subset=['ID_phap_nhan'])
@@ -81,95 +313,319 @@ def calculate_rfm(df):
     if df.empty:
         return pd.DataFrame()
     
-    # Tính R, F, M
+    # Tính R, F, M trong một lần groupby
     NOW = pd.to_datetime(datetime.now().date())
-    rfm_r = df.groupby('ID_phap_nhan')['po_created_at'].max().reset_index()
-    rfm_r['Recency'] = (NOW - rfm_r['po_created_at']).dt.days
-    rfm_r = rfm_r[['ID_phap_nhan', 'Recency']]
-    rfm_f = df.groupby('ID_phap_nhan')['po_id'].nunique().reset_index().rename(columns={'po_id': 'Frequency'})
-    rfm_m = df.groupby('ID_phap_nhan')['po_amount'].sum().reset_index().rename(columns={'po_amount': 'Monetary'})
+    rfm_df = df.groupby('ID_phap_nhan').agg(
+        last_po_at=('po_created_at', 'max'),
+        Frequency=('po_id', 'nunique'),
+        Monetary=('po_amount', 'sum'),
+    ).reset_index()
+    rfm_df['Recency'] = (NOW - rfm_df['last_po_at']).dt.days
     
-    rfm_df = pd.merge(rfm_r, rfm_f, on='ID_phap_nhan', how='outer')
-    rfm_df = pd.merge(rfm_df, rfm_m, on='ID_phap_nhan', how='outer')
-    rfm_df['Frequency'] = rfm_df['Frequency'].fillna(0)
-    rfm_df['Monetary'] = rfm_df['Monetary'].fillna(0)
-    
-    # Chia điểm R, F, M (Sử dụng qcut với fallback)
-    def safe_qcut(series, labels, ascending=True):
-        try:
-            return pd.qcut(series, 5, labels=labels, duplicates='drop').astype('Int64')
-        except:
-            rank = series.rank(method='first', ascending=ascending)
-            # Ánh xạ rank sang điểm 1-5
-            return rank.apply(lambda x: min(5, max(1, int(x/len(series)*5)+1)))
-            
-    rfm_df['R_score'] = safe_qcut(rfm_df['Recency'], labels=[5, 4, 3, 2, 1], ascending=False)
-    rfm_df['F_score'] = safe_qcut(rfm_df['Frequency'], labels=[1, 2, 3, 4, 5])
-    rfm_df['M_score'] = safe_qcut(rfm_df['Monetary'], labels=[1, 2, 3, 4, 5])
-    
-    # Tạo Segment
-    def rfm_segment(row):
-        r, f, m = row['R_score'], row['F_score'], row['M_score']
-        if r >= 4 and f >= 4 and m >= 4:
-            return 'Champion'
-        elif r >= 4 and f >= 3:
-            return 'Loyal'
-        elif r >= 3 and m >= 3:
-            return 'Potential'
-        elif r <= 2 and f <= 2:
-            return 'At risk'
-        else:
-            return 'Others'
-            
-    rfm_df['Segment'] = rfm_df.apply(rfm_segment, axis=1)
-    
-    return rfm_df[['ID_phap_nhan', 'Recency', 'Frequency', 'Monetary', 'R_score', 'F_score', 'M_score', 'Segment']]
-# --- Routes Trang (Views) ---
+    # Chia điểm R, F, M (qcut với fallback) và tạo Segment
+    return score_rfm(rfm_df)
+
+def compute_monthly(df):
+    """Tổng giá trị và số lượng PO theo tháng (None nếu không có dữ liệu)."""
+    if df.empty or 'po_created_at' not in df.columns or 'po_id' not in df.columns:
+        return None
+    year_month = df['po_created_at'].dt.to_period('M').astype(str)
+    monthly_agg = df.assign(year_month=year_month).groupby('year_month').agg(
+        po_amount_sum=('po_amount', 'sum'),
+        po_id_count=('po_id', 'count')
+    ).sort_index()
+    return None if monthly_agg.empty else monthly_agg
 
-@app.route('/')
-def index():
-    return render_template('index.html')
+def monthly_from_summary(summary):
+    """Bảng theo tháng (giống compute_monthly) từ tổng hợp của backend."""
+    monthly_agg = pd.DataFrame(summary["monthly"], columns=['year_month', 'po_amount_sum', 'po_id_count'])
+    return None if monthly_agg.empty else monthly_agg.set_index('year_month')
 
-# (Bạn có thể thêm các route khác như /po, /publisher, /manage nếu cần)
-@app.route('/')
-def home():
-    return render_template("index.html")
+def compute_campaign(df):
+    """Doanh thu theo loai_sp: top 8 + 'Khác' (None nếu không có dữ liệu)."""
+    if 'loai_sp' not in df.columns or df['loai_sp'].isna().all():
+        return None
+    return top_campaign(df.groupby('loai_sp')['po_amount'].sum())
 
-@app.route('/publisher')
-def publisher_page():
-    return render_template("publisher.html")
+def campaign_from_summary(summary):
+    """Doanh thu theo loai_sp (giống compute_campaign) từ tổng hợp của backend."""
+    if not summary["campaign"]:
+        return None
+    campaign = pd.DataFrame(summary["campaign"]).set_index('loai_sp')['po_amount_sum']
+    return top_campaign(campaign)
 
-@app.route('/manage')
-def manage_page():
-    return render_template("manage.html")
+def top_campaign(campaign):
+    """Giữ top 8 loai_sp theo doanh thu, gộp phần còn lại thành 'Khác'."""
+    campaign = campaign.sort_values(ascending=False)
 
-@app.route('/po')
-def po_page():
-    return render_template("po.html")
+    if len(campaign) > 8:
+        top = campaign.iloc[:8].copy()
+        others_sum = campaign.iloc[8:].sum()
+        if others_sum > 0:
+            top['Khác'] = others_sum
+        campaign = top
 
-# --- Routes trả về Biểu đồ (Plots) ---
+    if campaign.empty or campaign.sum() == 0:
+        return None
+    return campaign
 
-@app.route('/plot/monthly.png')
-def plot_monthly():
-    try:
-        df = fetch_data() # Lấy tất cả
-        df = apply_filters_to_df(df) # Lọc
-        
-        if df.empty or 'po_created_at' not in df.columns or 'po_id' not in df.columns:
-            return create_error_plot("Không có dữ liệu (sau khi lọc).")
-    except Exception as e:
-        return create_error_plot(f"Lỗi tải dữ liệu:\n{e}")
+def compute_pareto(rfm):
+    """Doanh thu theo Segment kèm tỷ lệ tích lũy (None nếu không có doanh thu)."""
+    seg_summary = rfm.groupby('Segment')['Monetary'].sum().sort_values(ascending=False).reset_index()
+    if seg_summary.empty or seg_summary['Monetary'].sum() == 0:
+        return None
+    seg_summary['cum_percentage'] = seg_summary['Monetary'].cumsum() / seg_summary['Monetary'].sum() * 100
+    return seg_summary
 
-    df['year_month'] = df['po_created_at'].dt.to_period('M').astype(str)
-    
-    monthly_agg = df.groupby('year_month').agg(
-        po_amount_sum=('po_amount', 'sum'),
-        po_id_count=('po_id', 'count')
-    ).sort_index()
+def build_rfm_table(rfm_df, df_filtered):
+    """Bảng RFM chi tiết (kèm tên pháp nhân) dạng list dict để trả JSON."""
+    if 'ten_phap_nhan' not in df_filtered.columns:
+        df_filtered = df_filtered.assign(ten_phap_nhan=None) # Backend chưa gộp được dim_publisher
+    # Lấy metadata Tên Pháp nhân
+    df_publisher_meta = df_filtered.dropna(subset=['ID_phap_nhan']).drop_duplicates(subset=['ID_phap_nhan'])[['ID_phap_nhan', 'ten_phap_nhan']]
+    rfm_df = pd.merge(rfm_df, df_publisher_meta, on='ID_phap_nhan', how='left')
 
-    if monthly_agg.empty:
-        return create_error_plot("Không có dữ liệu (sau khi lọc).")
+    # Chọn và sắp xếp lại cột
+    # SỬA LỖI 2 (KeyError): Dùng tên cột chữ thường
+    rfm_df = rfm_df[[
+        'ID_phap_nhan', 'ten_phap_nhan', 
+        'Segment', 'R_score', 'F_score', 'M_score', # <-- ĐÃ SỬA
+        'Recency', 'Frequency', 'Monetary'
+    ]].sort_values(by=['Monetary','R_score', 'F_score', 'M_score'], ascending=False)
+
+    # Chuẩn hóa kiểu dữ liệu
+    rfm_df['Recency'] = rfm_df['Recency'].astype('Int64').fillna('')
+    rfm_df['Frequency'] = rfm_df['Frequency'].astype('Int64').fillna('')
+    rfm_df['R_score'] = rfm_df['R_score'].astype('Int64').fillna('')
+    rfm_df['F_score'] = rfm_df['F_score'].astype('Int64').fillna('')
+    rfm_df['M_score'] = rfm_df['M_score'].astype('Int64').fillna('')
 
+    return rfm_df.fillna('').to_dict('records')
+
+def build_dashboard_bundle(df, data_version=None, rfm_aggregates=None, summary=None):
+    """
+    Tính cùng lúc dữ liệu cho mọi biểu đồ/bảng của Dashboard từ một lần tải.
+    rfm_aggregates: bảng R/F/M thô theo pháp nhân (nếu có) để tính RFM thay cho df.
+    summary: tổng hợp theo tháng/loại SP của backend (nếu có) thay cho df ở 2 biểu đồ đầu.
+    df có thể là None khi đã có cả rfm_aggregates và summary.
+    """
+    if summary is not None:
+        row_count, po_amount_total = summary["row_count"], summary["po_amount_total"]
+        monthly, campaign = monthly_from_summary(summary), campaign_from_summary(summary)
+    else:
+        row_count = len(df)
+        po_amount_total = df['po_amount'].sum() if 'po_amount' in df.columns else 0
+        monthly, campaign = compute_monthly(df), compute_campaign(df)
+
+    if row_count == 0 or (df is not None and 'po_amount' not in df.columns):
+        rfm = pd.DataFrame()
+    elif rfm_aggregates is not None:
+        rfm = calculate_rfm_from_aggregates(rfm_aggregates)
+    else:
+        rfm = calculate_rfm(df)
+    meta = rfm_aggregates if rfm_aggregates is not None else df
+    return {
+        "data_version": data_version,
+        "row_count": row_count,
+        "po_amount_total": po_amount_total,
+        "monthly": monthly,
+        "campaign": campaign,
+        "rfm": rfm,
+        "pareto": compute_pareto(rfm) if not rfm.empty else None,
+        "rfm_table": build_rfm_table(rfm, meta) if not rfm.empty else [],
+    }
+
+# --- Cache gói dữ liệu Dashboard ---
+# Dashboard gọi song song 3 ảnh + bảng RFM với cùng bộ lọc: chỉ request đầu tiên tải và tính,
+# các request khác chờ khóa của bộ lọc đó rồi dùng chung kết quả (chỉ đọc).
+# Gói hết hạn mà version dữ liệu trên backend chưa đổi thì được dùng tiếp.
+_bundles = {}  # {filter_key: {"bundle": dict, "loaded_at": float}}
+_bundle_lock = threading.Lock()
+_bundle_load_locks = {}  # Mỗi bộ lọc một khóa: {filter_key: {"lock", "users": số request đang giữ/chờ}}
+
+def _filter_key(filters):
+    return tuple(sorted((filters or {}).items()))
+
+def _get_fresh_bundle(key, min_version=None):
+    with _bundle_lock:
+        entry = _bundles.get(key)
+        if entry and time.monotonic() - entry["loaded_at"] < BUNDLE_TTL_SECONDS:
+            version = entry["bundle"]["data_version"]
+            if min_version is None or (version is not None and version >= min_version):
+                return entry["bundle"]
+    return None
+
+def get_dashboard_bundle(filters=None, min_version=None):
+    """
+    Lấy gói dữ liệu Dashboard cho bộ lọc (tải + tính một lần, dùng chung giữa các request).
+    min_version: gói trong cache cũ hơn version này thì hỏi lại backend dù chưa hết hạn.
+    """
+    key = _filter_key(filters)
+    bundle = _get_fresh_bundle(key, min_version)
+    if bundle is not None:
+        return bundle
+
+    with _bundle_lock:
+        load = _bundle_load_locks.setdefault(key, {"lock": threading.Lock(), "users": 0})
+        load["users"] += 1
+    try:
+        with load["lock"]:
+            return _load_dashboard_bundle(key, filters, min_version)
+    finally:
+        with _bundle_lock:
+            load["users"] -= 1
+            # Tải lỗi (không lưu gói) và không còn ai chờ -> bỏ khóa
+            if load["users"] == 0 and key not in _bundles and _bundle_load_locks.get(key) is load:
+                del _bundle_load_locks[key]
+
+def _load_dashboard_bundle(key, filters, min_version):
+    """Tải + tính gói dữ liệu cho bộ lọc `key` (gọi khi giữ khóa của bộ lọc đó)."""
+    # Request khác có thể vừa tính xong trong lúc chờ khóa
+    bundle = _get_fresh_bundle(key, min_version)
+    if bundle is not None:
+        return bundle
+
+    # Gói cũ hết hạn: hỏi version trước, dữ liệu chưa đổi thì không tải lại
+    with _bundle_lock:
+        entry = _bundles.get(key)
+    if entry is not None and entry["bundle"]["data_version"] is not None:
+        if fetch_data_version() == entry["bundle"]["data_version"]:
+            with _bundle_lock:
+                entry["loaded_at"] = time.monotonic()
+            return entry["bundle"]
+
+    # Lỗi -> None, tính từ từng PO như cũ
+    rfm_aggregates = summary = df = None
+    versions = [] # Version của từng phần đã tải
+    if set(filters or {}) <= set(RFM_AGGREGATE_FILTERS):
+        rfm_aggregates, version = fetch_rfm_aggregates(filters, with_version=True)
+        if rfm_aggregates is not None:
+            versions.append(version)
+    if set(filters or {}) <= set(MONTH_SUMMARY_FILTERS):
+        summary, version = fetch_month_summary(filters)
+        if summary is not None:
+            versions.append(version)
+    if rfm_aggregates is None or summary is None:
+        df, version = fetch_data(filters, DASHBOARD_FIELDS, with_version=True)
+        versions.append(version)
+    # Có lần ghi xen giữa các lần tải thì các phần khác version: gói mang version cũ nhất,
+    # request cần version mới hơn sẽ tải lại
+    data_version = None if not versions or None in versions else min(versions)
+    bundle = build_dashboard_bundle(df, data_version, rfm_aggregates, summary)
+    with _bundle_lock:
+        now = time.monotonic()
+        _bundles.pop(key, None)
+        while len(_bundles) >= BUNDLE_MAX_ENTRIES:
+            oldest = min(_bundles, key=lambda k: _bundles[k]["loaded_at"])
+            _bundles.pop(oldest)
+            # Khóa của bộ lọc bị bỏ: chỉ xóa khi không request nào đang giữ/chờ
+            if _bundle_load_locks.get(oldest, {}).get("users") == 0:
+                _bundle_load_locks.pop(oldest)
+        _bundles[key] = {"bundle": bundle, "loaded_at": now}
+    return bundle
+
+# --- Cache ảnh biểu đồ ---
+# Ảnh PNG đã vẽ được giữ theo (route, bộ lọc, version dữ liệu), tối đa PNG_CACHE_MAX_ENTRIES ảnh (LRU).
+# Trả kèm ETag/Last-Modified để trình duyệt hỏi lại và nhận 304 nếu ảnh không đổi.
+_png_cache = OrderedDict()  # {(path, filter_key, data_version): {"png", "etag", "last_modified"}}
+_png_cache_lock = threading.Lock()
+
+def _store_png(key, entry):
+    data_version = key[2]
+    with _png_cache_lock:
+        if any(k[2] > data_version for k in _png_cache):
+            return # Đã có dữ liệu mới hơn, không giữ ảnh cũ
+        # Dữ liệu backend đã đổi -> bỏ ảnh của các version cũ
+        for old_key in [k for k in _png_cache if k[2] < data_version]:
+            del _png_cache[old_key]
+        _png_cache[key] = entry
+        while len(_png_cache) > PNG_CACHE_MAX_ENTRIES:
+            _png_cache.popitem(last=False)
+
+def cached_png(view):
+    """Decorator cho route vẽ biểu đồ: dùng lại ảnh đã vẽ nếu bộ lọc và dữ liệu không đổi."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        filters = get_filter_params()
+        try:
+            data_version = get_dashboard_bundle(filters, get_min_version())["data_version"]
+        except Exception:
+            data_version = None
+        if data_version is None:
+            return view(*args, **kwargs) # Không rõ version (lỗi backend) -> vẽ lại, không cache
+
+        key = (request.path, _filter_key(filters), data_version)
+        with _png_cache_lock:
+            entry = _png_cache.get(key)
+            if entry is not None:
+                _png_cache.move_to_end(key)
+        if entry is None:
+            resp = view(*args, **kwargs)
+            if resp.status_code != 200:
+                return resp
+            png = resp.get_data()
+            entry = {
+                "png": png,
+                "etag": hashlib.md5(png).hexdigest(),
+                "last_modified": datetime.now(timezone.utc).replace(microsecond=0),
+            }
+            _store_png(key, entry)
+
+        resp = Response(entry["png"], mimetype='image/png')
+        resp.set_etag(entry["etag"])
+        resp.last_modified = entry["last_modified"]
+        resp.cache_control.no_cache = True # Trình duyệt luôn hỏi lại (có thể nhận 304)
+        return resp.make_conditional(request)
+    return wrapper
+
+# --- Vẽ biểu đồ PNG ---
+# Mỗi hàm render_* nhận dữ liệu đã tổng hợp, trả về ảnh PNG (bytes); khai báo ở cấp module để
+# chạy được trong tiến trình vẽ riêng. render_png dùng lại ảnh cùng dữ liệu trong cache dùng chung
+# (worker khác đã vẽ) và chuyển việc vẽ sang các tiến trình vẽ nếu bật PLOT_PROCESSES.
+_plot_pool = None
+_plot_pool_lock = threading.Lock()
+
+def _get_plot_pool():
+    """Pool tiến trình vẽ (tạo khi cần), None nếu vẽ ngay trong luồng request."""
+    global _plot_pool
+    if PLOT_PROCESSES <= 0:
+        return None
+    with _plot_pool_lock:
+        if _plot_pool is None:
+            # spawn: không fork tiến trình đang chạy nhiều luồng (và giống hệt trên Windows)
+            _plot_pool = ProcessPoolExecutor(PLOT_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+        return _plot_pool
+
+def _reset_plot_pool(pool):
+    global _plot_pool
+    with _plot_pool_lock:
+        if _plot_pool is pool:
+            _plot_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def render_png(render, *args):
+    """Ảnh PNG do render(*args) vẽ."""
+    key = None
+    if shared_cache is not None:
+        key = ("png", render.__name__, hashlib.sha1(pickle.dumps(args)).hexdigest())
+        png = shared_cache.get(key)
+        if png is not None:
+            return png
+    pool = _get_plot_pool()
+    if pool is None:
+        png = render(*args)
+    else:
+        try:
+            png = pool.submit(render, *args).result()
+        except BrokenProcessPool:
+            # Tiến trình vẽ chết (hết bộ nhớ...) -> tạo pool mới cho lần sau, lần này vẽ tại chỗ
+            _reset_plot_pool(pool)
+            png = render(*args)
+    if key is not None:
+        shared_cache.set(key, png)
+    return png
+
+def render_monthly_png(monthly_agg):
     fig, ax = plt.subplots(figsize=(18, 5)) 
 
     # 1. Vẽ Bar plot (Doanh thu)
@@ -249,81 +705,171 @@ def plot_monthly():
 
     plt.tight_layout()
     
-    png = fig_to_png_bytes(fig)
-    return Response(png, mimetype='image/png')
+    return fig_to_png_bytes(fig)
+
+def render_campaign_png(campaign):
+    fig, ax = plt.subplots(figsize=(7, 7))
+    ax.pie(campaign.values, labels=campaign.index, autopct='%1.1f%%', startangle=140)
+    ax.set_title('Tỷ trọng doanh thu theo loại sản phẩm')
+    plt.tight_layout()
+    
+    return fig_to_png_bytes(fig)
+
+def render_pareto_png(seg_summary):
+    fig, ax1 = plt.subplots(figsize=(10, 7))
+    ax1.bar(seg_summary['Segment'], seg_summary['Monetary'], color='skyblue')
+    ax1.set_xlabel('Phân khúc khách hàng (Segment)')
+    ax1.set_ylabel('Doanh thu (Monetary)')
+    ax1.tick_params(axis='x', rotation=0)
+
+    ax2 = ax1.twinx()
+    ax2.plot(seg_summary['Segment'], seg_summary['cum_percentage'], color='red', marker='o')
+    ax2.set_ylabel('Tỷ lệ tích lũy (%)')
+    ax2.set_ylim(0, 110)
+    ax2.axhline(80, color='green', linestyle='--')
+    ax2.text(len(seg_summary) - 1, 82, '80% Doanh thu', color='green', ha='right')
+
+    plt.title('Pareto Doanh thu theo Phân khúc RFM')
+    plt.tight_layout()
+
+    return fig_to_png_bytes(fig)
+
+# --- Routes Trang (Views) ---
+
+@app.context_processor
+def inject_backend_url():
+    """Địa chỉ backend cho main.js (trình duyệt gọi thẳng backend) và file Chart.js nếu đã có."""
+    chartjs_found = os.path.isfile(os.path.join(app.static_folder, CHARTJS_FILE))
+    return {"backend_api_url": PUBLIC_BACKEND_API_URL, "chartjs_file": CHARTJS_FILE if chartjs_found else None}
+
+@app.route('/')
+def index():
+    return render_template('index.html')
+
+# (Bạn có thể thêm các route khác như /po, /publisher, /manage nếu cần)
+@app.route('/')
+def home():
+    return render_template("index.html")
+
+@app.route('/publisher')
+def publisher_page():
+    return render_template("publisher.html")
+
+@app.route('/manage')
+def manage_page():
+    return render_template("manage.html")
+
+@app.route('/po')
+def po_page():
+    return render_template("po.html")
+
+# --- Routes trả về Biểu đồ (Plots) ---
+
+@app.route('/plot/monthly.png')
+@cached_png
+def plot_monthly():
+    try:
+        monthly_agg = get_dashboard_bundle(get_filter_params(), get_min_version())["monthly"] # Backend đã lọc
+    except Exception as e:
+        return create_error_plot(f"Lỗi tải dữ liệu:\n{e}")
+
+    if monthly_agg is None:
+        return create_error_plot("Không có dữ liệu (sau khi lọc).")
+
+    return Response(render_png(render_monthly_png, monthly_agg), mimetype='image/png')
 
 @app.route('/plot/campaign.png')
+@cached_png
 def plot_campaign():
     try:
-        df = fetch_data() # Lấy tất cả
-        df = apply_filters_to_df(df) # Lọc
+        campaign = get_dashboard_bundle(get_filter_params(), get_min_version())["campaign"] # Backend đã lọc
     except Exception as e:
         return create_error_plot(f"Lỗi tải dữ liệu:\n{e}")
 
-    if 'loai_sp' not in df.columns or df['loai_sp'].isna().all():
+    if campaign is None:
         return create_error_plot("Không có dữ liệu (sau khi lọc).")
 
-    campaign = df.groupby('loai_sp')['po_amount'].sum().sort_values(ascending=False)
-    
-    if len(campaign) > 8:
-        top = campaign.iloc[:8].copy()
-        others_sum = campaign.iloc[8:].sum()
-        if others_sum > 0:
-            top['Khác'] = others_sum
-        campaign = top
-    
-    if campaign.empty or campaign.sum() == 0:
-         return create_error_plot("Không có dữ liệu (sau khi lọc).")
-
-    fig, ax = plt.subplots(figsize=(7, 7))
-    ax.pie(campaign.values, labels=campaign.index, autopct='%1.1f%%', startangle=140)
-    ax.set_title('Tỷ trọng doanh thu theo loại sản phẩm')
-    plt.tight_layout()
-    
-    png = fig_to_png_bytes(fig)
-    return Response(png, mimetype='image/png')
+    return Response(render_png(render_campaign_png, campaign), mimetype='image/png')
 
 @app.route('/plot/pareto.png')
+@cached_png
 def plot_pareto_segment():
     try:
-        df_all = fetch_data() # Lấy tất cả
-        df_filtered = apply_filters_to_df(df_all) # Lọc
+        bundle = get_dashboard_bundle(get_filter_params(), get_min_version()) # Backend đã lọc
         
-        if df_filtered.empty:
+        if bundle["row_count"] == 0:
             return create_error_plot("Không có dữ liệu (sau khi lọc).")
     except Exception as e:
         return create_error_plot(f"Lỗi tải dữ liệu:\n{e}")
 
-    # Tính RFM trên dữ liệu đã lọc
-    rfm = calculate_rfm(df_filtered)
-    
-    if rfm.empty:
+    # RFM đã tính sẵn trên dữ liệu đã lọc
+    if bundle["rfm"].empty:
         return create_error_plot("Không thể tính RFM (sau khi lọc).")
 
-    seg_summary = rfm.groupby('Segment')['Monetary'].sum().sort_values(ascending=False).reset_index()
-    if seg_summary.empty or seg_summary['Monetary'].sum() == 0:
+    seg_summary = bundle["pareto"]
+    if seg_summary is None:
         return create_error_plot("Không có doanh thu (sau khi lọc).")
 
-    seg_summary['cum_percentage'] = seg_summary['Monetary'].cumsum() / seg_summary['Monetary'].sum() * 100
+    return Response(render_png(render_pareto_png, seg_summary), mimetype='image/png')
 
-    fig, ax1 = plt.subplots(figsize=(10, 7))
-    ax1.bar(seg_summary['Segment'], seg_summary['Monetary'], color='skyblue')
-    ax1.set_xlabel('Phân khúc khách hàng (Segment)')
-    ax1.set_ylabel('Doanh thu (Monetary)')
-    ax1.tick_params(axis='x', rotation=0)
+# --- Routes trả về dữ liệu Biểu đồ (JSON, để vẽ trên trình duyệt) ---
+# Cùng dữ liệu với các ảnh PNG ở trên nhưng chỉ gồm chuỗi số đã tổng hợp.
 
-    ax2 = ax1.twinx()
-    ax2.plot(seg_summary['Segment'], seg_summary['cum_percentage'], color='red', marker='o')
-    ax2.set_ylabel('Tỷ lệ tích lũy (%)')
-    ax2.set_ylim(0, 110)
-    ax2.axhline(80, color='green', linestyle='--')
-    ax2.text(len(seg_summary) - 1, 82, '80% Doanh thu', color='green', ha='right')
+@app.route('/api/chart/monthly', methods=['GET'])
+def api_chart_monthly():
+    """API: Tổng giá trị (sum) và số lượng (count) PO theo tháng."""
+    try:
+        monthly_agg = get_dashboard_bundle(get_filter_params(), get_min_version())["monthly"] # Backend đã lọc
+    except Exception as e:
+        return jsonify({"message": f"Lỗi tải dữ liệu: {e}", "data": None}), 500
 
-    plt.title('Pareto Doanh thu theo Phân khúc RFM')
-    plt.tight_layout()
+    if monthly_agg is None:
+        return jsonify({"message": "Không có dữ liệu (sau khi lọc).", "data": None}), 200
 
-    png = fig_to_png_bytes(fig)
-    return Response(png, mimetype='image/png')
+    return jsonify({"message": "Dữ liệu biểu đồ đã sẵn sàng.", "data": {
+        "labels": monthly_agg.index.tolist(),
+        "po_amount_sum": monthly_agg['po_amount_sum'].tolist(),
+        "po_id_count": monthly_agg['po_id_count'].tolist(),
+    }})
+
+@app.route('/api/chart/campaign', methods=['GET'])
+def api_chart_campaign():
+    """API: Doanh thu và tỷ trọng (%) theo loại sản phẩm (top 8 + 'Khác')."""
+    try:
+        campaign = get_dashboard_bundle(get_filter_params(), get_min_version())["campaign"] # Backend đã lọc
+    except Exception as e:
+        return jsonify({"message": f"Lỗi tải dữ liệu: {e}", "data": None}), 500
+
+    if campaign is None:
+        return jsonify({"message": "Không có dữ liệu (sau khi lọc).", "data": None}), 200
+
+    return jsonify({"message": "Dữ liệu biểu đồ đã sẵn sàng.", "data": {
+        "labels": [str(label) for label in campaign.index],
+        "po_amount_sum": campaign.tolist(),
+        "percentage": (campaign / campaign.sum() * 100).tolist(),
+    }})
+
+@app.route('/api/chart/pareto', methods=['GET'])
+def api_chart_pareto():
+    """API: Doanh thu theo Segment RFM và tỷ lệ tích lũy (%)."""
+    try:
+        bundle = get_dashboard_bundle(get_filter_params(), get_min_version()) # Backend đã lọc
+    except Exception as e:
+        return jsonify({"message": f"Lỗi tải dữ liệu: {e}", "data": None}), 500
+
+    if bundle["row_count"] == 0:
+        return jsonify({"message": "Không có dữ liệu (sau khi lọc).", "data": None}), 200
+    if bundle["rfm"].empty:
+        return jsonify({"message": "Không thể tính RFM (sau khi lọc).", "data": None}), 200
+    seg_summary = bundle["pareto"]
+    if seg_summary is None:
+        return jsonify({"message": "Không có doanh thu (sau khi lọc).", "data": None}), 200
+
+    return jsonify({"message": "Dữ liệu biểu đồ đã sẵn sàng.", "data": {
+        "labels": seg_summary['Segment'].tolist(),
+        "monetary": seg_summary['Monetary'].tolist(),
+        "cum_percentage": seg_summary['cum_percentage'].tolist(),
+    }})
 
 def filter_by_top_revenue_contribution(df, threshold=0.8):
     if df.empty or 'ID_phap_nhan' not in df.columns or 'po_amount' not in df.columns:
@@ -355,9 +901,8 @@ def filter_by_top_revenue_contribution(df, threshold=0.8):
 @app.route('/api/rfm-data', methods=['GET'])
 def api_rfm_data():
     try:
-        df_all = fetch_data() # Lấy tất cả   
-        df_filtered = apply_filters_to_df(df_all) # Lọc
-        if df_filtered.empty or df_filtered['po_amount'].sum() == 0:
+        bundle = get_dashboard_bundle(get_filter_params(), get_min_version()) # Backend đã lọc
+        if bundle["row_count"] == 0 or bundle["po_amount_total"] == 0:
             return jsonify({
                 "message": "Không có dữ liệu PO hợp lệ (sau khi lọc).", 
                 "data": []
@@ -370,40 +915,28 @@ def api_rfm_data():
 
     # THAY ĐỔI MỚI: Chỉ lấy dữ liệu của pháp nhân đóng góp >= 80% doanh thu
     # df_rfm_input = filter_by_top_revenue_contribution(df_filtered, 0.8) # Ngưỡng 80%
-    df_rfm_input = df_filtered
 
-    if df_rfm_input.empty:
-        return jsonify({"message": "Không có dữ liệu pháp nhân Top 80% doanh thu.", "data": []}), 200
-        
-    # Tính RFM trên dữ liệu đã lọc (Top 80%)
-    rfm_df = calculate_rfm(df_rfm_input)
-    
-    if rfm_df.empty:
+    # RFM đã tính sẵn trên dữ liệu đã lọc (Top 80%)
+    if bundle["rfm"].empty:
         return jsonify({"message": "Không thể tính RFM (sau khi lọc Top 80%).", "data": []}), 200
-        
-    # Lấy metadata Tên Pháp nhân
-    df_publisher_meta = df_all.dropna(subset=['ID_phap_nhan']).drop_duplicates(subset=['ID_phap_nhan'])[['ID_phap_nhan', 'ten_phap_nhan']]
-    rfm_df = pd.merge(rfm_df, df_publisher_meta, on='ID_phap_nhan', how='left')
-    
-    # Chọn và sắp xếp lại cột
-    # SỬA LỖI 2 (KeyError): Dùng tên cột chữ thường
-    rfm_df = rfm_df[[
-        'ID_phap_nhan', 'ten_phap_nhan', 
-        'Segment', 'R_score', 'F_score', 'M_score', # <-- ĐÃ SỬA
-        'Recency', 'Frequency', 'Monetary'
-    ]].sort_values(by=['Monetary','R_score', 'F_score', 'M_score'], ascending=False)
-    
-    # Chuẩn hóa kiểu dữ liệu
-    rfm_df['Recency'] = rfm_df['Recency'].astype('Int64').fillna('')
-    rfm_df['Frequency'] = rfm_df['Frequency'].astype('Int64').fillna('')
-    rfm_df['R_score'] = rfm_df['R_score'].astype('Int64').fillna('')
-    rfm_df['F_score'] = rfm_df['F_score'].astype('Int64').fillna('')
-    rfm_df['M_score'] = rfm_df['M_score'].astype('Int64').fillna('')
 
-    rfm_data_list = rfm_df.fillna('').to_dict('records')
+    rfm_data_list = bundle["rfm_table"]
 
     return jsonify({"message": "Dữ liệu RFM đã sẵn sàng.", "data": rfm_data_list})
 
+def create_app():
+    """
+    Ứng dụng cho WSGI server; frontend chạy được nhiều tiến trình, vd:
+        gunicorn -w 4 --threads 4 -b 0.0.0.0:8000 "frontend:create_app()"
+        waitress-serve --threads=8 --port=8000 --call frontend:create_app
+    Đặt SHARED_CACHE_DIR để các worker dùng chung bản sao dữ liệu và ảnh đã vẽ.
+    """
+    return app
+
 if __name__ == '__main__':
-    # Chạy trên port 8000
-    app.run(port=8000, debug=True)
\ No newline at end of file
+    if APP_ENV == "production":
+        from waitress import serve
+        serve(create_app(), host=FRONTEND_HOST, port=FRONTEND_PORT, threads=FRONTEND_THREADS)
+    else:
+        # Chạy trên port 8000
+        app.run(host=FRONTEND_HOST, port=FRONTEND_PORT, debug=True)
\ No newline at end of file
@@ -0,0 +1,115 @@
+"""
+Cache dùng chung giữa các tiến trình (worker) chạy trên cùng một máy.
+
+Mỗi mục là một file trong thư mục chung, tên file = sha1 của key. Ghi vào file tạm rồi
+đổi tên (os.replace) nên tiến trình khác không bao giờ đọc phải file đang ghi dở.
+Tổng dung lượng vượt max_bytes thì xóa các mục lâu không dùng nhất.
+Dữ liệu đọc từ thư mục chỉ là bytes/JSON (không pickle); thư mục chỉ user chạy ứng dụng được ghi.
+"""
+import hashlib
+import json
+import os
+import stat
+import threading
+
+
+class SharedFileCache:
+    """Cache key -> bytes (hoặc giá trị JSON) trên thư mục dùng chung."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._check_directory()
+        self._lock = threading.Lock()
+        self._written = 0  # Số byte đã ghi kể từ lần dọn gần nhất
+
+    def _check_directory(self):
+        """Từ chối thư mục của user khác hoặc user khác ghi được (họ có thể đặt dữ liệu giả vào cache)."""
+        if not hasattr(os, "getuid"):
+            return # Windows: quyền theo ACL, không kiểm tra được theo kiểu POSIX
+        info = os.stat(self.directory)
+        if not stat.S_ISDIR(info.st_mode):
+            raise PermissionError(f"'{self.directory}' không phải thư mục")
+        if info.st_uid != os.getuid():
+            raise PermissionError(f"Thư mục cache '{self.directory}' thuộc user khác (uid {info.st_uid})")
+        if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            raise PermissionError(
+                f"Thư mục cache '{self.directory}' cho user khác ghi (quyền {stat.filemode(info.st_mode)}); "
+                f"chạy: chmod 700 {self.directory}"
+            )
+
+    def _path(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest + ".bin")
+
+    def get(self, key):
+        """Dữ liệu (bytes) của key, hoặc None nếu chưa có."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            os.utime(path)  # Đánh dấu vừa dùng (dọn theo thời điểm dùng gần nhất)
+        except OSError:
+            pass
+        return data
+
+    def set(self, key, data):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # Không ghi được (đầy đĩa, file đang bị mở trên Windows...) -> bỏ qua, lần sau ghi lại
+            print(f"Lỗi ghi cache dùng chung: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self._written += len(data)
+            if self._written < self.max_bytes // 10:
+                return
+            self._written = 0
+        self._evict()
+
+    def get_json(self, key):
+        """Giá trị đã lưu bằng set_json, hoặc None nếu chưa có/không đọc được."""
+        data = self.get(key)
+        if data is None:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError:
+            return None
+
+    def set_json(self, key, value):
+        self.set(key, json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+    def _evict(self):
+        """Xóa các mục lâu không dùng nhất cho tới khi tổng dung lượng <= max_bytes."""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(".bin"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
@@ -1,5 +1,5 @@
-// Cấu hình URL backend
-const BACKEND_API_URL = "http://127.0.0.1:5000/api";
+// Cấu hình URL backend (frontend đưa vào trang theo biến môi trường PUBLIC_BACKEND_API_URL)
+const BACKEND_API_URL = window.BACKEND_API_URL || "http://127.0.0.1:5000/api";
 
 // Chạy code khi DOM đã tải xong
 document.addEventListener('DOMContentLoaded', () => {
@@ -259,30 +259,260 @@ async function loadRfmDetailTable(filterParams) {
 }
 
 
+// --- BIỂU ĐỒ VẼ TRÊN TRÌNH DUYỆT (Chart.js) ---
+// Chế độ 'browser': lấy chuỗi số từ /api/chart/* và vẽ bằng Chart.js.
+// Chế độ 'png': dùng ảnh do server vẽ (/plot/*.png), cũng là link "Tải ảnh PNG".
+const CHART_NAMES = ['monthly', 'campaign', 'pareto'];
+const CHART_MODE_KEY = 'dashboardChartMode';
+const dashboardCharts = {}; // Chart.js instance theo tên biểu đồ
+const chartRequestSeqs = {}; // Theo tên biểu đồ: bỏ qua kết quả của lần tải cũ về muộn
+
+/**
+ * Lấy chế độ vẽ biểu đồ đang chọn ('browser' hoặc 'png')
+ */
+function getChartMode() {
+    if (!window.Chart) return 'png'; // Không tải được Chart.js -> dùng ảnh PNG
+    const select = document.getElementById('chart-mode');
+    return select ? select.value : 'png';
+}
+
+/**
+ * Hiện canvas hoặc ảnh PNG của một biểu đồ theo chế độ
+ */
+function setChartVisibility(name, mode) {
+    const wrap = document.getElementById(`canvas-wrap-${name}`);
+    const img = document.getElementById(`plot-${name}`);
+    if (wrap) wrap.hidden = mode !== 'browser';
+    if (img) img.hidden = mode === 'browser';
+}
+
+/**
+ * Hiển thị thông báo thay cho biểu đồ (rỗng = ẩn thông báo)
+ */
+function setChartMessage(name, message) {
+    const wrap = document.getElementById(`canvas-wrap-${name}`);
+    if (!wrap) return;
+    const messageEl = wrap.querySelector('.chart-message');
+    messageEl.textContent = message;
+    messageEl.hidden = !message;
+    if (message && dashboardCharts[name]) {
+        dashboardCharts[name].destroy();
+        delete dashboardCharts[name];
+    }
+}
+
+function formatNumber(value) {
+    return new Intl.NumberFormat('vi-VN').format(value);
+}
+
+/**
+ * Tạo cấu hình Chart.js cho từng biểu đồ từ dữ liệu /api/chart/<name>
+ */
+function buildChartConfig(name, data) {
+    if (name === 'monthly') {
+        return {
+            type: 'bar',
+            data: {
+                labels: data.labels,
+                datasets: [
+                    { type: 'bar', label: 'Tổng giá trị PO (Sum)', data: data.po_amount_sum, yAxisID: 'y', order: 2 },
+                    { type: 'line', label: 'Số lượng PO (Count)', data: data.po_id_count, yAxisID: 'y1', order: 1 },
+                ],
+            },
+            options: {
+                maintainAspectRatio: false,
+                scales: {
+                    y: { title: { display: true, text: 'Giá trị PO (Sum)' }, ticks: { callback: formatNumber } },
+                    y1: { position: 'right', title: { display: true, text: 'Số lượng PO (Count)' }, grid: { drawOnChartArea: false } },
+                },
+                plugins: {
+                    tooltip: { callbacks: { label: (ctx) => `${ctx.dataset.label}: ${formatNumber(ctx.parsed.y)}` } },
+                },
+            },
+        };
+    }
+    if (name === 'campaign') {
+        return {
+            type: 'pie',
+            data: { labels: data.labels, datasets: [{ data: data.po_amount_sum }] },
+            options: {
+                maintainAspectRatio: false,
+                plugins: {
+                    tooltip: {
+                        callbacks: {
+                            label: (ctx) => `${formatNumber(ctx.parsed)} (${data.percentage[ctx.dataIndex].toFixed(1)}%)`,
+                        },
+                    },
+                },
+            },
+        };
+    }
+    // Pareto: doanh thu theo Segment + đường tích lũy, mốc 80%
+    return {
+        type: 'bar',
+        data: {
+            labels: data.labels,
+            datasets: [
+                { type: 'bar', label: 'Doanh thu (Monetary)', data: data.monetary, yAxisID: 'y', backgroundColor: 'skyblue', order: 2 },
+                { type: 'line', label: 'Tỷ lệ tích lũy (%)', data: data.cum_percentage, yAxisID: 'y1', borderColor: 'red', backgroundColor: 'red', order: 1 },
+                { type: 'line', label: '80% Doanh thu', data: data.labels.map(() => 80), yAxisID: 'y1', borderColor: 'green', borderDash: [6, 4], pointRadius: 0, order: 0 },
+            ],
+        },
+        options: {
+            maintainAspectRatio: false,
+            scales: {
+                x: { title: { display: true, text: 'Phân khúc khách hàng (Segment)' } },
+                y: { title: { display: true, text: 'Doanh thu (Monetary)' }, ticks: { callback: formatNumber } },
+                y1: { position: 'right', min: 0, max: 110, title: { display: true, text: 'Tỷ lệ tích lũy (%)' }, grid: { drawOnChartArea: false } },
+            },
+        },
+    };
+}
+
+/**
+ * Tải dữ liệu và vẽ một biểu đồ trên trình duyệt
+ */
+async function loadBrowserChart(name, queryString, seq) {
+    try {
+        const response = await fetch(`/api/chart/${name}?${queryString}`);
+        const result = await response.json();
+        if (seq !== chartRequestSeqs[name]) return; // Đã có lần tải mới hơn
+        if (!response.ok || !result.data) {
+            setChartMessage(name, result.message || `Lỗi HTTP: ${response.status}`);
+            return;
+        }
+        setChartMessage(name, '');
+        if (dashboardCharts[name]) dashboardCharts[name].destroy();
+        const canvas = document.getElementById(`chart-${name}`);
+        dashboardCharts[name] = new Chart(canvas, buildChartConfig(name, result.data));
+    } catch (error) {
+        if (seq === chartRequestSeqs[name]) setChartMessage(name, `Lỗi tải dữ liệu: ${error.message}`);
+    }
+}
+
 /**
- * Cập nhật tất cả biểu đồ và bảng dựa trên tham số lọc
+ * Cập nhật biểu đồ và bảng dựa trên tham số lọc
+ * @param {Object} params - Tham số lọc
+ * @param {Object} options - widgets: chỉ tải lại các phần này (mặc định tất cả);
+ *                           minVersion: version dữ liệu tối thiểu (khi nhận sự kiện thay đổi)
  */
-function updateDashboard(params) {
+function updateDashboard(params, { widgets = DASHBOARD_WIDGETS, minVersion = null } = {}) {
     const queryString = new URLSearchParams(params).toString();
-    
-    // Cập nhật URL các biểu đồ PNG
-    const monthlyChart = document.getElementById('plot-monthly');
-    const campaignChart = document.getElementById('plot-campaign');
-    const paretoChart = document.getElementById('plot-pareto');
+    // Tải lại do dữ liệu đổi: báo frontend không dùng gói dữ liệu cũ trong cache
+    const loadQuery = minVersion === null ? queryString
+        : new URLSearchParams({ ...params, min_version: minVersion }).toString();
+    const mode = getChartMode();
+
+    CHART_NAMES.filter(name => widgets.includes(name)).forEach(name => {
+        setChartVisibility(name, mode);
+        const seq = chartRequestSeqs[name] = (chartRequestSeqs[name] || 0) + 1;
 
-    if (monthlyChart) monthlyChart.src = `/plot/monthly.png?${queryString}`;
-    if (campaignChart) campaignChart.src = `/plot/campaign.png?${queryString}`;
-    if (paretoChart) paretoChart.src = `/plot/pareto.png?${queryString}`;
+        // Link xuất ảnh PNG luôn theo bộ lọc hiện tại
+        const exportLink = document.getElementById(`export-${name}`);
+        if (exportLink) exportLink.href = `/plot/${name}.png?${queryString}`;
+
+        if (mode === 'browser') {
+            loadBrowserChart(name, loadQuery, seq);
+        } else {
+            // Cập nhật URL các biểu đồ PNG
+            const img = document.getElementById(`plot-${name}`);
+            if (img) img.src = `/plot/${name}.png?${loadQuery}`;
+        }
+    });
 
     // GỌI HÀM MỚI: Tải bảng chi tiết RFM
-    loadRfmDetailTable(params);
+    if (widgets.includes('rfm')) {
+        loadRfmDetailTable(minVersion === null ? params : { ...params, min_version: minVersion }, { quiet: minVersion !== null });
+    }
+}
+
+// --- CẬP NHẬT TỰ ĐỘNG (Server-Sent Events) ---
+// Backend gửi một sự kiện mỗi khi PO/pháp nhân được tạo/sửa; dashboard chỉ tải lại
+// các phần dùng tới cột bị đổi, thay vì người dùng phải bấm lọc lại để thấy số mới.
+const DASHBOARD_WIDGETS = [...CHART_NAMES, 'rfm'];
+const LIVE_REFRESH_DELAY_MS = 500; // Gộp các sự kiện đến liền nhau thành một lần tải lại
+// Các cột dữ liệu mỗi phần của dashboard dùng
+const WIDGET_FIELDS = {
+    monthly: ['po_created_at', 'po_amount', 'po_id'],
+    campaign: ['loai_sp', 'po_amount'],
+    pareto: ['ID_phap_nhan', 'po_id', 'po_amount', 'po_created_at'],
+    rfm: ['ID_phap_nhan', 'ten_phap_nhan', 'po_id', 'po_amount', 'po_created_at'],
+};
+// Cột mà mỗi ô lọc dựa vào: đang lọc theo cột bị đổi thì mọi phần đều có thể đổi
+const FILTER_FIELDS = {
+    start_date: 'po_created_at',
+    end_date: 'po_created_at',
+    loai_sp: 'loai_sp',
+    ten_phap_nhan: 'ten_phap_nhan',
+};
+
+/**
+ * Các phần của dashboard bị ảnh hưởng bởi một sự kiện thay đổi
+ */
+function affectedWidgets(event, params) {
+    if (event.action === 'connected') return [];
+    if (!Array.isArray(event.fields)) return DASHBOARD_WIDGETS; // 'reload' hoặc không rõ cột
+    const fields = new Set(event.fields);
+    // Đổi ID pháp nhân làm thay đổi cách ghép PO với pháp nhân
+    if (event.table === 'dim_publisher' && event.action === 'update' && fields.has('ID_phap_nhan')) {
+        return DASHBOARD_WIDGETS;
+    }
+    const filtered = Object.keys(params).some(key => fields.has(FILTER_FIELDS[key]));
+    if (filtered) return DASHBOARD_WIDGETS;
+    return DASHBOARD_WIDGETS.filter(name => WIDGET_FIELDS[name].some(field => fields.has(field)));
+}
+
+/**
+ * Nghe sự kiện thay đổi từ backend và tải lại các phần bị ảnh hưởng
+ */
+function subscribeDashboardChanges() {
+    if (!window.EventSource) return; // Trình duyệt không hỗ trợ -> chỉ cập nhật khi lọc lại
+    const pending = new Set();
+    let minVersion = null;
+    let timer = null;
+
+    const source = new EventSource(`${BACKEND_API_URL}/events`);
+    source.onmessage = (message) => {
+        let event;
+        try {
+            event = JSON.parse(message.data);
+        } catch (error) {
+            return;
+        }
+        const widgets = affectedWidgets(event, getFilterParams());
+        if (widgets.length === 0) return;
+        widgets.forEach(name => pending.add(name));
+        minVersion = Math.max(minVersion || 0, event.version || 0);
+        if (timer) return;
+        timer = setTimeout(() => {
+            const names = [...pending];
+            const version = minVersion;
+            pending.clear();
+            minVersion = null;
+            timer = null;
+            updateDashboard(getFilterParams(), { widgets: names, minVersion: version });
+        }, LIVE_REFRESH_DELAY_MS);
+    };
+    // Mất kết nối: EventSource tự kết nối lại (kèm Last-Event-ID), backend gửi 'reload' nếu đã lỡ sự kiện
+    window.addEventListener('beforeunload', () => source.close());
 }
 
 function initDashboardFilters() {
     const filterForm = document.getElementById('filter-form');
+    const chartModeSelect = document.getElementById('chart-mode');
+
+    // 0. Chế độ vẽ biểu đồ: nhớ lựa chọn trước đó, đổi chế độ thì vẽ lại
+    if (chartModeSelect) {
+        chartModeSelect.value = localStorage.getItem(CHART_MODE_KEY) || (window.Chart ? 'browser' : 'png');
+        chartModeSelect.addEventListener('change', () => {
+            localStorage.setItem(CHART_MODE_KEY, chartModeSelect.value);
+            updateDashboard(getFilterParams());
+        });
+    }
     
-    // 1. Tải dashboard lần đầu
+    // 1. Tải dashboard lần đầu, rồi tự cập nhật khi dữ liệu đổi
     updateDashboard(getFilterParams()); 
+    subscribeDashboardChanges();
 
     // 2. Xử lý sự kiện Submit Form (Áp dụng filter)
     filterForm.addEventListener('submit', (event) => {
@@ -296,6 +526,10 @@ function initDashboardFilters() {
     if (resetBtn) {
         resetBtn.addEventListener('click', (event) => {
             setTimeout(() => {
+                // Nút reset cũng đưa ô chọn chế độ về mặc định -> lấy lại lựa chọn đã lưu
+                if (chartModeSelect) {
+                    chartModeSelect.value = localStorage.getItem(CHART_MODE_KEY) || chartModeSelect.value;
+                }
                 // Tải lại dashboard với filter rỗng
                 updateDashboard({}); 
             }, 50);
@@ -306,7 +540,7 @@ function initDashboardFilters() {
 /**
  * Tải và hiển thị Bảng Chi tiết Pháp nhân RFM
  */
-async function loadRfmDetailTable(filterParams) {
+async function loadRfmDetailTable(filterParams, { quiet = false } = {}) {
     const container = document.getElementById('rfm-detail-table-container');
     if (!container) return;
 
@@ -314,7 +548,8 @@ async function loadRfmDetailTable(filterParams) {
     const urlParams = new URLSearchParams(filterParams).toString();
     const apiUrl = `/api/rfm-data?${urlParams}`;
     
-    container.innerHTML = `<p>Đang tải dữ liệu RFM...</p>`;
+    // Tự cập nhật (quiet): giữ bảng cũ cho tới khi có dữ liệu mới
+    if (!quiet) container.innerHTML = `<p>Đang tải dữ liệu RFM...</p>`;
 
     try {
         const response = await fetch(apiUrl);
@@ -394,121 +629,300 @@ function escapeHTML(str) {
          .replace(/'/g, '&#039;');
 }
 
+// Bảng quản lý: số dòng mỗi lần tải và số dòng vẽ thêm ngoài vùng nhìn thấy
+const MANAGE_PAGE_SIZE = 100;
+const MANAGE_OVERSCAN = 20;
+// Các bảng cuộn ảo trên trang quản lý, theo loại hàng ('publisher' / 'po')
+const manageTables = {};
+
 /**
  * Khởi tạo logic cho trang Quản lý Dữ liệu
  */
 async function initManagePage() {
-    const pubTableBody = document.querySelector('#publisher-table tbody');
-    const poTableBody = document.querySelector('#po-table tbody');
+    const pubTable = document.getElementById('publisher-table');
+    const poTable = document.getElementById('po-table');
 
-    if (!pubTableBody || !poTableBody) return;
+    if (!pubTable || !poTable) return;
 
-    // 1. Load data
-    try {
-        const [pubRes, poRes] = await Promise.all([
-            fetch(`${BACKEND_API_URL}/publishers`),
-            fetch(`${BACKEND_API_URL}/pos`) // Endpoint mới
-        ]);
-        
-        if (!pubRes.ok || !poRes.ok) {
-            throw new Error('Lỗi khi tải dữ liệu từ server');
-        }
-        
-        let publishers = await pubRes.json();
-        let pos = await poRes.json();
-        
-        // ===================================================
-        // ✨ THÊM BƯỚC SẮP XẾP GIẢM DẦN THEO ID TẠI ĐÂY ✨
-        // ===================================================
-        
-        // Sắp xếp Pháp nhân (publishers) theo ID_phap_nhan giảm dần
-        publishers.sort((a, b) => b.ID_phap_nhan - a.ID_phap_nhan); 
-        
-        // Sắp xếp PO (pos) theo po_id giảm dần
-        pos.sort((a, b) => b.po_id - a.po_id); 
+    // 1. Tạo bảng: chỉ tải từng trang (server đã lọc và sắp xếp theo ID giảm dần)
+    manageTables.publisher = createVirtualTable({
+        table: pubTable,
+        endpoint: `${BACKEND_API_URL}/publishers`,
+        idField: 'ID_phap_nhan',
+        buildRow: buildPublisherRow,
+    });
+    manageTables.po = createVirtualTable({
+        table: poTable,
+        endpoint: `${BACKEND_API_URL}/pos`,
+        idField: 'po_id',
+        buildRow: buildPoRow,
+    });
 
-        // ===================================================
+    // 2. Thêm event listeners (dùng event delegation)
+    pubTable.tBodies[0].addEventListener('click', handleTableClick);
+    poTable.tBodies[0].addEventListener('click', handleTableClick);
 
-        // Render dữ liệu đã được sắp xếp
-        renderPublisherTable(publishers, pubTableBody);
-        renderPoTable(pos, poTableBody);
-        
-    } catch (error) {
-        showMessage(`Lỗi tải dữ liệu trang quản lý: ${error.message}`, true);
-        pubTableBody.innerHTML = `<tr><td colspan="6" style="color: red;">Lỗi tải dữ liệu.</td></tr>`;
-        poTableBody.innerHTML = `<tr><td colspan="10" style="color: red;">Lỗi tải dữ liệu.</td></tr>`;
+    const saveAllBtn = document.getElementById('save-all-btn');
+    if (saveAllBtn) {
+        saveAllBtn.addEventListener('click', () => handleSaveAllClick(saveAllBtn));
     }
-    
-    // 2. Thêm event listeners (dùng event delegation)
-    pubTableBody.addEventListener('click', handleTableClick);
-    poTableBody.addEventListener('click', handleTableClick);
+
+    await Promise.all(Object.values(manageTables).map(table => table.reload()));
 }
 
 /**
- * Vẽ bảng Pháp nhân
+ * Hàng đang ở chế độ Sửa (hoặc đang lưu)
  */
-function renderPublisherTable(publishers, tbody) {
-    // Cột: ID_phap_nhan, ma_phap_nhan, ten_phap_nhan, loai_phap_nhan, client_code
-    tbody.innerHTML = '';
-    if (publishers.length === 0) {
-        tbody.innerHTML = '<tr><td colspan="6">Không có dữ liệu.</td></tr>';
-        return;
+function isEditingRow(row) {
+    return row.querySelector('.btn-save, .actions button:disabled') !== null;
+}
+
+/**
+ * Bảng cuộn ảo: chỉ tải các trang cần xem (lọc/sắp xếp ở server) và chỉ vẽ các hàng đang nhìn thấy.
+ * Hai hàng đệm đầu/cuối tbody giữ chiều cao cuộn đúng với tổng số hàng.
+ * Hàng đang sửa được giữ lại khi cuộn khỏi vùng nhìn thấy để không mất dữ liệu đang nhập.
+ * Ô tiêu đề có data-field sẽ có ô lọc; ô tiêu đề của idField bấm để đổi chiều sắp xếp.
+ */
+function createVirtualTable({ table, endpoint, idField, buildRow }) {
+    const scroller = table.closest('.table-scroll');
+    const tbody = table.tBodies[0];
+    const headers = Array.from(table.tHead.rows[0].cells);
+    const columnCount = headers.length;
+    const state = {
+        total: 0,
+        pages: new Map(),   // số trang -> mảng dòng, hoặc Promise khi đang tải
+        filters: {},
+        order: 'desc',
+        rowHeight: 40,      // Ước lượng, đo lại sau khi vẽ hàng đầu tiên
+        measured: false,
+        generation: 0,      // Tăng khi lọc/sắp xếp lại: bỏ qua kết quả của các lần tải cũ
+        pinned: new Map(),  // id -> <tr> đang sửa
+        renderQueued: false,
+    };
+
+    function pageUrl(page) {
+        const params = new URLSearchParams({
+            limit: MANAGE_PAGE_SIZE,
+            offset: page * MANAGE_PAGE_SIZE,
+            sort: idField,
+            order: state.order,
+        });
+        for (const [field, value] of Object.entries(state.filters)) {
+            if (value) params.set(field, value);
+        }
+        return `${endpoint}?${params}`;
     }
-    
-    for (const pub of publishers) {
+
+    function loadPage(page) {
+        if (!state.pages.has(page)) {
+            const generation = state.generation;
+            const request = fetch(pageUrl(page))
+                .then(response => {
+                    if (!response.ok) throw new Error('Lỗi khi tải dữ liệu từ server');
+                    return response.json();
+                })
+                .then(result => {
+                    if (generation !== state.generation) return;
+                    state.total = result.total;
+                    state.pages.set(page, result.items);
+                    render();
+                })
+                .catch(error => {
+                    if (generation !== state.generation) return;
+                    state.pages.delete(page); // Lần cuộn sau tải lại
+                    showMessage(`Lỗi tải dữ liệu trang quản lý: ${error.message}`, true);
+                    if (state.total === 0) showStatus('Lỗi tải dữ liệu.', true);
+                });
+            state.pages.set(page, request);
+        }
+        return state.pages.get(page);
+    }
+
+    function showStatus(message, isError = false) {
+        const style = isError ? ' style="color: red;"' : '';
+        tbody.innerHTML = `<tr><td colspan="${columnCount}"${style}>${message}</td></tr>`;
+    }
+
+    function spacerRow(height) {
         const row = document.createElement('tr');
-        row.dataset.id = pub.ID_phap_nhan;
-        row.dataset.type = 'publisher';
-        row.innerHTML = `
-            <td data-field="ID_phap_nhan">${pub.ID_phap_nhan}</td>
-            <td data-field="ma_phap_nhan" data-original-value="${escapeHTML(pub.ma_phap_nhan)}">${escapeHTML(pub.ma_phap_nhan)}</td>
-            <td data-field="ten_phap_nhan" data-original-value="${escapeHTML(pub.ten_phap_nhan)}">${escapeHTML(pub.ten_phap_nhan)}</td>
-            <td data-field="loai_phap_nhan" data-original-value="${escapeHTML(pub.loai_phap_nhan)}">${escapeHTML(pub.loai_phap_nhan)}</td>
-            <td data-field="client_code" data-original-value="${escapeHTML(pub.client_code)}">${escapeHTML(pub.client_code)}</td>
-            <td class="actions">
-                <button class="btn btn-edit">Sửa</button>
-            </td>
-        `;
-        tbody.appendChild(row);
+        row.className = 'virtual-spacer';
+        row.innerHTML = `<td colspan="${columnCount}" style="height: ${height}px;"></td>`;
+        return row;
+    }
+
+    function collectPinned() {
+        tbody.querySelectorAll('tr[data-id]').forEach(row => {
+            if (isEditingRow(row)) state.pinned.set(row.dataset.id, row);
+        });
+        for (const [id, row] of state.pinned) {
+            if (!isEditingRow(row)) state.pinned.delete(id);
+        }
+    }
+
+    function render() {
+        collectPinned();
+        if (state.total === 0) {
+            showStatus(Array.isArray(state.pages.get(0)) ? 'Không có dữ liệu.' : 'Đang tải...');
+            return;
+        }
+
+        const bodyTop = Math.max(scroller.scrollTop - table.tHead.offsetHeight, 0);
+        const visible = Math.ceil(scroller.clientHeight / state.rowHeight);
+        const start = Math.max(Math.floor(bodyTop / state.rowHeight) - MANAGE_OVERSCAN, 0);
+        const end = Math.min(start + visible + 2 * MANAGE_OVERSCAN, state.total);
+
+        const fragment = document.createDocumentFragment();
+        fragment.appendChild(spacerRow(start * state.rowHeight));
+        for (let i = start; i < end; i++) {
+            const page = Math.floor(i / MANAGE_PAGE_SIZE);
+            const items = state.pages.get(page);
+            const item = Array.isArray(items) ? items[i % MANAGE_PAGE_SIZE] : undefined;
+            if (item === undefined) {
+                if (!state.pages.has(page)) loadPage(page);
+                const row = document.createElement('tr');
+                row.innerHTML = `<td colspan="${columnCount}">Đang tải...</td>`;
+                fragment.appendChild(row);
+                continue;
+            }
+            fragment.appendChild(state.pinned.get(String(item[idField])) || buildRow(item));
+        }
+        fragment.appendChild(spacerRow((state.total - end) * state.rowHeight));
+        tbody.replaceChildren(fragment);
+
+        // Đo chiều cao hàng thật một lần rồi vẽ lại cho khớp vị trí cuộn
+        const sample = tbody.querySelector('tr[data-id]');
+        if (!state.measured && sample && sample.offsetHeight > 0) {
+            state.measured = true;
+            if (Math.abs(sample.offsetHeight - state.rowHeight) > 1) {
+                state.rowHeight = sample.offsetHeight;
+                render();
+            }
+        }
     }
+
+    function reload() {
+        collectPinned();
+        state.generation += 1;
+        state.pages.clear();
+        state.total = 0;
+        scroller.scrollTop = 0;
+        showStatus('Đang tải...');
+        return loadPage(0);
+    }
+
+    // Cuộn: vẽ lại tối đa một lần mỗi khung hình
+    scroller.addEventListener('scroll', () => {
+        if (state.renderQueued) return;
+        state.renderQueued = true;
+        requestAnimationFrame(() => {
+            state.renderQueued = false;
+            render();
+        });
+    });
+
+    // Bấm tiêu đề cột ID để đổi chiều sắp xếp
+    const sortHeader = headers.find(th => th.dataset.field === idField);
+    if (sortHeader) {
+        const label = sortHeader.textContent;
+        const showOrder = () => { sortHeader.textContent = `${label} ${state.order === 'desc' ? '▼' : '▲'}`; };
+        sortHeader.classList.add('sortable');
+        showOrder();
+        sortHeader.addEventListener('click', () => {
+            state.order = state.order === 'desc' ? 'asc' : 'desc';
+            showOrder();
+            reload();
+        });
+    }
+
+    // Hàng ô lọc dưới tiêu đề (lọc ở server, chờ người dùng gõ xong)
+    const filterRow = table.tHead.insertRow();
+    filterRow.className = 'filter-row';
+    let filterTimer = null;
+    headers.forEach(th => {
+        const cell = document.createElement('th');
+        const field = th.dataset.field;
+        if (field) {
+            const input = document.createElement('input');
+            input.type = 'search';
+            input.className = 'column-filter';
+            input.placeholder = 'Lọc...';
+            input.addEventListener('input', () => {
+                state.filters[field] = input.value.trim();
+                clearTimeout(filterTimer);
+                filterTimer = setTimeout(reload, 300);
+            });
+            cell.appendChild(input);
+        }
+        filterRow.appendChild(cell);
+    });
+
+    return {
+        reload,
+        // Các hàng đang sửa, kể cả hàng đã cuộn khỏi vùng nhìn thấy
+        editingRows() {
+            collectPinned();
+            return Array.from(state.pinned.values());
+        },
+        // Ghi giá trị vừa lưu vào dữ liệu đã tải để lần vẽ lại hiển thị đúng
+        patchItem(id, data) {
+            for (const items of state.pages.values()) {
+                if (!Array.isArray(items)) continue;
+                const item = items.find(it => String(it[idField]) === String(id));
+                if (item) Object.assign(item, data);
+            }
+        },
+    };
+}
+
+/**
+ * Tạo hàng bảng Pháp nhân
+ */
+function buildPublisherRow(pub) {
+    // Cột: ID_phap_nhan, ma_phap_nhan, ten_phap_nhan, loai_phap_nhan, client_code
+    const row = document.createElement('tr');
+    row.dataset.id = pub.ID_phap_nhan;
+    row.dataset.type = 'publisher';
+    row.innerHTML = `
+        <td data-field="ID_phap_nhan">${pub.ID_phap_nhan}</td>
+        <td data-field="ma_phap_nhan" data-original-value="${escapeHTML(pub.ma_phap_nhan)}">${escapeHTML(pub.ma_phap_nhan)}</td>
+        <td data-field="ten_phap_nhan" data-original-value="${escapeHTML(pub.ten_phap_nhan)}">${escapeHTML(pub.ten_phap_nhan)}</td>
+        <td data-field="loai_phap_nhan" data-original-value="${escapeHTML(pub.loai_phap_nhan)}">${escapeHTML(pub.loai_phap_nhan)}</td>
+        <td data-field="client_code" data-original-value="${escapeHTML(pub.client_code)}">${escapeHTML(pub.client_code)}</td>
+        <td class="actions">
+            <button class="btn btn-edit">Sửa</button>
+        </td>
+    `;
+    return row;
 }
 
 /**
- * Vẽ bảng PO
+ * Tạo hàng bảng PO
  */
-function renderPoTable(pos, tbody) {
+function buildPoRow(po) {
     // Cột: po_id, ID_phap_nhan, po_code, po_amount, po_available_amount, po_created_at, po_status, loai_sp, type_po
-    tbody.innerHTML = '';
-     if (pos.length === 0) {
-        tbody.innerHTML = '<tr><td colspan="10">Không có dữ liệu.</td></tr>';
-        return;
-    }
-    
-    for (const po of pos) {
-        const row = document.createElement('tr');
-        row.dataset.id = po.po_id;
-        row.dataset.type = 'po';
-        
-        // Format date (po.po_created_at là 'YYYY-MM-DDTHH:MM:SS')
-        const createdAt = po.po_created_at ? new Date(po.po_created_at).toLocaleString('vi-VN') : '';
-        const originalDate = po.po_created_at || '';
-
-        row.innerHTML = `
-            <td data-field="po_id">${po.po_id}</td>
-            <td data-field="ID_phap_nhan" data-original-value="${po.ID_phap_nhan}">${po.ID_phap_nhan}</td>
-            <td data-field="po_code" data-original-value="${escapeHTML(po.po_code)}">${escapeHTML(po.po_code)}</td>
-            <td data-field="po_amount" data-original-value="${po.po_amount}">${po.po_amount}</td>
-            <td data-field="po_available_amount" data-original-value="${po.po_available_amount}">${po.po_available_amount}</td>
-            <td data-field="po_created_at" data-original-value="${originalDate}">${createdAt}</td>
-            <td data-field="po_status" data-original-value="${escapeHTML(po.po_status)}">${escapeHTML(po.po_status)}</td>
-            <td data-field="loai_sp" data-original-value="${escapeHTML(po.loai_sp)}">${escapeHTML(po.loai_sp)}</td>
-            <td data-field="type_po" data-original-value="${escapeHTML(po.type_po)}">${escapeHTML(po.type_po)}</td>
-            <td class="actions">
-                <button class="btn btn-edit">Sửa</button>
-            </td>
-        `;
-        tbody.appendChild(row);
-    }
+    const row = document.createElement('tr');
+    row.dataset.id = po.po_id;
+    row.dataset.type = 'po';
+
+    // Format date (po.po_created_at là 'YYYY-MM-DDTHH:MM:SS')
+    const createdAt = po.po_created_at ? new Date(po.po_created_at).toLocaleString('vi-VN') : '';
+    const originalDate = po.po_created_at || '';
+
+    row.innerHTML = `
+        <td data-field="po_id">${po.po_id}</td>
+        <td data-field="ID_phap_nhan" data-original-value="${po.ID_phap_nhan}">${po.ID_phap_nhan}</td>
+        <td data-field="po_code" data-original-value="${escapeHTML(po.po_code)}">${escapeHTML(po.po_code)}</td>
+        <td data-field="po_amount" data-original-value="${po.po_amount}">${po.po_amount}</td>
+        <td data-field="po_available_amount" data-original-value="${po.po_available_amount}">${po.po_available_amount}</td>
+        <td data-field="po_created_at" data-original-value="${originalDate}">${createdAt}</td>
+        <td data-field="po_status" data-original-value="${escapeHTML(po.po_status)}">${escapeHTML(po.po_status)}</td>
+        <td data-field="loai_sp" data-original-value="${escapeHTML(po.loai_sp)}">${escapeHTML(po.loai_sp)}</td>
+        <td data-field="type_po" data-original-value="${escapeHTML(po.type_po)}">${escapeHTML(po.type_po)}</td>
+        <td class="actions">
+            <button class="btn btn-edit">Sửa</button>
+        </td>
+    `;
+    return row;
 }
 
 /**
@@ -600,16 +1014,12 @@ function handleEditClick(row) {
 async function handleSaveClick(row) {
     const id = row.dataset.id;
     const type = row.dataset.type;
-    const inputs = row.querySelectorAll('input, select');
     const actionsCell = row.querySelector('.actions');
     
     // Vô hiệu hóa nút
     actionsCell.innerHTML = `<button class="btn" disabled>Đang lưu...</button>`;
     
-    const data = {};
-    inputs.forEach(input => {
-        data[input.name] = input.value;
-    });
+    const data = collectRowData(row);
     
     const url = (type === 'publisher') 
         ? `${BACKEND_API_URL}/publisher/${id}`
@@ -630,19 +1040,7 @@ async function handleSaveClick(row) {
         showMessage(result.message, false);
         
         // Cập nhật lại UI
-        const cells = row.querySelectorAll('td[data-field]');
-        cells.forEach(cell => {
-            const field = cell.dataset.field;
-            
-            if (data.hasOwnProperty(field)) {
-                const newValue = data[field];
-                cell.dataset.originalValue = newValue; // Cập nhật original value
-                cell.textContent = newValue; // Cập nhật text hiển thị
-            }
-        });
-
-        // Khôi phục nút
-        actionsCell.innerHTML = `<button class="btn btn-edit">Sửa</button>`;
+        applySavedRow(row, data);
 
     } catch (error) {
         showMessage(error.message, true);
@@ -654,6 +1052,98 @@ async function handleSaveClick(row) {
     }
 }
 
+/**
+ * Lấy dữ liệu từ các input/select của hàng đang sửa
+ */
+function collectRowData(row) {
+    const data = {};
+    row.querySelectorAll('input, select').forEach(input => {
+        data[input.name] = input.value;
+    });
+    return data;
+}
+
+/**
+ * Cập nhật UI của hàng sau khi lưu thành công
+ */
+function applySavedRow(row, data) {
+    const cells = row.querySelectorAll('td[data-field]');
+    cells.forEach(cell => {
+        const field = cell.dataset.field;
+        
+        if (data.hasOwnProperty(field)) {
+            const newValue = data[field];
+            cell.dataset.originalValue = newValue; // Cập nhật original value
+            cell.textContent = newValue; // Cập nhật text hiển thị
+        }
+    });
+    const table = manageTables[row.dataset.type];
+    if (table) table.patchItem(row.dataset.id, data);
+
+    // Khôi phục nút
+    const actionsCell = row.querySelector('.actions');
+    actionsCell.innerHTML = `<button class="btn btn-edit">Sửa</button>`;
+}
+
+/**
+ * Lưu tất cả các hàng đang sửa: mỗi bảng chỉ gọi MỘT request cập nhật hàng loạt
+ */
+async function handleSaveAllClick(button) {
+    // Gồm cả hàng đang sửa đã cuộn khỏi vùng nhìn thấy
+    const editingRows = Object.values(manageTables).flatMap(table => table.editingRows())
+        .filter(row => row.querySelector('.btn-save'));
+
+    if (editingRows.length === 0) {
+        showMessage('Không có hàng nào đang sửa.', true);
+        return;
+    }
+
+    button.disabled = true;
+    button.textContent = 'Đang lưu...';
+
+    const groups = { publisher: [], po: [] };
+    editingRows.forEach(row => groups[row.dataset.type].push(row));
+
+    for (const [type, rows] of Object.entries(groups)) {
+        if (rows.length === 0) continue;
+
+        const payload = rows.map(row => ({ id: row.dataset.id, changes: collectRowData(row) }));
+        const url = (type === 'publisher')
+            ? `${BACKEND_API_URL}/bulk-update-publisher`
+            : `${BACKEND_API_URL}/bulk-update-po`;
+
+        try {
+            const response = await fetch(url, {
+                method: 'PUT',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(payload)
+            });
+            const result = await response.json();
+            if (!result.updated) {
+                throw new Error(result.message || 'Lỗi lưu dữ liệu');
+            }
+
+            // Chỉ cập nhật UI các hàng đã lưu thành công, hàng lỗi giữ nguyên chế độ sửa
+            const updatedIds = new Set(result.updated.map(String));
+            rows.forEach((row, i) => {
+                if (updatedIds.has(String(row.dataset.id))) {
+                    applySavedRow(row, payload[i].changes);
+                }
+            });
+            (result.errors || []).forEach(err => {
+                const item = payload[err.row - 1];
+                showMessage(`ID ${item ? item.id : '?'}: ${err.message}`, true);
+            });
+            showMessage(result.message, !result.success);
+        } catch (error) {
+            showMessage(error.message, true);
+        }
+    }
+
+    button.disabled = false;
+    button.textContent = 'Lưu tất cả';
+}
+
 /**
  * Hủy bỏ Sửa, khôi phục giá trị gốc
  */
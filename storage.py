@@ -0,0 +1,833 @@
+"""
+Lớp lưu trữ dữ liệu cho backend.
+
+- GoogleSheetsStorage: đọc/ghi trực tiếp Google Sheets qua gspread (giữ hạn mức, tự thử lại khi gặp 429/5xx).
+- SqliteStorage: lưu cục bộ trong SQLite (có index cột ID); SheetSyncJob đẩy thay đổi lên Sheet.
+- WriteBehindStorage: ghi vào journal cục bộ rồi trả lời ngay, luồng nền đẩy lên Sheet theo lô.
+
+Mọi storage dùng chung cách đánh số dòng như trên Sheet:
+dòng 1 là header, dữ liệu bắt đầu từ dòng 2.
+"""
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+import pandas as pd
+import gspread
+import gspread.utils
+
+# Cột mặc định của từng tab (dùng khi tạo bảng cục bộ mà không tải được từ Sheet)
+DEFAULT_HEADERS = {
+    "pom": [
+        "ID_phap_nhan", "po_id", "po_code", "po_amount", "po_available_amount",
+        "po_created_at", "po_status", "loai_sp", "type_po"
+    ],
+    "dim_publisher": ["ID_phap_nhan", "ma_phap_nhan", "ten_phap_nhan", "loai_phap_nhan", "client_code"],
+}
+# Cột ID của từng tab (được đánh index trong SQLite)
+ID_COLUMNS = {"pom": "po_id", "dim_publisher": "ID_phap_nhan"}
+# Hạn mức Sheets API cho mỗi user (service account): số request đọc/ghi mỗi phút
+SHEETS_READS_PER_MINUTE = 60
+SHEETS_WRITES_PER_MINUTE = 60
+SHEETS_BURST = 10 # Số request được gửi dồn một lúc trước khi phải chờ theo hạn mức
+# Gặp 429/5xx: chờ ngẫu nhiên trong [0, min(BACKOFF_MAX, BACKOFF_BASE * 2^lần thử)] giây rồi thử lại
+SHEETS_MAX_RETRIES = 6
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 32.0
+
+
+def _clean_headers(headers):
+    headers = list(headers)
+    while headers and not str(headers[-1]).strip():
+        headers.pop() # Bỏ cột trống ở cuối, giống row_values(1)
+    return headers
+
+def _records_to_df(records):
+    df = pd.DataFrame(records)
+    if not df.empty:
+        df.columns = df.columns.str.strip()
+    return df
+
+
+class TokenBucket:
+    """
+    Giới hạn tốc độ: nạp rate token mỗi giây, tích tối đa capacity token.
+    acquire() lấy một token, hết token thì giữ chỗ trước rồi ngủ đến lượt (request đến trước đi trước).
+    """
+
+    def __init__(self, rate, capacity, sleep=time.sleep, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._sleep = sleep
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            self._sleep(wait)
+
+    def drain(self):
+        """Bỏ số token còn dư (server đã báo hết hạn mức): các request sau phải chờ nạp lại."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 0)
+
+
+class SheetsRequestLimiter:
+    """
+    Cửa chung cho mọi request tới Google API:
+    - token bucket riêng cho đọc và ghi theo hạn mức mỗi phút;
+    - gặp 429 (hoặc 5xx với thao tác gọi lại được) thì chờ lùi dần, ngẫu nhiên rồi thử lại;
+    - các lần đọc giống nhau chạy cùng lúc chỉ gửi một request và dùng chung kết quả.
+    """
+
+    def __init__(
+        self, reads_per_minute=SHEETS_READS_PER_MINUTE, writes_per_minute=SHEETS_WRITES_PER_MINUTE,
+        burst=SHEETS_BURST, max_retries=SHEETS_MAX_RETRIES,
+        backoff_base=BACKOFF_BASE_SECONDS, backoff_max=BACKOFF_MAX_SECONDS, sleep=time.sleep
+    ):
+        self.buckets = {
+            "read": TokenBucket(reads_per_minute / 60, burst, sleep=sleep),
+            "write": TokenBucket(writes_per_minute / 60, burst, sleep=sleep),
+        }
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._sleep = sleep
+        self._inflight = {}  # {key: Future của lần đọc đang chạy}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _is_retryable(e, idempotent):
+        if not isinstance(e, gspread.exceptions.APIError):
+            return False
+        # 5xx có thể đã ghi xong phía server -> chỉ gọi lại thao tác lặp lại vô hại
+        return e.code == 429 or (idempotent and e.code >= 500)
+
+    def run(self, func, kind="read", idempotent=True):
+        """Gọi func() theo hạn mức của kind ("read"/"write"; None = không tính hạn mức Sheets)."""
+        bucket = self.buckets.get(kind)
+        attempt = 0
+        while True:
+            if bucket is not None:
+                bucket.acquire()
+            try:
+                return func()
+            except Exception as e:
+                if attempt >= self.max_retries or not self._is_retryable(e, idempotent):
+                    raise
+                if e.code == 429 and bucket is not None:
+                    bucket.drain()
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                attempt += 1
+                print(f"Google API lỗi {e.code}, thử lại lần {attempt} sau {delay:.1f}s")
+                self._sleep(delay)
+
+    def coalesce(self, key, func):
+        """Gọi func(); nếu đang có lần gọi cùng key chưa xong thì chờ và trả về kết quả của lần đó."""
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            result = func()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._inflight.pop(key, None)
+        future.set_result(result)
+        return result
+
+
+class GoogleSheetsStorage:
+    """
+    Đọc/ghi Google Sheets. Mở Spreadsheet và từng tab một lần rồi dùng lại;
+    chỉ mở lại (và xác thực lại) khi gặp lỗi xác thực hoặc không tìm thấy.
+    Mọi request đi qua limiter (hạn mức, thử lại khi 429/5xx, gộp lần đọc trùng).
+    """
+
+    def __init__(self, authorize, sheet_id, limiter=None):
+        self._authorize = authorize # Hàm trả về gspread client mới
+        self._sheet_id = sheet_id
+        self.limiter = limiter or SheetsRequestLimiter()
+        self.client = authorize()
+        self._spreadsheet = None
+        self._worksheets = {}  # {worksheet_name: Worksheet}
+        self._headers = {}     # {worksheet_name: [tên cột dòng 1]}
+        self._lock = threading.Lock()
+        self._change_token_supported = True
+
+    def reset_handles(self, reauthorize=False):
+        """Xóa các handle đã mở (và xác thực lại client nếu cần)."""
+        with self._lock:
+            if reauthorize:
+                self.client = self._authorize()
+            self._spreadsheet = None
+            self._worksheets.clear()
+            self._headers.clear()
+
+    def _open_worksheet(self, worksheet_name):
+        """Lấy handle tab từ registry, mở nếu chưa có."""
+        with self._lock:
+            ws = self._worksheets.get(worksheet_name)
+            if ws is None:
+                if self._spreadsheet is None:
+                    self._spreadsheet = self.client.open_by_key(self._sheet_id)
+                ws = self._spreadsheet.worksheet(worksheet_name)
+                self._worksheets[worksheet_name] = ws
+            return ws
+
+    @staticmethod
+    def _is_reopen_error(e):
+        """Lỗi cho biết handle/phiên xác thực không còn dùng được."""
+        if isinstance(e, (gspread.exceptions.WorksheetNotFound, gspread.exceptions.SpreadsheetNotFound)):
+            return True
+        return isinstance(e, gspread.exceptions.APIError) and e.code in (401, 403, 404)
+
+    def call(self, worksheet_name, func, kind="read", idempotent=True):
+        """Gọi func(ws) trên tab; nếu lỗi xác thực/không tìm thấy thì mở lại và thử thêm một lần."""
+        request = lambda: func(self._open_worksheet(worksheet_name))
+        try:
+            return self.limiter.run(request, kind, idempotent)
+        except Exception as e:
+            if not self._is_reopen_error(e):
+                raise
+            print(f"Mở lại tab '{worksheet_name}' sau lỗi: {e}")
+            self.reset_handles(reauthorize=isinstance(e, gspread.exceptions.APIError) and e.code == 401)
+            return self.limiter.run(request, kind, idempotent)
+
+    def read(self, worksheet_name, operation, func):
+        """call() cho thao tác đọc: các lần đọc cùng (tab, operation) chạy đồng thời chỉ gửi một request."""
+        return self.limiter.coalesce((worksheet_name, operation), lambda: self.call(worksheet_name, func))
+
+    def get_headers(self, worksheet_name):
+        """Lấy dòng tiêu đề của tab (cache sau lần đọc đầu tiên)."""
+        with self._lock:
+            headers = self._headers.get(worksheet_name)
+        if headers is None:
+            headers = self.read(worksheet_name, "row_values", lambda ws: ws.row_values(1))
+            headers = self._set_headers(worksheet_name, headers)
+        return headers
+
+    def _set_headers(self, worksheet_name, headers):
+        headers = _clean_headers(headers)
+        with self._lock:
+            self._headers[worksheet_name] = headers
+        return headers
+
+    def load_df(self, worksheet_name):
+        """Tải toàn bộ dữ liệu của tab thành DataFrame (None nếu không mở được tab)."""
+        try:
+            records = self.read(worksheet_name, "get_all_records", lambda ws: ws.get_all_records())
+        except (gspread.exceptions.WorksheetNotFound, gspread.exceptions.SpreadsheetNotFound) as e:
+            print(f"Lỗi khi mở tab '{worksheet_name}': {e}")
+            return None
+        if records:
+            # Thứ tự key của record chính là dòng tiêu đề -> cache luôn, khỏi gọi row_values(1)
+            self._set_headers(worksheet_name, records[0].keys())
+        return _records_to_df(records)
+
+    def change_token(self, worksheet_name):
+        """
+        Giá trị đổi mỗi khi Spreadsheet bị sửa (modifiedTime trên Drive), hỏi rẻ hơn nhiều so với tải tab.
+        None nếu không hỏi được (vd: thiếu quyền Drive) -> bên gọi tự tải lại theo chu kỳ.
+        """
+        if not self._change_token_supported:
+            return None
+        try:
+            # API Drive, không tính vào hạn mức Sheets
+            spreadsheet = self._open_worksheet(worksheet_name).spreadsheet
+            return self.limiter.run(spreadsheet.get_lastUpdateTime, kind=None)
+        except gspread.exceptions.APIError as e:
+            if e.code in (403, 404):
+                self._change_token_supported = False # Không có quyền Drive: không hỏi lại nữa
+            print(f"Không lấy được thời điểm sửa của Spreadsheet: {e}")
+            return None
+
+    def append_rows(self, worksheet_name, rows):
+        """Ghi các dòng vào cuối tab; trả về số dòng đầu tiên được ghi (None nếu không rõ)."""
+        response = self.call(
+            worksheet_name,
+            lambda ws: ws.append_rows(rows, value_input_option='USER_ENTERED'),
+            kind="write", idempotent=False # Gọi lại sau 5xx có thể ghi trùng dòng
+        )
+        # Kết quả append có dạng "'pom'!A22:I23" -> 22
+        try:
+            updated_range = response["updates"]["updatedRange"].split("!")[-1]
+            return gspread.utils.a1_range_to_grid_range(updated_range)["startRowIndex"] + 1
+        except (KeyError, TypeError, AttributeError, ValueError):
+            return None
+
+    def update_cells(self, worksheet_name, cells):
+        """Ghi các ô [(số dòng, số cột, giá trị)] trong một lần batch_update."""
+        data = [
+            {"range": gspread.utils.rowcol_to_a1(row_num, col_num), "values": [[value]]}
+            for row_num, col_num, value in cells
+        ]
+        if data:
+            self.call(worksheet_name, lambda ws: ws.batch_update(data, value_input_option='USER_ENTERED'), kind="write")
+
+    def write_rows(self, worksheet_name, rows):
+        """Ghi đè nguyên dòng [(số dòng, [giá trị...])] trong một lần batch_update."""
+        data = [
+            {
+                "range": f"A{row_num}:{gspread.utils.rowcol_to_a1(row_num, max(len(values), 1))}",
+                "values": [values],
+            }
+            for row_num, values in rows
+        ]
+        if data:
+            self.call(worksheet_name, lambda ws: ws.batch_update(data, value_input_option='USER_ENTERED'), kind="write")
+
+
+class SqliteStorage:
+    """
+    Lưu dữ liệu cục bộ trong SQLite, mỗi tab một bảng, cột ID được đánh index.
+    Lần đầu mở một tab, bảng được tạo và nạp dữ liệu từ `seed_from` (nếu có).
+    Mỗi dòng có cột _row (số dòng trên Sheet) và _dirty (> 0 nếu chưa đồng bộ lên Sheet).
+    """
+
+    def __init__(self, path, seed_from=None):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._seed_from = seed_from
+        self._lock = threading.RLock()
+        self._headers = {}
+        self._revision = 0 # Tăng mỗi lần ghi qua storage này
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS _sheet_meta "
+                "(name TEXT PRIMARY KEY, headers TEXT NOT NULL, synced_until INTEGER NOT NULL)"
+            )
+            # Tab dừng đồng bộ vì dữ liệu trên Sheet lệch với bản cục bộ (cần đối chiếu bằng tay)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS _sync_errors (name TEXT PRIMARY KEY, message TEXT NOT NULL)")
+            self._conn.commit()
+
+    @staticmethod
+    def _quote(name):
+        return '"' + str(name).replace('"', '""') + '"'
+
+    def _ensure_table(self, worksheet_name):
+        """Tạo bảng cho tab nếu chưa có; trả về danh sách header."""
+        with self._lock:
+            if worksheet_name in self._headers:
+                return self._headers[worksheet_name]
+            row = self._conn.execute(
+                "SELECT headers FROM _sheet_meta WHERE name = ?", (worksheet_name,)
+            ).fetchone()
+            if row:
+                self._headers[worksheet_name] = json.loads(row[0])
+                return self._headers[worksheet_name]
+
+            headers, rows = self._seed_rows(worksheet_name)
+            table = self._quote(worksheet_name)
+            columns = ", ".join(self._quote(h) for h in headers)
+            self._conn.execute(
+                f"CREATE TABLE {table} (_row INTEGER PRIMARY KEY, _dirty INTEGER NOT NULL DEFAULT 0, {columns})"
+            )
+            id_column = ID_COLUMNS.get(worksheet_name)
+            stripped = [str(h).strip() for h in headers]
+            if id_column in stripped:
+                self._conn.execute(
+                    f"CREATE INDEX {self._quote('idx_' + worksheet_name + '_' + id_column)} "
+                    f"ON {table} ({self._quote(headers[stripped.index(id_column)])})"
+                )
+            placeholders = ", ".join("?" for _ in headers)
+            self._conn.executemany(
+                f"INSERT INTO {table} (_row, {columns}) VALUES (?, {placeholders})",
+                [(row_num, *values) for row_num, values in enumerate(rows, start=2)]
+            )
+            # Dữ liệu nạp từ Sheet đã có sẵn trên Sheet -> đánh dấu đã đồng bộ tới dòng cuối
+            self._conn.execute(
+                "INSERT INTO _sheet_meta (name, headers, synced_until) VALUES (?, ?, ?)",
+                (worksheet_name, json.dumps(headers, ensure_ascii=False), len(rows) + 1 if rows else 1)
+            )
+            self._conn.commit()
+            self._headers[worksheet_name] = headers
+            return headers
+
+    def _seed_rows(self, worksheet_name):
+        """Lấy header và dữ liệu ban đầu từ storage nguồn (hoặc header mặc định)."""
+        if self._seed_from is not None:
+            df = self._seed_from.load_df(worksheet_name)
+            if df is not None:
+                headers = self._seed_from.get_headers(worksheet_name)
+                stripped = [str(h).strip() for h in headers]
+                rows = [
+                    [record.get(col, "") for col in stripped]
+                    for record in df.astype(object).where(df.notna(), "").to_dict('records')
+                ]
+                return headers, rows
+        return list(DEFAULT_HEADERS.get(worksheet_name, [])), []
+
+    def get_headers(self, worksheet_name):
+        return self._ensure_table(worksheet_name)
+
+    def load_df(self, worksheet_name):
+        """Đọc toàn bộ bảng theo thứ tự dòng thành DataFrame."""
+        headers = self._ensure_table(worksheet_name)
+        columns = ", ".join(self._quote(h) for h in headers)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {columns} FROM {self._quote(worksheet_name)} ORDER BY _row"
+            ).fetchall()
+        if not rows:
+            return pd.DataFrame()
+        return _records_to_df([dict(zip(headers, row)) for row in rows])
+
+    def change_token(self, worksheet_name):
+        """Giá trị đổi khi dữ liệu bị sửa (qua storage này hoặc kết nối/tiến trình khác)."""
+        with self._lock:
+            return self._revision, self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def append_rows(self, worksheet_name, rows):
+        """Ghi các dòng vào cuối bảng; trả về số dòng đầu tiên được ghi."""
+        headers = self._ensure_table(worksheet_name)
+        table = self._quote(worksheet_name)
+        columns = ", ".join(self._quote(h) for h in headers)
+        placeholders = ", ".join("?" for _ in headers)
+        with self._lock:
+            last_row = self._conn.execute(f"SELECT COALESCE(MAX(_row), 1) FROM {table}").fetchone()[0]
+            first_row = last_row + 1
+            self._conn.executemany(
+                f"INSERT INTO {table} (_row, _dirty, {columns}) VALUES (?, 1, {placeholders})",
+                [
+                    (first_row + i, *(list(values) + [""] * len(headers))[:len(headers)])
+                    for i, values in enumerate(rows)
+                ]
+            )
+            self._conn.commit()
+            self._revision += 1
+        return first_row
+
+    def update_cells(self, worksheet_name, cells):
+        """Ghi các ô [(số dòng, số cột, giá trị)] trong một transaction."""
+        headers = self._ensure_table(worksheet_name)
+        table = self._quote(worksheet_name)
+        with self._lock:
+            for row_num, col_num, value in cells:
+                self._conn.execute(
+                    f"UPDATE {table} SET {self._quote(headers[col_num - 1])} = ?, _dirty = _dirty + 1 WHERE _row = ?",
+                    (value, row_num)
+                )
+            self._conn.commit()
+            self._revision += 1
+
+    # --- Hỗ trợ đồng bộ lên Google Sheets ---
+
+    def pending_changes(self, worksheet_name):
+        """Trả về (synced_until, [(số dòng, [giá trị...], _dirty)]) các dòng chưa đồng bộ."""
+        headers = self._ensure_table(worksheet_name)
+        columns = ", ".join(self._quote(h) for h in headers)
+        with self._lock:
+            synced_until = self._conn.execute(
+                "SELECT synced_until FROM _sheet_meta WHERE name = ?", (worksheet_name,)
+            ).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT _row, _dirty, {columns} FROM {self._quote(worksheet_name)} WHERE _dirty > 0 ORDER BY _row"
+            ).fetchall()
+        return synced_until, [(row[0], list(row[2:]), row[1]) for row in rows]
+
+    def mark_synced(self, worksheet_name, synced_rows, synced_until):
+        """Đánh dấu các dòng đã đồng bộ; dòng bị sửa thêm trong lúc đồng bộ vẫn giữ _dirty."""
+        with self._lock:
+            self._conn.executemany(
+                f"UPDATE {self._quote(worksheet_name)} SET _dirty = 0 WHERE _row = ? AND _dirty = ?",
+                [(row_num, dirty) for row_num, _, dirty in synced_rows]
+            )
+            self._conn.execute(
+                "UPDATE _sheet_meta SET synced_until = MAX(synced_until, ?) WHERE name = ?",
+                (synced_until, worksheet_name)
+            )
+            self._conn.commit()
+
+    def sync_error(self, worksheet_name):
+        """Lý do tab bị dừng đồng bộ, hoặc None."""
+        with self._lock:
+            row = self._conn.execute("SELECT message FROM _sync_errors WHERE name = ?", (worksheet_name,)).fetchone()
+        return row[0] if row else None
+
+    def set_sync_error(self, worksheet_name, message):
+        """Dừng đồng bộ tab (giữ qua các lần khởi động) cho tới khi clear_sync_error."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO _sync_errors (name, message) VALUES (?, ?)", (worksheet_name, message)
+            )
+            self._conn.commit()
+
+    def clear_sync_error(self, worksheet_name):
+        """Cho tab đồng bộ lại, sau khi đã đối chiếu Sheet với bản cục bộ (dòng còn _dirty sẽ được ghi lại)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM _sync_errors WHERE name = ?", (worksheet_name,))
+            self._conn.commit()
+
+
+class SheetSyncJob:
+    """
+    Luồng nền định kỳ đẩy các dòng mới/đã sửa từ SqliteStorage lên Google Sheets.
+    Dòng cục bộ số N được ghi vào dòng N trên Sheet; nếu Sheet có dòng do người khác thêm
+    (append rơi vào vị trí khác) thì tab đó dừng đồng bộ và báo lỗi thay vì ghi tiếp vào sai dòng.
+    """
+
+    def __init__(self, local, remote, worksheet_names, interval_seconds):
+        self.local = local
+        self.remote = remote
+        self.worksheet_names = list(worksheet_names)
+        self.interval_seconds = interval_seconds
+        self._thread = None
+        self._reported = set() # Tab dừng đồng bộ đã báo lỗi trong lần chạy này
+
+    def sync_once(self):
+        """Đồng bộ một lượt: dòng mới -> append_rows, dòng đã có -> batch_update."""
+        for worksheet_name in self.worksheet_names:
+            error = self.local.sync_error(worksheet_name)
+            if error is not None:
+                if worksheet_name not in self._reported:
+                    self._reported.add(worksheet_name)
+                    print(f"LỖI: tab '{worksheet_name}' đang dừng đồng bộ lên Google Sheets: {error}")
+                continue
+            synced_until, dirty_rows = self.local.pending_changes(worksheet_name)
+            if not dirty_rows:
+                continue
+            updated = [row for row in dirty_rows if row[0] <= synced_until]
+            appended = [row for row in dirty_rows if row[0] > synced_until]
+            if updated:
+                self.remote.write_rows(worksheet_name, [(row_num, values) for row_num, values, _ in updated])
+            if appended:
+                first_row = self.remote.append_rows(worksheet_name, [values for _, values, _ in appended])
+                if first_row is not None and first_row != appended[0][0]:
+                    # Số dòng cục bộ không còn khớp Sheet: sửa tiếp sẽ ghi vào sai dòng -> dừng tab này
+                    self.local.mark_synced(worksheet_name, updated, synced_until)
+                    self.local.set_sync_error(worksheet_name, (
+                        f"dòng mới được ghi từ dòng {first_row} trên Sheet, dữ liệu cục bộ là dòng "
+                        f"{appended[0][0]}; cần đối chiếu Sheet rồi gọi clear_sync_error"
+                    ))
+                    continue
+            new_synced_until = appended[-1][0] if appended else synced_until
+            self.local.mark_synced(worksheet_name, dirty_rows, new_synced_until)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval_seconds)
+            try:
+                self.sync_once()
+            except Exception as e:
+                print(f"Lỗi đồng bộ dữ liệu lên Google Sheets: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sheet-sync", daemon=True)
+            self._thread.start()
+        return self
+
+
+def _json_default(value):
+    """Giá trị numpy (vd: ID lấy từ DataFrame) -> kiểu Python để ghi journal."""
+    return value.item() if hasattr(value, "item") else str(value)
+
+
+class WriteBehindStorage:
+    """
+    Ghi sau (write-behind) cho storage từ xa (Google Sheets).
+
+    Mỗi lần ghi được nối vào file journal cục bộ (fsync) rồi trả về ngay; luồng nền đẩy các
+    thay đổi đang chờ lên Sheet theo lô: mỗi tab một append_rows cho dòng mới và một
+    batch_update cho các ô sửa. Đọc = dữ liệu trên Sheet + thay đổi đang chờ.
+    Số dòng của dòng mới được tính trước (sau dòng cuối đã biết); nếu trên Sheet có người
+    ghi chen vào thì khi đẩy sẽ lệch, change_token đổi để bên đọc tải lại.
+    Journal còn dở khi tắt được đọc lại lúc khởi động; dòng mới đã có ID trên Sheet thì bỏ qua.
+    """
+
+    def __init__(self, remote, journal_path, interval_seconds):
+        self.remote = remote
+        self.journal_path = journal_path
+        self.interval_seconds = interval_seconds
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock() # Đẩy lên Sheet và đọc Sheet không chen nhau
+        # {worksheet_name: {"rows": {số dòng: [giá trị]}, "inflight": {...}, "cells": {(dòng, cột): giá trị}}}
+        self._pending = {}
+        self._row_counts = {}  # {worksheet_name: số dòng cuối đã biết trên Sheet (kể cả header)}
+        self._unsure = set()   # Tab có thể đã nhận một phần dòng mới (đẩy lỗi / khôi phục từ journal)
+        # {worksheet_name: {số dòng tính trước: số dòng thật}} cho dòng đã đẩy bị lệch vị trí,
+        # giữ đến lần đọc Sheet kế tiếp (bên đọc vẫn dùng số dòng tính trước cho tới lúc đó)
+        self._moved = {}
+        self._seq = 0
+        self._epoch = 0        # Tăng khi số dòng tính trước bị lệch -> change_token đổi
+        self._thread = None
+        self._journal = None
+        self._replay()
+
+    # --- Journal ---
+
+    def _replay(self):
+        """Đọc lại journal: các thay đổi chưa có dấu đã đẩy thì đưa lại vào hàng chờ."""
+        entries, flushed = [], {}
+        torn_tail = False
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    torn_tail = not line.endswith("\n")
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue # Dòng ghi dở khi tắt đột ngột
+                    if entry["op"] == "flushed":
+                        flushed[entry["ws"]] = max(flushed.get(entry["ws"], 0), entry["seq"])
+                    else:
+                        entries.append(entry)
+        restored = 0
+        for entry in entries:
+            self._seq = max(self._seq, entry["seq"])
+            if entry["seq"] <= flushed.get(entry["ws"], 0):
+                continue
+            restored += 1
+            if entry["op"] == "append":
+                self._queue_rows(entry["ws"], entry["row"], entry["rows"])
+                self._unsure.add(entry["ws"])
+            else:
+                self._queue_cells(entry["ws"], entry["cells"])
+        if restored:
+            print(f"Khôi phục {restored} lần ghi chưa đẩy lên Google Sheets từ journal.")
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        if torn_tail:
+            # Kết thúc dòng ghi dở, để bản ghi mới không bị nối vào nó (và bị bỏ qua ở lần đọc lại sau)
+            self._log_raw("\n")
+
+    def _log(self, entry):
+        """Nối một bản ghi vào journal và fsync (gọi khi giữ _lock)."""
+        self._log_raw(json.dumps(entry, ensure_ascii=False, default=_json_default) + "\n")
+
+    def _log_raw(self, text):
+        self._journal.write(text)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    # --- Hàng chờ (gọi khi giữ _lock) ---
+
+    def _pending_for(self, worksheet_name):
+        return self._pending.setdefault(worksheet_name, {"rows": {}, "inflight": {}, "cells": {}})
+
+    def _pending_keys(self, worksheet_name):
+        pending = self._pending.get(worksheet_name)
+        return [] if pending is None else [*pending["rows"], *pending["inflight"], *pending["cells"]]
+
+    def _queue_rows(self, worksheet_name, first_row_num, rows):
+        pending = self._pending_for(worksheet_name)
+        for offset, row in enumerate(rows):
+            pending["rows"][first_row_num + offset] = list(row)
+
+    def _queue_cells(self, worksheet_name, cells):
+        pending = self._pending_for(worksheet_name)
+        for row_num, col_num, value in cells:
+            row = pending["rows"].get(row_num)
+            if row is None:
+                pending["cells"][(row_num, col_num)] = value
+                continue
+            # Dòng mới chưa đẩy: sửa thẳng vào dòng đó
+            row.extend([""] * (col_num - len(row)))
+            row[col_num - 1] = value
+
+    def _next_row(self, worksheet_name):
+        pending = self._pending.get(worksheet_name) or {"rows": {}, "inflight": {}}
+        return max([self._row_counts.get(worksheet_name, 1), *pending["rows"], *pending["inflight"]]) + 1
+
+    # --- Giao diện storage ---
+
+    def get_headers(self, worksheet_name):
+        return self.remote.get_headers(worksheet_name)
+
+    def change_token(self, worksheet_name):
+        token = self.remote.change_token(worksheet_name)
+        with self._lock:
+            return None if token is None else (token, self._epoch)
+
+    def load_df(self, worksheet_name):
+        """Dữ liệu trên Sheet cộng các thay đổi đang chờ đẩy."""
+        with self._flush_lock:
+            df = self.remote.load_df(worksheet_name)
+            if df is None:
+                return None
+            with self._lock:
+                self._row_counts[worksheet_name] = len(df) + 1
+                self._moved.pop(worksheet_name, None)
+                pending = self._pending.get(worksheet_name)
+                if pending is None or not self._pending_keys(worksheet_name):
+                    return df
+                if worksheet_name in self._unsure and pending["rows"]:
+                    pending["rows"] = dict(self._drop_existing_rows(worksheet_name, sorted(pending["rows"].items()), df))
+                    self._unsure.discard(worksheet_name)
+                if min([*pending["rows"], *pending["inflight"]], default=len(df) + 2) <= len(df) + 1:
+                    self._move_pending_rows(worksheet_name, len(df) + 2)
+                rows = {**pending["inflight"], **pending["rows"]}
+                rows = {row_num: list(values) for row_num, values in rows.items()}
+                cells = dict(pending["cells"])
+        return self._overlay(worksheet_name, df, rows, cells)
+
+    def _move_pending_rows(self, worksheet_name, first_row_num):
+        """Trên Sheet đã có dòng ở vị trí tính trước -> dời các dòng đang chờ xuống sau (giữ _lock)."""
+        pending = self._pending[worksheet_name]
+        moved = {}
+        for key in ("inflight", "rows"):
+            for row_num in sorted(pending[key]):
+                moved[row_num] = first_row_num + len(moved)
+            pending[key] = {moved[row_num]: values for row_num, values in pending[key].items()}
+        pending["cells"] = {
+            (moved.get(row_num, row_num), col_num): value for (row_num, col_num), value in pending["cells"].items()
+        }
+        self._epoch += 1
+
+    def _overlay(self, worksheet_name, df, rows, cells):
+        headers = [str(h).strip() for h in self.get_headers(worksheet_name)]
+        columns = list(df.columns) if len(df.columns) else headers
+        if rows:
+            width = len(columns)
+            values = [(list(row) + [""] * width)[:width] for _, row in sorted(rows.items())]
+            new_rows = pd.DataFrame(values, columns=columns, index=[row_num - 2 for row_num in sorted(rows)])
+            df = pd.concat([df, new_rows]) if len(df) else new_rows
+        else:
+            df = df.copy()
+        for (row_num, col_num), value in cells.items():
+            col_name = headers[col_num - 1] if col_num <= len(headers) else None
+            if col_name not in df.columns or row_num - 2 not in df.index:
+                continue
+            try:
+                df.at[row_num - 2, col_name] = value
+            except (TypeError, ValueError):
+                df[col_name] = df[col_name].astype(object) # Khác kiểu cột (vd: chuỗi vào cột số)
+                df.at[row_num - 2, col_name] = value
+        return df
+
+    def append_rows(self, worksheet_name, rows):
+        """Ghi dòng mới vào journal; trả về số dòng đầu tiên (tính trước) trên Sheet."""
+        if worksheet_name not in self._row_counts:
+            self.load_df(worksheet_name) # Cần biết dòng cuối trên Sheet để tính số dòng
+        with self._lock:
+            first_row_num = self._next_row(worksheet_name)
+            self._seq += 1
+            self._log({"seq": self._seq, "op": "append", "ws": worksheet_name, "row": first_row_num, "rows": rows})
+            self._queue_rows(worksheet_name, first_row_num, rows)
+        return first_row_num
+
+    def update_cells(self, worksheet_name, cells):
+        """Ghi các ô [(số dòng, số cột, giá trị)] vào journal."""
+        if not cells:
+            return
+        with self._lock:
+            moved = self._moved.get(worksheet_name, {})
+            cells = [[moved.get(row_num, row_num), col_num, value] for row_num, col_num, value in cells]
+            self._seq += 1
+            self._log({"seq": self._seq, "op": "update", "ws": worksheet_name, "cells": cells})
+            self._queue_cells(worksheet_name, cells)
+
+    # --- Đẩy lên Sheet ---
+
+    def _drop_existing_rows(self, worksheet_name, rows, df):
+        """Bỏ các dòng mới mà ID đã có trên Sheet (đã đẩy trước khi lỗi/tắt)."""
+        id_column = ID_COLUMNS.get(worksheet_name)
+        headers = [str(h).strip() for h in self.get_headers(worksheet_name)]
+        if df is None or df.empty or id_column not in headers or id_column not in df.columns:
+            return rows
+        pos = headers.index(id_column)
+        existing = set(df[id_column].astype(str).str.strip())
+        return [(row_num, values) for row_num, values in rows if str(values[pos]).strip() not in existing]
+
+    def _flush_worksheet(self, worksheet_name):
+        with self._lock:
+            pending = self._pending.get(worksheet_name)
+            if pending is None or not (pending["rows"] or pending["cells"]):
+                return
+            seq = self._seq
+            rows = sorted(pending["rows"].items())
+            cells = dict(pending["cells"])
+            # Dòng đang đẩy: lần sửa tiếp theo đi vào cells, đẩy ở lượt sau
+            pending["inflight"], pending["rows"] = pending["rows"], {}
+
+        if rows:
+            try:
+                to_send = rows
+                if worksheet_name in self._unsure:
+                    to_send = self._drop_existing_rows(worksheet_name, rows, self.remote.load_df(worksheet_name))
+                first_row_num = self.remote.append_rows(worksheet_name, [values for _, values in to_send]) \
+                    if to_send else None
+            except Exception:
+                with self._lock:
+                    pending["rows"] = {**pending["inflight"], **pending["rows"]}
+                    pending["inflight"] = {}
+                    self._unsure.add(worksheet_name)
+                raise
+            with self._lock:
+                self._unsure.discard(worksheet_name)
+                pending["inflight"] = {}
+                actual = {
+                    row_num: first_row_num + offset for offset, (row_num, _) in enumerate(to_send)
+                } if first_row_num is not None else {}
+                if len(actual) != len(rows) or any(row_num != new for row_num, new in actual.items()):
+                    print(f"Cảnh báo ghi sau '{worksheet_name}': dòng mới nằm ở vị trí khác dự kiến, sẽ tải lại.")
+                    self._epoch += 1
+                    self._moved.setdefault(worksheet_name, {}).update(actual)
+                    pending["cells"] = {
+                        (actual.get(row_num, row_num), col_num): value
+                        for (row_num, col_num), value in pending["cells"].items()
+                    }
+                    cells = {(actual.get(row_num, row_num), col_num): value for (row_num, col_num), value in cells.items()}
+                last_row = max(actual.values(), default=0)
+                self._row_counts[worksheet_name] = max(self._row_counts.get(worksheet_name, 1), last_row)
+
+        if cells:
+            self.remote.update_cells(worksheet_name, [(row_num, col_num, value) for (row_num, col_num), value in cells.items()])
+            with self._lock:
+                for key, value in cells.items():
+                    if key in pending["cells"] and pending["cells"][key] == value:
+                        del pending["cells"][key] # Ô bị sửa tiếp trong lúc đẩy thì giữ lại
+        with self._lock:
+            self._log({"seq": seq, "op": "flushed", "ws": worksheet_name})
+
+    def flush_once(self):
+        """Đẩy một lượt mọi thay đổi đang chờ; journal được làm trống khi không còn gì chờ."""
+        with self._flush_lock:
+            errors = []
+            for worksheet_name in list(self._pending):
+                try:
+                    self._flush_worksheet(worksheet_name)
+                except Exception as e:
+                    errors.append(e)
+                    print(f"Lỗi đẩy thay đổi của tab '{worksheet_name}' lên Google Sheets: {e}")
+            with self._lock:
+                if not any(self._pending_keys(ws) for ws in self._pending):
+                    self._journal.seek(0)
+                    self._journal.truncate()
+            if errors:
+                raise errors[0]
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval_seconds)
+            try:
+                self.flush_once()
+            except Exception:
+                pass # Đã in lỗi, lượt sau thử lại
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+        return self
@@ -0,0 +1,115 @@
+"""
+Test chạy offline: Google Sheets giả trong bộ nhớ (bench.fake_gspread) được cài trước khi
+import backend, nên không cần key service account hay mạng.
+"""
+import os
+import sys
+import tempfile
+from urllib.parse import urlsplit
+
+import pytest
+import requests
+from requests.structures import CaseInsensitiveDict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench import fake_gspread  # noqa: E402
+from bench.datagen import generate_sheets  # noqa: E402
+from storage import GoogleSheetsStorage, SheetsRequestLimiter  # noqa: E402
+
+N_POS = 200
+
+SPREADSHEET = fake_gspread.FakeSpreadsheet(generate_sheets(N_POS, seed=1))
+fake_gspread.install(SPREADSHEET)
+
+# backend đọc cấu hình lúc import: ghi thẳng lên Sheet giả, file cục bộ để trong thư mục tạm
+_workdir = tempfile.mkdtemp(prefix="pom-tests-")
+os.environ["STORAGE_BACKEND"] = "gsheets"
+os.environ["JOURNAL_PATH"] = os.path.join(_workdir, "pom_writes.journal")
+os.environ["SQLITE_PATH"] = os.path.join(_workdir, "pom_local.db")
+
+
+def no_sleep(seconds):
+    pass
+
+
+def make_sheets_storage(spreadsheet, sleep=no_sleep):
+    """GoogleSheetsStorage trên spreadsheet giả; hạn mức/backoff không ngủ thật."""
+    return GoogleSheetsStorage(
+        lambda: fake_gspread.FakeClient(spreadsheet), "test-sheet", limiter=SheetsRequestLimiter(sleep=sleep)
+    )
+
+
+@pytest.fixture
+def spreadsheet():
+    """Spreadsheet giả mới, chưa gắn với backend."""
+    return fake_gspread.FakeSpreadsheet(generate_sheets(N_POS, seed=1))
+
+
+@pytest.fixture
+def backend():
+    """Module backend với dữ liệu Sheet giả nạp lại từ đầu và mọi cache trong bộ nhớ đã xóa."""
+    import backend as module
+    for title, rows in generate_sheets(N_POS, seed=1).items():
+        SPREADSHEET.worksheets[title].rows = [list(row) for row in rows]
+    SPREADSHEET.clear_errors()
+    module.sheets_storage.limiter = SheetsRequestLimiter(sleep=no_sleep)
+    module.sheets_storage.reset_handles()
+    module.invalidate_snapshot()
+    with module._id_index_lock:
+        module._id_indexes.clear()
+    with module._alloc_lock:
+        module._next_ids.clear()
+        module._unique_values.clear()
+        module._pending_unique.clear()
+    return module
+
+
+@pytest.fixture
+def client(backend):
+    return backend.app.test_client()
+
+
+@pytest.fixture
+def backend_sheets(backend):
+    """Spreadsheet giả mà backend đang dùng (đã nạp lại dữ liệu, đếm lại số lần gọi)."""
+    SPREADSHEET.calls.clear()
+    return SPREADSHEET
+
+
+class BackendTestSession:
+    """Thay session HTTP của frontend: gửi request thẳng vào app backend qua test client."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+        self.paths = [] # Đường dẫn các request đã gửi
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        path = urlsplit(url).path
+        self.paths.append(path)
+        result = self.client.get(path, query_string=params, headers=headers)
+        resp = requests.Response()
+        resp.status_code = result.status_code
+        resp.headers = CaseInsensitiveDict(result.headers)
+        resp._content = result.get_data()
+        resp.url = url
+        return resp
+
+
+@pytest.fixture
+def frontend(backend, monkeypatch):
+    """Module frontend gọi backend trong cùng tiến trình, các cache đã xóa."""
+    import frontend as module
+    monkeypatch.setattr(module, "backend_session", BackendTestSession(backend.app))
+    monkeypatch.setattr(module, "shared_cache", None)
+    module._bundles.clear()
+    module._bundle_load_locks.clear()
+    module._png_cache.clear()
+    module._replicas.clear()
+    return module
+
+
+@pytest.fixture
+def frontend_client(frontend):
+    return frontend.app.test_client()
@@ -0,0 +1,124 @@
+import gzip
+import json
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+def _raw_pos(backend):
+    """Các PO gộp tên pháp nhân, tính thẳng từ snapshot (không qua bảng gộp)."""
+    pom = backend.get_all_records_as_df("pom")
+    dim = backend.get_all_records_as_df("dim_publisher")
+    df = pom.merge(dim[['ID_phap_nhan', 'ten_phap_nhan']], on='ID_phap_nhan', how='left')
+    return df.assign(po_created_at=pd.to_datetime(df['po_created_at']))
+
+
+def test_all_data_filters_by_date_and_type(client, backend):
+    today = datetime.now()
+    start, end = f"{today - timedelta(days=200):%Y-%m-%d}", f"{today - timedelta(days=20):%Y-%m-%d}"
+    rows = client.get("/api/all-data", query_string={
+        "start_date": start, "end_date": end, "loai_sp": "vouch", "fields": "po_id,po_created_at,loai_sp",
+    }).get_json()
+
+    df = _raw_pos(backend)
+    expected = df[
+        (df['po_created_at'] >= start) & (df['po_created_at'] <= end) & (df['loai_sp'] == "Voucher")
+    ]
+    assert sorted(row["po_id"] for row in rows) == sorted(expected['po_id'].tolist())
+    assert rows and all(set(row) == {"po_id", "po_created_at", "loai_sp"} for row in rows)
+
+
+def test_all_data_filters_by_publisher_name(client, backend):
+    rows = client.get("/api/all-data", query_string={"ten_phap_nhan": "nhân 2", "fields": "po_id,ten_phap_nhan"}).get_json()
+    df = _raw_pos(backend)
+    assert sorted(row["po_id"] for row in rows) == sorted(df.loc[df['ten_phap_nhan'] == "Pháp nhân 2", 'po_id'])
+
+
+def test_month_summary_matches_rows_with_partial_months(client, backend):
+    backend.get_fact_table()
+    client.get("/api/month-summary") # Dựng cube trước các lần ghi: các lần ghi vá cube
+    today = datetime.now()
+    first_month, last_month = today - timedelta(days=200), today - timedelta(days=20)
+    start, end = f"{first_month:%Y-%m}-17", f"{last_month:%Y-%m}-09"
+    backend.append_rows_to_sheet("pom", [
+        [1, 9001, "C000001_001_260101", 1234.5, 1234.5, f"{first_month:%Y-%m}-20 10:00:00", "Pending", "Voucher", "normal"],
+        [2, 9002, "C000002_001_260101", 99.0, 99.0, f"{first_month:%Y-%m}-16 10:00:00", "Pending", "Voucher", "normal"],
+    ])
+    backend.update_sheet_row_by_id("pom", "po_id", 5, {"po_amount": 4321.0, "po_created_at": f"{last_month:%Y-%m}-08 08:00:00"})
+
+    summary = client.get("/api/month-summary", query_string={"start_date": start, "end_date": end}).get_json()
+
+    df = _raw_pos(backend)
+    rows = df[(df['po_created_at'] >= start) & (df['po_created_at'] <= end)].assign(
+        po_amount=lambda d: pd.to_numeric(d['po_amount'].astype(str).str.replace(",", "", regex=False)),
+        year_month=lambda d: d['po_created_at'].dt.strftime("%Y-%m"),
+    )
+    # Hai tháng đầu/cuối bị cắt dở đều có dòng; PO ngày 16 nằm ngoài khoảng
+    assert {f"{first_month:%Y-%m}", f"{last_month:%Y-%m}"} <= set(rows['year_month'])
+    assert 9001 in set(rows['po_id']) and 9002 not in set(rows['po_id'])
+    monthly = rows.groupby('year_month').agg(po_amount_sum=('po_amount', 'sum'), po_id_count=('po_id', 'count'))
+    campaign = rows.groupby('loai_sp')['po_amount'].sum()
+
+    assert summary["row_count"] == len(rows)
+    assert summary["po_amount_total"] == pytest.approx(rows['po_amount'].sum())
+    assert [m["year_month"] for m in summary["monthly"]] == monthly.index.tolist()
+    assert [m["po_id_count"] for m in summary["monthly"]] == monthly['po_id_count'].tolist()
+    assert [m["po_amount_sum"] for m in summary["monthly"]] == pytest.approx(monthly['po_amount_sum'].tolist())
+    assert {c["loai_sp"]: c["po_amount_sum"] for c in summary["campaign"]} == pytest.approx(campaign.to_dict())
+
+
+def test_all_data_projection_ignores_unknown_fields(client):
+    rows = client.get("/api/all-data", query_string={"fields": "po_amount,khong_co"}).get_json()
+    assert len(rows) == 200
+    assert set(rows[0]) == {"po_amount"}
+
+
+def test_all_data_without_filters_returns_every_column(client):
+    rows = client.get("/api/all-data").get_json()
+    assert len(rows) == 200
+    assert {"po_id", "po_amount", "ID_phap_nhan", "ten_phap_nhan", "client_code"} <= set(rows[0])
+    datetime.fromisoformat(rows[0]["po_created_at"]) # Ngày dạng ISO
+
+
+COLUMNAR = "application/vnd.dashboard.columns+json"
+
+
+def test_columnar_format_same_data_as_records(client):
+    query = {"fields": "po_id,po_amount,loai_sp", "loai_sp": "Voucher"}
+    records = client.get("/api/all-data", query_string=query).get_json()
+    resp = client.get("/api/all-data", query_string=query, headers={"Accept": f"{COLUMNAR}, application/json;q=0.9"})
+
+    assert resp.mimetype == COLUMNAR
+    assert "Accept" in resp.headers["Vary"]
+    payload = resp.get_json(force=True)
+    assert payload["columns"] == ["po_id", "po_amount", "loai_sp"]
+    assert [dict(zip(payload["columns"], row)) for row in zip(*payload["data"])] == records
+
+
+def test_gzip_only_when_accepted_and_large(client):
+    plain = client.get("/api/all-data")
+    assert "Content-Encoding" not in plain.headers
+
+    zipped = client.get("/api/all-data", headers={"Accept-Encoding": "gzip"})
+    assert zipped.headers["Content-Encoding"] == "gzip"
+    assert len(zipped.data) < len(plain.data)
+    assert json.loads(gzip.decompress(zipped.data)) == plain.get_json()
+
+    small = client.get("/api/all-data", query_string={"fields": "po_id", "ten_phap_nhan": "không có"},
+                       headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in small.headers # Nhỏ hơn GZIP_MIN_BYTES
+
+
+def test_frontend_reads_both_formats(frontend, client):
+    query = {"fields": "po_id,po_amount"}
+    columnar = client.get("/api/all-data", query_string=query, headers={"Accept": frontend.FRAME_ACCEPT})
+    records = client.get("/api/all-data", query_string=query)
+    for result in (columnar, records):
+        resp = requests.Response()
+        resp.status_code, resp._content = 200, result.data
+        resp.headers = CaseInsensitiveDict(result.headers)
+        df = frontend.read_frame(resp)
+        assert sorted(df.columns) == ["po_amount", "po_id"] and len(df) == 200
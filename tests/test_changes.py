@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+
+
+def _new_po(po_id, created_at):
+    return [1, po_id, "C000001_001_260101", 5000.0, 5000.0, created_at, "Pending", "Voucher", "normal"]
+
+
+def _expected_labels(backend, fact, **filters):
+    return backend.filter_dashboard_df(fact.frame(), **filters).index.tolist()
+
+
+def test_changes_reset_with_write_between_fact_and_date_index(client, backend, monkeypatch):
+    get_changes = backend.get_fact_changes
+    seen = {}
+    today = datetime.now()
+
+    def changes_then_write(since=None):
+        result = get_changes(since)
+        seen["fact"] = result[0]
+        # Lần ghi xen vào giữa lúc lấy bảng gộp và lúc dựng chỉ mục ngày
+        created_at = f"{today - timedelta(days=1):%Y-%m-%d} 09:00:00" # Nằm trong khoảng ngày lọc
+        backend.append_rows_to_sheet("pom", [_new_po(9001 + i, created_at) for i in range(5)])
+        return result
+
+    backend.get_fact_table()
+    monkeypatch.setattr(backend, "get_fact_changes", changes_then_write)
+    filters = {"start_date": f"{today - timedelta(days=90):%Y-%m-%d}", "end_date": f"{today:%Y-%m-%d}"}
+    resp = client.get("/api/changes", query_string=filters)
+
+    assert resp.status_code == 200, resp.get_json()
+    body = resp.get_json()
+    assert body["reset"] is True
+    assert body["labels"] == _expected_labels(backend, seen["fact"], **filters)
+    assert len(backend.get_fact_table()) == len(seen["fact"]) + 5
+
+
+def test_changes_delta_after_update(client, backend):
+    first = client.get("/api/changes").get_json()
+    backend.update_sheet_row_by_id("pom", "po_id", 5, {"po_amount": 4321.0})
+    delta = client.get("/api/changes", query_string={"since": first["version"], "epoch": first["epoch"]}).get_json()
+
+    assert delta["reset"] is False
+    assert len(delta["labels"]) == 1
+    assert dict(zip(delta["columns"], delta["data"]))["po_amount"] == [4321.0]
+
+
+def test_changes_delta_tracks_appends_and_updates_by_position(client, backend):
+    today = f"{datetime.now():%Y-%m-%d} 09:00:00"
+    first = client.get("/api/changes").get_json()
+    backend.append_rows_to_sheet("pom", [_new_po(9001 + i, today) for i in range(3)])
+    backend.update_sheet_row_by_id("pom", "po_id", 5, {"po_amount": 4321.0})
+    second = client.get("/api/changes", query_string={"since": first["version"], "epoch": first["epoch"]}).get_json()
+
+    assert second["reset"] is False
+    assert sorted(dict(zip(second["columns"], second["data"]))["po_id"]) == [5, 9001, 9002, 9003]
+
+    backend.append_rows_to_sheet("pom", [_new_po(9004, today)])
+    third = client.get("/api/changes", query_string={"since": second["version"], "epoch": second["epoch"]}).get_json()
+    assert dict(zip(third["columns"], third["data"]))["po_id"] == [9004]
+    assert third["labels"] == backend.get_fact_table().index[-1:].tolist()
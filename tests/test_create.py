@@ -0,0 +1,183 @@
+import io
+
+import pandas as pd
+
+
+def _po_payload(id_phap_nhan):
+    return {
+        "id_phap_nhan": id_phap_nhan, "po_amount": 5000, "po_available_amount": 5000,
+        "po_status": "Pending", "loai_sp": "Voucher", "type_po": "normal",
+    }
+
+
+def _publisher(backend, id_phap_nhan):
+    df = backend.get_all_records_as_df("dim_publisher")
+    return df[pd.to_numeric(df['ID_phap_nhan']) == id_phap_nhan].iloc[0]
+
+
+def test_create_po_uses_publisher_client_code(client, backend):
+    resp = client.post("/api/create-po", json=_po_payload(3))
+    body = resp.get_json()
+    assert body["success"], body
+    assert body["new_po_code"].startswith(f"{_publisher(backend, 3)['client_code']}_001_")
+    pom = backend.get_all_records_as_df("pom")
+    assert pom['po_id'].max() == body["new_po_id"]
+
+
+def test_create_po_does_not_copy_publisher_table(client, backend, monkeypatch):
+    assert client.post("/api/create-po", json=_po_payload(1)).get_json()["success"] # Dựng chỉ mục, bộ cấp ID
+    copied = []
+    get_all = backend.get_all_records_as_df
+    monkeypatch.setattr(backend, "get_all_records_as_df", lambda name, **kw: copied.append(name) or get_all(name, **kw))
+    assert client.post("/api/create-po", json=_po_payload(2)).get_json()["success"]
+    assert "dim_publisher" not in copied
+
+
+def test_create_po_unknown_publisher(client):
+    body = client.post("/api/create-po", json=_po_payload(99999)).get_json()
+    assert body["success"] is False
+    assert "99999" in body["message"]
+
+
+def test_create_po_for_publisher_created_after_index(client, backend):
+    backend.get_publisher_client_codes([1]) # Dựng sẵn chỉ mục ID
+    body = client.post("/api/create-publisher", json={
+        "ma_phap_nhan": "MST-NEW", "ten_phap_nhan": "Pháp nhân mới", "loai_phap_nhan": "KHÁC", "client_code": "CNEW",
+    }).get_json()
+    assert body["success"], body
+    body = client.post("/api/create-po", json=_po_payload(body["new_id"])).get_json()
+    assert body["success"], body
+    assert body["new_po_code"].startswith("CNEW_001_")
+
+
+def test_bulk_create_po(client, backend):
+    records = [_po_payload(1), _po_payload(4), _po_payload(99999)]
+    body = client.post("/api/bulk-create-po", json=records).get_json()
+    assert [row["row"] for row in body["created"]] == [1, 2]
+    assert [error["row"] for error in body["errors"]] == [3]
+    assert body["created"][1]["new_po_code"].startswith(f"{_publisher(backend, 4)['client_code']}_001_")
+    assert body["created"][1]["new_po_id"] == body["created"][0]["new_po_id"] + 1
+
+
+def _publisher_payload(code):
+    return {"ma_phap_nhan": code, "ten_phap_nhan": f"Pháp nhân {code}", "loai_phap_nhan": "KHÁC", "client_code": code}
+
+
+def _fail_once(monkeypatch, backend):
+    allocate = backend.allocate_ids
+    calls = []
+
+    def flaky(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise RuntimeError("cấp ID lỗi")
+        return allocate(*args, **kwargs)
+
+    monkeypatch.setattr(backend, "allocate_ids", flaky)
+
+
+def test_create_publisher_releases_code_when_id_allocation_fails(client, backend, monkeypatch):
+    _fail_once(monkeypatch, backend)
+    resp = client.post("/api/create-publisher", json=_publisher_payload("MST-RETRY"))
+    assert resp.status_code == 500
+    body = client.post("/api/create-publisher", json=_publisher_payload("MST-RETRY")).get_json()
+    assert body["success"], body
+
+
+def test_create_publisher_rejects_duplicate_code(client):
+    assert client.post("/api/create-publisher", json=_publisher_payload("MST-DUP")).get_json()["success"]
+    resp = client.post("/api/create-publisher", json=_publisher_payload("MST-DUP"))
+    assert resp.status_code == 400
+
+
+def test_bulk_create_publisher_releases_codes_when_id_allocation_fails(client, backend, monkeypatch):
+    _fail_once(monkeypatch, backend)
+    records = [_publisher_payload("MST-B1"), _publisher_payload("MST-B2")]
+    assert client.post("/api/bulk-create-publisher", json=records).status_code == 500
+    body = client.post("/api/bulk-create-publisher", json=records).get_json()
+    assert body["success"], body
+    assert len(body["created"]) == 2
+
+
+def test_bulk_create_po_partial_success_in_one_append(client, backend, backend_sheets):
+    records = [_po_payload(1), "không phải dict", {**_po_payload(2), "po_amount": "abc"}, _po_payload(99999), _po_payload(3)]
+    before = len(backend_sheets.worksheets["pom"].rows)
+    body = client.post("/api/bulk-create-po", json={"rows": records}).get_json()
+
+    assert body["success"] is False
+    assert [row["row"] for row in body["created"]] == [1, 5]
+    assert [error["row"] for error in body["errors"]] == [2, 3, 4]
+    assert backend_sheets.calls["append_rows"] == 1
+    new_rows = backend_sheets.worksheets["pom"].rows[before:]
+    assert [row[1] for row in new_rows] == [row["new_po_id"] for row in body["created"]]
+
+
+def test_bulk_create_po_without_valid_rows(client, backend_sheets):
+    resp = client.post("/api/bulk-create-po", json=[_po_payload(99999)])
+    assert resp.status_code == 400
+    assert backend_sheets.calls["append_rows"] == 0
+
+
+def test_bulk_create_publisher_reports_duplicate_codes(client, backend, backend_sheets):
+    existing = _publisher(backend, 1)['ma_phap_nhan']
+    records = [_publisher_payload("MST-X1"), _publisher_payload(existing), _publisher_payload("MST-X1"), _publisher_payload("MST-X2")]
+    body = client.post("/api/bulk-create-publisher", json=records).get_json()
+
+    assert [row["row"] for row in body["created"]] == [1, 4]
+    assert [error["row"] for error in body["errors"]] == [2, 3]
+    assert body["created"][1]["new_id"] == body["created"][0]["new_id"] + 1
+    assert backend_sheets.calls["append_rows"] == 1
+
+
+def test_bulk_create_publisher_from_csv(client, backend):
+    csv = "ma_phap_nhan,ten_phap_nhan,loai_phap_nhan,client_code\nMST-CSV1,Pháp nhân CSV,KHÁC,CCSV1\n"
+    body = client.post(
+        "/api/bulk-create-publisher", data={"file": (io.BytesIO(csv.encode("utf-8")), "pub.csv")},
+        content_type="multipart/form-data",
+    ).get_json()
+    assert body["success"], body
+    assert _publisher(backend, body["created"][0]["new_id"])['ten_phap_nhan'] == "Pháp nhân CSV"
+
+
+def test_code_edit_while_reservation_pending(client, backend):
+    old_code = _publisher(backend, 1)['ma_phap_nhan']
+    assert backend.reserve_unique_value("dim_publisher", "ma_phap_nhan", "MST-PENDING") # Đang tạo, chưa ghi xong
+    try:
+        assert client.put("/api/publisher/1", json={"ma_phap_nhan": "MST-EDITED"}).get_json()["success"]
+
+        assert client.post("/api/create-publisher", json=_publisher_payload("MST-EDITED")).status_code == 400
+        assert client.post("/api/create-publisher", json=_publisher_payload(old_code)).get_json()["success"]
+        assert client.post("/api/create-publisher", json=_publisher_payload("MST-PENDING")).status_code == 400
+    finally:
+        backend.finish_unique_value("dim_publisher", "ma_phap_nhan", "MST-PENDING", False)
+
+
+def test_bulk_code_edits_update_unique_set(client, backend):
+    old_codes = [_publisher(backend, i)['ma_phap_nhan'] for i in (1, 2)]
+    backend.reserve_unique_value("dim_publisher", "ma_phap_nhan", "MST-SEED") # Dựng set mã
+    body = client.put("/api/bulk-update-publisher", json=[
+        {"id": 1, "changes": {"ma_phap_nhan": "MST-B-A"}},
+        {"id": 2, "changes": {"ma_phap_nhan": "MST-B-B"}},
+        {"id": 1, "changes": {"ma_phap_nhan": "MST-B-C"}},
+    ]).get_json()
+    assert body["success"], body
+
+    for code in ("MST-B-B", "MST-B-C"):
+        assert client.post("/api/create-publisher", json=_publisher_payload(code)).status_code == 400
+    for code in old_codes + ["MST-B-A"]:
+        assert client.post("/api/create-publisher", json=_publisher_payload(code)).get_json()["success"], code
+
+
+def test_unique_seed_sees_code_edit_during_load(client, backend, monkeypatch):
+    load = backend._load_snapshot
+
+    def load_then_edit(worksheet_name, force_refresh=False):
+        df = load(worksheet_name, force_refresh)
+        if worksheet_name == "dim_publisher":
+            monkeypatch.setattr(backend, "_load_snapshot", load)
+            # Sửa mã xen vào giữa lúc đọc snapshot và lúc dựng set mã
+            client.put("/api/publisher/3", json={"ma_phap_nhan": "MST-RACE"})
+        return df
+
+    monkeypatch.setattr(backend, "_load_snapshot", load_then_edit)
+    assert backend.reserve_unique_value("dim_publisher", "ma_phap_nhan", "MST-RACE") is False
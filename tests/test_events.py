@@ -0,0 +1,65 @@
+import json
+
+
+def _events(client, headers=None):
+    """Luồng sự kiện SSE: trả về (response, hàm đọc sự kiện kế tiếp dạng dict)."""
+    resp = client.get("/api/events", headers=headers, buffered=False)
+    chunks = iter(resp.response)
+
+    def next_event():
+        while True:
+            chunk = next(chunks)
+            chunk = chunk.decode("utf-8") if isinstance(chunk, bytes) else chunk
+            data = [line[len("data: "):] for line in chunk.splitlines() if line.startswith("data: ")]
+            if data:
+                return json.loads(data[0])
+
+    return resp, next_event
+
+
+def test_events_for_writes(client, backend):
+    version = backend.get_data_version()
+    resp, next_event = _events(client)
+    try:
+        assert next_event() == {"version": version, "action": "connected"}
+
+        client.put("/api/po/9", json={"po_amount": 123})
+        event = next_event()
+        assert (event["table"], event["action"], event["ids"]) == ("pom", "update", [9])
+        assert event["fields"] == ["po_amount"] and event["version"] > version
+
+        body = client.post("/api/create-po", json={
+            "id_phap_nhan": 1, "po_amount": 10, "po_available_amount": 10,
+            "po_status": "Pending", "loai_sp": "Voucher", "type_po": "normal",
+        }).get_json()
+        event = next_event()
+        assert (event["action"], event["ids"]) == ("create", [body["new_po_id"]])
+    finally:
+        resp.close()
+    assert not backend.change_broadcaster._queues # Đóng kết nối -> bỏ đăng ký
+
+
+def test_stale_last_event_id_gets_reload(client, backend):
+    version = backend.get_data_version()
+    resp, next_event = _events(client, {"Last-Event-ID": str(version)})
+    assert next_event()["action"] == "connected"
+    resp.close()
+
+    client.put("/api/po/9", json={"po_amount": 456}) # Lỡ sự kiện này trong lúc mất kết nối
+    resp, next_event = _events(client, {"Last-Event-ID": str(version)})
+    assert next_event() == {"version": backend.get_data_version(), "action": "reload"}
+    resp.close()
+
+
+def test_too_many_clients(client, backend, monkeypatch):
+    monkeypatch.setattr(backend.change_broadcaster, "max_clients", 0)
+    assert client.get("/api/events").status_code == 503
+
+
+def test_slow_client_queue_collapses_to_reload(backend):
+    broadcaster = backend.ChangeBroadcaster(max_clients=1, queue_size=2)
+    events = broadcaster.subscribe()
+    for version in (1, 2, 3):
+        broadcaster.publish({"version": version, "action": "update"})
+    assert events.get_nowait() == {"version": 3, "action": "reload"}
+    assert events.empty()
@@ -0,0 +1,124 @@
+"""Các lần ghi vá snapshot/bảng gộp chia khúc phải cho kết quả giống hệt dựng lại từ đầu."""
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal, assert_series_equal
+
+
+@pytest.fixture
+def small_chunks(backend, monkeypatch):
+    """Khúc 16 dòng và phần mới của chỉ mục ngày 8 dòng: 200 PO nằm trên nhiều khúc."""
+    monkeypatch.setattr(backend, "SNAPSHOT_CHUNK_ROWS", 16)
+    monkeypatch.setattr(backend, "DATE_INDEX_RECENT_MAX", 8)
+    return backend
+
+
+def _po(publisher_id, po_id, created_at, amount=5000.0, loai_sp="Voucher"):
+    return [publisher_id, po_id, f"C{publisher_id:06d}_001_260101", amount, amount, created_at, "Pending", loai_sp, "normal"]
+
+
+def _plain(df):
+    """Cột category -> object (bảng vá có thể xếp danh mục khác bảng dựng lại)."""
+    return df.astype({col: object for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)})
+
+
+def _derived(backend):
+    return backend._get_fact_derived({
+        "rfm": backend._build_rfm_aggregates, "cube": backend.MonthCube.build,
+        "dates": backend._build_date_index, "publishers": backend._build_publisher_names,
+        "publisher_rows": backend._build_publisher_rows,
+    })
+
+
+def _write(backend, write):
+    write()
+    # Lần ghi vá thẳng vào bảng gộp (không để lần đọc sau dựng lại)
+    assert backend._fact["versions"] == backend._fact_source_versions()
+
+
+def _assert_matches_rebuild(backend):
+    derived, fact = _derived(backend)
+    assert len(fact.chunks) > 1
+    pom = backend._load_snapshot("pom")
+    assert_frame_equal(pom, backend._load_records_as_df("pom"), check_dtype=False)
+    rebuilt = backend._build_fact_df(pom, backend._load_snapshot("dim_publisher"))
+    assert_frame_equal(_plain(fact.frame()).sort_index(), _plain(rebuilt))
+
+    assert_frame_equal(derived["rfm"], backend._build_rfm_aggregates(rebuilt))
+    cube = backend._build_month_cube(rebuilt)
+    assert_frame_equal(
+        _plain(derived["cube"].frame()).sort_values(backend.CUBE_KEYS, ignore_index=True),
+        cube.sort_values(backend.CUBE_KEYS, ignore_index=True),
+    )
+    assert_series_equal(
+        derived["publishers"].astype(object).sort_index(),
+        backend._build_publisher_names(rebuilt).astype(object).sort_index(),
+    )
+    by_publisher = {int(k): v.tolist() for k, v in backend._build_publisher_rows(fact.frame()).items()}
+    assert {int(k): v.tolist() for k, v in derived["publisher_rows"].items()} == by_publisher
+    dates = rebuilt['po_created_at']
+    for start, end in [(None, None), ("2025-06-01", "2025-09-15"), (None, "2025-03-01"), ("2026-01-01", None)]:
+        labels = fact.take(np.sort(derived["dates"].between(start, end))).index
+        expected = dates[(dates >= (start or dates.min())) & (dates <= (end or dates.max()))].index
+        assert sorted(labels) == sorted(expected)
+
+
+def test_writes_patch_chunked_fact_like_rebuild(small_chunks):
+    backend = small_chunks
+    _derived(backend)
+    today = datetime.now()
+    day = lambda days: f"{today - timedelta(days=days):%Y-%m-%d} 09:00:00"  # noqa: E731
+
+    _write(backend, lambda: backend.append_rows_to_sheet("pom", [_po(1 + i % 3, 9001 + i, day(i)) for i in range(12)]))
+    _write(backend, lambda: backend.update_sheet_rows_by_id("pom", "po_id", [
+        (5, {"po_amount": 4321.0}),
+        (150, {"po_created_at": "2025-01-03 10:00:00"}), # Đổi ngày: bỏ mục cũ của chỉ mục ngày
+        (9003, {"loai_sp": "Sách", "po_amount": 0}), # loai_sp mới, PO không còn tính vào R/F/M
+        (9004, {"ID_phap_nhan": 4}), # PO chuyển sang pháp nhân khác
+    ]))
+    _write(backend, lambda: backend.update_sheet_row_by_id("dim_publisher", "ID_phap_nhan", 2, {"ten_phap_nhan": "Công ty Mới"}))
+    _write(backend, lambda: backend.append_rows_to_sheet("dim_publisher", [[5, "MST00000005", "Pháp nhân 5", "KHÁC", "C000005"]]))
+    _write(backend, lambda: backend.append_rows_to_sheet("pom", [_po(5, 9100, day(3), loai_sp="Others")]))
+
+    # Hai lần ghi song song cập nhật snapshot theo thứ tự ngược với thứ tự trên Sheet
+    first = backend.storage.append_rows("pom", [_po(3, 9201, day(1))])
+    second = backend.storage.append_rows("pom", [_po(4, 9202, day(2))])
+    _write(backend, lambda: backend._snapshot_append_rows("pom", [_po(4, 9202, day(2))], second))
+    _write(backend, lambda: backend._snapshot_append_rows("pom", [_po(3, 9201, day(1))], first))
+
+    _assert_matches_rebuild(backend)
+
+
+def test_write_builds_outside_snapshot_lock(small_chunks, monkeypatch):
+    backend = small_chunks
+    backend.get_fact_table()
+    held = []
+    fact_patch = backend._fact_patch
+
+    def checking_patch(*args):
+        held.append(backend._snapshot_lock.locked())
+        return fact_patch(*args)
+
+    monkeypatch.setattr(backend, "_fact_patch", checking_patch)
+    backend.update_sheet_row_by_id("pom", "po_id", 7, {"po_amount": 777.0})
+    assert held == [False]
+    assert backend.get_fact_table().loc[lambda df: df['po_id'] == 7, 'po_amount'].tolist() == [777.0]
+
+
+def test_write_during_reload_drops_snapshot(small_chunks, backend_sheets, monkeypatch):
+    backend = small_chunks
+    backend.get_fact_table()
+    fact_patch = backend._fact_patch
+
+    def reload_then_patch(*args):
+        backend._load_snapshot("pom", force_refresh=True) # Tải lại xen vào giữa lúc dựng bản mới
+        return fact_patch(*args)
+
+    monkeypatch.setattr(backend, "_fact_patch", reload_then_patch)
+    backend_sheets.worksheets["pom"].rows[1][3] = 1.0 # Sửa ngoài backend: bản tải lại có version mới
+    backend.update_sheet_row_by_id("pom", "po_id", 7, {"po_amount": 777.0})
+
+    assert "pom" not in backend._snapshots # Không đè bản tải lại; lần đọc sau tải lại (đã có lần ghi)
+    assert backend.get_fact_table().loc[lambda df: df['po_id'] == 7, 'po_amount'].tolist() == [777.0]
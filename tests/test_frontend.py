@@ -0,0 +1,153 @@
+import threading
+
+import pandas as pd
+import pytest
+
+
+def _write_po(backend, po_id=5, amount=4321.0):
+    backend.update_sheet_row_by_id("pom", "po_id", po_id, {"po_amount": amount})
+    return backend.get_data_version()
+
+
+def test_png_etag_and_not_modified(frontend_client):
+    first = frontend_client.get("/plot/monthly.png")
+    assert first.status_code == 200 and first.mimetype == "image/png"
+    assert first.headers["ETag"]
+
+    again = frontend_client.get("/plot/monthly.png", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+
+
+def test_png_cache_reused_for_same_filters(frontend, frontend_client, monkeypatch):
+    frontend_client.get("/plot/campaign.png", query_string={"loai_sp": "Voucher"})
+    rendered = []
+    render = frontend.render_png
+    monkeypatch.setattr(frontend, "render_png", lambda *args: rendered.append(args) or render(*args))
+
+    assert frontend_client.get("/plot/campaign.png", query_string={"loai_sp": "Voucher"}).status_code == 200
+    assert rendered == []
+    assert frontend_client.get("/plot/campaign.png", query_string={"loai_sp": "Others"}).status_code == 200
+    assert len(rendered) == 1
+
+
+def test_png_redrawn_when_data_version_changes(frontend, frontend_client, backend):
+    first = frontend_client.get("/plot/monthly.png")
+    version = _write_po(backend, amount=10_000_000_000.0) # Cột tháng của PO này cao hẳn lên
+
+    resp = frontend_client.get(
+        "/plot/monthly.png", query_string={"min_version": version}, headers={"If-None-Match": first.headers["ETag"]}
+    )
+    assert resp.status_code == 200
+    assert resp.headers["ETag"] != first.headers["ETag"]
+    assert {key[2] for key in frontend._png_cache} == {version} # Ảnh của version cũ đã bỏ
+
+
+def test_expired_bundle_checks_version_before_reloading(frontend, frontend_client, backend, monkeypatch):
+    monkeypatch.setattr(frontend, "BUNDLE_TTL_SECONDS", 0)
+    first = frontend_client.get("/plot/monthly.png")
+    frontend.backend_session.paths.clear()
+
+    again = frontend_client.get("/plot/monthly.png", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+    assert frontend.backend_session.paths == ["/api/data-version"] # Dữ liệu chưa đổi -> không tải lại
+
+    _write_po(backend, amount=10_000_000_000.0)
+    resp = frontend_client.get("/plot/monthly.png", headers={"If-None-Match": first.headers["ETag"]})
+    assert resp.status_code == 200
+
+
+
+def test_bundle_takes_oldest_version_of_its_parts(frontend, backend, monkeypatch):
+    fetch_rfm = frontend.fetch_rfm_aggregates
+    versions = []
+
+    def rfm_then_write(*args, **kwargs):
+        result = fetch_rfm(*args, **kwargs)
+        versions.append(_write_po(backend, amount=1234.0 + len(versions))) # Ghi xen giữa hai lần tải
+        return result
+
+    monkeypatch.setattr(frontend, "fetch_rfm_aggregates", rfm_then_write)
+    bundle = frontend.get_dashboard_bundle()
+    assert bundle["data_version"] == versions[0] - 1 # Bảng R/F/M tải trước lần ghi
+
+    again = frontend.get_dashboard_bundle(min_version=versions[0])
+    assert again is not bundle and again["data_version"] >= versions[0] - 1
+    assert frontend.get_dashboard_bundle(min_version=versions[-1] - 1) is again
+
+
+def test_evicting_bundle_keeps_lock_held_by_loader(frontend, monkeypatch):
+    monkeypatch.setattr(frontend, "BUNDLE_TTL_SECONDS", 0)
+    monkeypatch.setattr(frontend, "BUNDLE_MAX_ENTRIES", 1)
+    frontend.get_dashboard_bundle({"loai_sp": "Voucher"})
+    key = frontend._filter_key({"loai_sp": "Voucher"})
+    load = frontend._bundle_load_locks[key]
+    checking, release = threading.Event(), threading.Event()
+    fetch_version = frontend.fetch_data_version
+
+    def blocked_fetch_version():
+        checking.set()
+        release.wait(5)
+        return fetch_version()
+
+    monkeypatch.setattr(frontend, "fetch_data_version", blocked_fetch_version)
+    loader = threading.Thread(target=frontend.get_dashboard_bundle, args=({"loai_sp": "Voucher"},))
+    loader.start()
+    assert checking.wait(5) # Đang giữ khóa của bộ lọc Voucher
+    frontend.get_dashboard_bundle({"loai_sp": "Others"}) # Đẩy gói Voucher ra khỏi cache
+    assert key not in frontend._bundles
+    assert frontend._bundle_load_locks[key] is load
+    release.set()
+    loader.join(5)
+    assert load["users"] == 0 and key not in frontend._bundle_load_locks # Hết người dùng thì mới bỏ khóa
+
+def _raw_pos(backend):
+    pom = backend.get_all_records_as_df("pom")
+    return pom.assign(
+        po_created_at=pd.to_datetime(pom['po_created_at']), po_amount=pd.to_numeric(pom['po_amount'])
+    )
+
+
+def test_chart_monthly_payload(frontend_client, backend):
+    body = frontend_client.get("/api/chart/monthly").get_json()
+    df = _raw_pos(backend)
+    expected = df.groupby(df['po_created_at'].dt.to_period('M').astype(str)).agg(
+        po_amount_sum=('po_amount', 'sum'), po_id_count=('po_id', 'count')
+    ).sort_index()
+
+    data = body["data"]
+    assert data["labels"] == expected.index.tolist()
+    assert data["po_amount_sum"] == pytest.approx(expected['po_amount_sum'].tolist())
+    assert data["po_id_count"] == expected['po_id_count'].tolist()
+
+
+def test_chart_campaign_payload(frontend_client, backend):
+    data = frontend_client.get("/api/chart/campaign").get_json()["data"]
+    df = _raw_pos(backend)
+    expected = df.groupby('loai_sp')['po_amount'].sum().sort_values(ascending=False)
+
+    assert data["labels"] == expected.index.tolist()
+    assert data["po_amount_sum"] == pytest.approx(expected.tolist())
+    assert sum(data["percentage"]) == pytest.approx(100)
+
+
+def test_chart_pareto_payload(frontend_client):
+    data = frontend_client.get("/api/chart/pareto").get_json()["data"]
+    assert len(data["labels"]) == len(set(data["labels"])) == len(data["monetary"])
+    assert data["monetary"] == sorted(data["monetary"], reverse=True)
+    assert data["cum_percentage"][-1] == pytest.approx(100)
+
+
+def test_chart_without_data(frontend_client):
+    for name in ("monthly", "campaign", "pareto"):
+        resp = frontend_client.get(f"/api/chart/{name}", query_string={"loai_sp": "không có loại này"})
+        assert resp.status_code == 200
+        assert resp.get_json()["data"] is None
+
+
+def test_dashboard_loads_chartjs_from_own_static(frontend, frontend_client, monkeypatch):
+    html = frontend_client.get("/").get_data(as_text=True)
+    assert "cdn.jsdelivr" not in html and "<script src=\"http" not in html
+
+    monkeypatch.setattr(frontend, "CHARTJS_FILE", "js/main.js") # Giả lập file Chart.js đã có
+    html = frontend_client.get("/").get_data(as_text=True)
+    assert html.count('src="/static/js/main.js"') == 2
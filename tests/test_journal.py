@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+from conftest import N_POS, make_sheets_storage
+from storage import WriteBehindStorage
+
+
+class Crash(BaseException):
+    """Tiến trình chết giữa chừng (không bị except Exception trong storage bắt)."""
+
+
+def po_row(po_id):
+    return [1, po_id, "C000001_001_260101", 5000, 5000, "2026-01-01 10:00:00", "Pending", "Voucher", "normal"]
+
+
+def open_journal(spreadsheet, path):
+    return WriteBehindStorage(make_sheets_storage(spreadsheet), str(path), interval_seconds=0)
+
+
+def sheet_po_ids(spreadsheet):
+    return [row[1] for row in spreadsheet.worksheets["pom"].rows[1:]]
+
+
+def test_replay_after_crash_before_flush(tmp_path, spreadsheet):
+    path = tmp_path / "writes.journal"
+    journal = open_journal(spreadsheet, path)
+    assert journal.append_rows("pom", [po_row(9001)]) == N_POS + 2
+    journal.update_cells("pom", [(2, 4, 42)])
+    assert len(sheet_po_ids(spreadsheet)) == N_POS # Chưa đẩy gì lên Sheet
+
+    restarted = open_journal(spreadsheet, path)
+    df = restarted.load_df("pom")
+    assert df['po_id'].tolist()[-1] == 9001
+    assert df['po_amount'].iloc[0] == 42
+
+    restarted.flush_once()
+    assert sheet_po_ids(spreadsheet).count(9001) == 1
+    assert spreadsheet.worksheets["pom"].rows[1][3] == 42
+    assert os.path.getsize(path) == 0
+
+
+def test_replay_after_crash_between_append_and_flushed_marker(tmp_path, spreadsheet, monkeypatch):
+    path = tmp_path / "writes.journal"
+    journal = open_journal(spreadsheet, path)
+    journal.append_rows("pom", [po_row(9001)])
+    journal.update_cells("pom", [(2, 4, 42)])
+    log = journal._log
+
+    def crash_before_marker(entry):
+        if entry["op"] == "flushed":
+            raise Crash()
+        log(entry)
+
+    monkeypatch.setattr(journal, "_log", crash_before_marker)
+    with pytest.raises(Crash):
+        journal.flush_once()
+    assert sheet_po_ids(spreadsheet).count(9001) == 1 # Đã lên Sheet nhưng journal chưa có dấu đã đẩy
+
+    restarted = open_journal(spreadsheet, path)
+    assert restarted.load_df("pom")['po_id'].tolist().count(9001) == 1
+    restarted.flush_once()
+    assert sheet_po_ids(spreadsheet).count(9001) == 1 # Không ghi trùng
+    assert spreadsheet.worksheets["pom"].rows[1][3] == 42
+
+
+def test_replay_ignores_truncated_last_line(tmp_path, spreadsheet):
+    path = tmp_path / "writes.journal"
+    journal = open_journal(spreadsheet, path)
+    journal.append_rows("pom", [po_row(9001)])
+    journal.append_rows("pom", [po_row(9002)])
+    journal._journal.close()
+    content = path.read_bytes()
+    path.write_bytes(content[:-15]) # Dòng cuối ghi dở khi mất điện
+
+    restarted = open_journal(spreadsheet, path)
+    assert restarted.load_df("pom")['po_id'].tolist()[-1] == 9001
+    # Ghi tiếp sau dòng hỏng rồi lại tắt: lần ghi mới vẫn phải đọc lại được
+    restarted.append_rows("pom", [po_row(9003)])
+
+    again = open_journal(spreadsheet, path)
+    again.flush_once()
+    ids = sheet_po_ids(spreadsheet)
+    assert ids[-2:] == [9001, 9003]
+    assert 9002 not in ids
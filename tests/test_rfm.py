@@ -0,0 +1,123 @@
+"""calculate_rfm (vector hóa) phải cho kết quả giống hệt cài đặt cũ (giữ lại bên dưới làm mẫu)."""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+import frontend
+
+
+def legacy_calculate_rfm(df):
+    """calculate_rfm trước khi vector hóa (3 groupby + merge, safe_qcut, apply theo dòng)."""
+    df = df[df['po_amount'] > 0].copy()
+    if 'ID_phap_nhan' not in df.columns:
+        df = df.rename(columns={'ID': 'ID_phap_nhan'})
+    df = df.dropna(subset=['ID_phap_nhan'])
+
+    if df.empty:
+        return pd.DataFrame()
+
+    NOW = pd.to_datetime(datetime.now().date())
+    rfm_r = df.groupby('ID_phap_nhan')['po_created_at'].max().reset_index()
+    rfm_r['Recency'] = (NOW - rfm_r['po_created_at']).dt.days
+    rfm_r = rfm_r[['ID_phap_nhan', 'Recency']]
+    rfm_f = df.groupby('ID_phap_nhan')['po_id'].nunique().reset_index().rename(columns={'po_id': 'Frequency'})
+    rfm_m = df.groupby('ID_phap_nhan')['po_amount'].sum().reset_index().rename(columns={'po_amount': 'Monetary'})
+
+    rfm_df = pd.merge(rfm_r, rfm_f, on='ID_phap_nhan', how='outer')
+    rfm_df = pd.merge(rfm_df, rfm_m, on='ID_phap_nhan', how='outer')
+    rfm_df['Frequency'] = rfm_df['Frequency'].fillna(0)
+    rfm_df['Monetary'] = rfm_df['Monetary'].fillna(0)
+
+    def safe_qcut(series, labels, ascending=True):
+        try:
+            return pd.qcut(series, 5, labels=labels, duplicates='drop').astype('Int64')
+        except:  # noqa: E722
+            rank = series.rank(method='first', ascending=ascending)
+            return rank.apply(lambda x: min(5, max(1, int(x/len(series)*5)+1)))
+
+    rfm_df['R_score'] = safe_qcut(rfm_df['Recency'], labels=[5, 4, 3, 2, 1], ascending=False)
+    rfm_df['F_score'] = safe_qcut(rfm_df['Frequency'], labels=[1, 2, 3, 4, 5])
+    rfm_df['M_score'] = safe_qcut(rfm_df['Monetary'], labels=[1, 2, 3, 4, 5])
+
+    def rfm_segment(row):
+        r, f, m = row['R_score'], row['F_score'], row['M_score']
+        if r >= 4 and f >= 4 and m >= 4:
+            return 'Champion'
+        elif r >= 4 and f >= 3:
+            return 'Loyal'
+        elif r >= 3 and m >= 3:
+            return 'Potential'
+        elif r <= 2 and f <= 2:
+            return 'At risk'
+        else:
+            return 'Others'
+
+    rfm_df['Segment'] = rfm_df.apply(rfm_segment, axis=1)
+
+    return rfm_df[['ID_phap_nhan', 'Recency', 'Frequency', 'Monetary', 'R_score', 'F_score', 'M_score', 'Segment']]
+
+
+def make_pos(n_pos, n_publishers, seed, amounts=None, days=None):
+    """Bảng PO đã ép kiểu như dữ liệu dashboard; amounts/days: tập giá trị để tạo nhiều giá trị trùng."""
+    rng = np.random.default_rng(seed)
+    if amounts is None:
+        po_amount = rng.integers(0, 5_000_000, size=n_pos).astype(float)
+    else:
+        po_amount = rng.choice(amounts, size=n_pos).astype(float)
+    day_offsets = rng.integers(0, 400, size=n_pos) if days is None else rng.choice(days, size=n_pos)
+    today = pd.Timestamp(datetime.now().date())
+    return pd.DataFrame({
+        'ID_phap_nhan': rng.integers(1, n_publishers + 1, size=n_pos),
+        'po_id': np.arange(1, n_pos + 1),
+        'po_amount': po_amount,
+        'po_created_at': today - pd.to_timedelta(day_offsets, unit='D') + pd.to_timedelta(10, unit='h'),
+    })
+
+
+def assert_same_rfm(df):
+    expected = legacy_calculate_rfm(df)
+    actual = frontend.calculate_rfm(df)
+    assert_frame_equal(actual.reset_index(drop=True), expected.reset_index(drop=True))
+    return actual
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_frames(seed):
+    rng = np.random.default_rng(seed)
+    assert_same_rfm(make_pos(int(rng.integers(50, 3000)), int(rng.integers(5, 400)), seed))
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_ties(seed):
+    # Ít giá trị khác nhau: nhiều pháp nhân trùng Monetary/Recency
+    assert_same_rfm(make_pos(500, 120, seed, amounts=[0, 1000, 2000, 1_000_000], days=[0, 30, 365]))
+
+
+def test_rank_fallback_column():
+    # Mỗi pháp nhân đúng một PO -> Frequency toàn 1, qcut không chia được, phải chia theo thứ hạng
+    df = make_pos(60, 1, seed=3).assign(ID_phap_nhan=np.arange(1, 61))
+    with pytest.raises(ValueError):
+        pd.qcut(pd.Series(np.ones(60)), 5, labels=[1, 2, 3, 4, 5], duplicates='drop')
+    rfm = assert_same_rfm(df)
+    assert sorted(rfm['F_score'].unique()) == [1, 2, 3, 4, 5]
+
+
+def test_single_customer():
+    rfm = assert_same_rfm(make_pos(10, 1, seed=4))
+    assert len(rfm) == 1
+
+
+def test_empty_frame():
+    df = make_pos(10, 3, seed=5).assign(po_amount=0.0) # Không còn PO có doanh thu
+    assert frontend.calculate_rfm(df).empty
+    assert_same_rfm(df)
+    assert_same_rfm(make_pos(0, 1, seed=6))
+
+
+def test_missing_publisher_ids():
+    df = make_pos(400, 50, seed=7).astype({'ID_phap_nhan': float})
+    df.loc[df.index[::9], 'ID_phap_nhan'] = np.nan
+    assert_same_rfm(df)
@@ -0,0 +1,41 @@
+import pandas as pd
+
+
+def test_fold_text(backend):
+    assert backend.fold_text("Ngân hàng Đông Á") == "ngan hang dong a"
+
+
+def test_substring_index_matches_without_accents(backend):
+    values = ["Ngân hàng Á Châu", "Công ty Ngàn Sao", "Quà vật lý", "Voucher"]
+    index = backend.SubstringIndex(values)
+    assert index.search("ngan") == ["Ngân hàng Á Châu", "Công ty Ngàn Sao"]
+    assert index.search("NGÂN HÀNG") == ["Ngân hàng Á Châu"]
+    assert index.search("vat ly") == ["Quà vật lý"]
+    assert index.search("qu") == ["Quà vật lý"] # Ngắn hơn n-gram: so trên mọi giá trị
+    assert index.search("không có") == []
+
+
+def test_contains_mask_same_as_row_scan(backend):
+    series = pd.Series(["Ngân hàng A", None, "ngan hang b", "Khác", "Ngân hàng A"], dtype="category")
+    expected = [True, False, True, False, True]
+    assert backend._contains_mask(series, "Ngan").tolist() == expected
+    assert backend._contains_mask(series.astype(object), "Ngan").tolist() == expected
+    assert backend._contains_mask(series, "an").tolist() == [True, True, True, False, True] # Ô trống như 'nan'
+
+
+def test_filter_rebuilds_index_for_new_names(client, backend):
+    rows = client.get("/api/all-data", query_string={"ten_phap_nhan": "ngan hang", "fields": "po_id"}).get_json()
+    assert rows == []
+
+    body = client.post("/api/create-publisher", json={
+        "ma_phap_nhan": "MST-NH", "ten_phap_nhan": "Ngân Hàng Đông Á", "loai_phap_nhan": "NGÂN HÀNG", "client_code": "CNH",
+    }).get_json()
+    assert client.post("/api/create-po", json={
+        "id_phap_nhan": body["new_id"], "po_amount": 10, "po_available_amount": 10,
+        "po_status": "Pending", "loai_sp": "Voucher", "type_po": "normal",
+    }).get_json()["success"]
+
+    rows = client.get("/api/all-data", query_string={"ten_phap_nhan": "ngan hang", "fields": "ten_phap_nhan"}).get_json()
+    assert rows == [{"ten_phap_nhan": "Ngân Hàng Đông Á"}]
+    summary = client.get("/api/month-summary", query_string={"ten_phap_nhan": "dong a"}).get_json()
+    assert summary["row_count"] == 1
@@ -0,0 +1,62 @@
+"""Cache dùng chung: chỉ lưu bytes/JSON và từ chối thư mục mà user khác ghi được."""
+import os
+import stat
+
+import pandas as pd
+import pytest
+
+from shared_cache import SharedFileCache
+
+posix_only = pytest.mark.skipif(not hasattr(os, "getuid"), reason="quyền kiểu POSIX")
+
+
+@posix_only
+def test_directory_created_private(tmp_path):
+    directory = tmp_path / "cache"
+    SharedFileCache(str(directory), 1 << 20)
+    assert stat.S_IMODE(os.stat(directory).st_mode) & 0o077 == 0
+
+
+@posix_only
+@pytest.mark.parametrize("mode", [0o777, 0o770, 0o702])
+def test_writable_by_others_refused(tmp_path, mode):
+    directory = tmp_path / "cache"
+    directory.mkdir()
+    os.chmod(directory, mode)
+    with pytest.raises(PermissionError):
+        SharedFileCache(str(directory), 1 << 20)
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid") or os.getuid() != 0, reason="cần root để đổi chủ thư mục")
+def test_owned_by_other_user_refused(tmp_path):
+    directory = tmp_path / "cache"
+    directory.mkdir(mode=0o700)
+    os.chown(directory, 65534, 65534)
+    with pytest.raises(PermissionError):
+        SharedFileCache(str(directory), 1 << 20)
+
+
+def test_json_round_trip_and_garbage(tmp_path):
+    cache = SharedFileCache(str(tmp_path / "cache"), 1 << 20)
+    cache.set_json(("k", 1), {"a": [1, 2.5, None, "Pháp nhân"]})
+    assert cache.get_json(("k", 1)) == {"a": [1, 2.5, None, "Pháp nhân"]}
+    cache.set(("k", 2), b"\x80\x04not json")
+    assert cache.get_json(("k", 2)) is None
+    assert cache.get_json(("k", 3)) is None
+
+
+def test_replica_round_trip():
+    import frontend
+    df = frontend._prepare_rows(pd.DataFrame({
+        "po_id": [1, 2, 3],
+        "po_created_at": ["2026-01-02 03:04:05", None, "2026-02-03 00:00:00"],
+        "po_amount": [1000.0, None, 2500.5],
+        "ten_phap_nhan": ["Pháp nhân 1", "Pháp nhân 2", None],
+    }, index=[10, 11, 12]))
+    entry = {"df": df, "version": 7, "epoch": "e1"}
+
+    restored = frontend._replica_from_json(frontend._replica_to_json(entry))
+    assert restored["version"] == 7 and restored["epoch"] == "e1"
+    pd.testing.assert_frame_equal(restored["df"], df, check_dtype=False)
+    assert restored["df"]["po_created_at"].dtype.kind == "M"
+    assert frontend._replica_from_json({"version": 1}) is None
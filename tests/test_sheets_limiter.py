@@ -0,0 +1,72 @@
+import threading
+
+import gspread
+import pytest
+
+from bench.fake_gspread import Latency
+from conftest import N_POS, make_sheets_storage
+from storage import SHEETS_MAX_RETRIES
+
+NEW_PO = [1, 9001, "C000001_001_260101", 5000, 5000, "2026-01-01 10:00:00", "Pending", "Voucher", "normal"]
+
+
+def test_read_retried_with_backoff_after_429(spreadsheet):
+    sleeps = []
+    storage = make_sheets_storage(spreadsheet, sleep=sleeps.append)
+    spreadsheet.inject_error("get_all_records", 429, times=2)
+
+    assert len(storage.load_df("pom")) == N_POS
+    assert spreadsheet.calls["get_all_records"] == 3
+    # Mỗi lần 429: chờ lùi ngẫu nhiên (<= BACKOFF_BASE * 2^lần thử) và bucket đọc bị xả
+    assert len(sleeps) >= 2
+    assert all(0 <= seconds <= 4 for seconds in sleeps)
+
+
+def test_read_gives_up_after_max_retries(spreadsheet):
+    storage = make_sheets_storage(spreadsheet)
+    spreadsheet.inject_error("get_all_records", 503, times=SHEETS_MAX_RETRIES + 1)
+    with pytest.raises(gspread.exceptions.APIError):
+        storage.load_df("pom")
+    assert spreadsheet.calls["get_all_records"] == SHEETS_MAX_RETRIES + 1
+
+
+def test_append_not_retried_after_5xx(spreadsheet):
+    storage = make_sheets_storage(spreadsheet)
+    rows = spreadsheet.worksheets["pom"].rows
+    spreadsheet.inject_error("append_rows", 503, written=True) # Server ghi xong nhưng trả 503
+
+    with pytest.raises(gspread.exceptions.APIError):
+        storage.append_rows("pom", [NEW_PO])
+    assert spreadsheet.calls["append_rows"] == 1
+    assert [row[1] for row in rows].count(9001) == 1
+
+
+def test_append_retried_after_429(spreadsheet):
+    storage = make_sheets_storage(spreadsheet)
+    spreadsheet.inject_error("append_rows", 429) # 429: server từ chối, chưa ghi gì
+
+    assert storage.append_rows("pom", [NEW_PO]) == N_POS + 2
+    assert spreadsheet.calls["append_rows"] == 2
+    assert [row[1] for row in spreadsheet.worksheets["pom"].rows].count(9001) == 1
+
+
+def test_concurrent_identical_reads_are_coalesced(spreadsheet):
+    storage = make_sheets_storage(spreadsheet)
+    storage.get_headers("pom") # Mở sẵn tab, chỉ đo get_all_records
+    spreadsheet.latency = Latency(call_seconds=0.3)
+    n_threads = 8
+    barrier = threading.Barrier(n_threads)
+    results = [None] * n_threads
+
+    def read(i):
+        barrier.wait()
+        results[i] = storage.load_df("pom")
+
+    threads = [threading.Thread(target=read, args=(i,)) for i in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert spreadsheet.calls["get_all_records"] == 1
+    assert all(len(df) == N_POS for df in results)
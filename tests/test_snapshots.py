@@ -0,0 +1,70 @@
+def _po_amount(df, po_id):
+    return df.loc[df['po_id'] == po_id, 'po_amount'].iloc[0]
+
+
+def test_slow_reload_does_not_overwrite_write_through(backend, monkeypatch):
+    backend.get_all_records_as_df("pom")
+    load = backend._load_records_as_df
+
+    def slow_load(worksheet_name):
+        df = load(worksheet_name) # Bản tải về có trước lần ghi bên dưới
+        backend.update_sheet_row_by_id("pom", "po_id", 1, {"po_amount": 123456.0})
+        return df
+
+    monkeypatch.setattr(backend, "_load_records_as_df", slow_load)
+    backend._load_snapshot("pom", force_refresh=True)
+    monkeypatch.setattr(backend, "_load_records_as_df", load)
+
+    assert _po_amount(backend.get_all_records_as_df("pom"), 1) == 123456.0
+
+
+def test_reload_keeps_version_when_data_unchanged(backend):
+    backend.get_all_records_as_df("pom")
+    version = backend._snapshots["pom"]["version"]
+    backend._load_snapshot("pom", force_refresh=True)
+    assert backend._snapshots["pom"]["version"] == version
+
+
+def test_reload_picks_up_sheet_changes(backend):
+    backend.get_all_records_as_df("pom")
+    worksheet = backend.sheets_storage._open_worksheet("pom")
+    worksheet.rows[1][3] = 777.0 # po_amount của dòng đầu, sửa thẳng trên Sheet
+    po_id = worksheet.rows[1][1]
+    df = backend._load_snapshot("pom", force_refresh=True)
+    assert _po_amount(df, po_id) == 777.0
+
+
+def _refresher(backend):
+    return backend.SnapshotRefresher(["pom", "dim_publisher"], 10, 300)
+
+
+def test_refresher_reloads_only_when_change_token_moves(backend, backend_sheets):
+    refresher = _refresher(backend)
+    assert refresher.refresh_once() == ["pom", "dim_publisher"] # Chưa có token
+    backend_sheets.calls.clear()
+
+    assert refresher.refresh_once() == []
+    assert backend_sheets.calls["get_all_records"] == 0
+    assert backend_sheets.calls["get_lastUpdateTime"] == 2
+
+    worksheet = backend_sheets.worksheets["pom"]
+    worksheet.rows[1][3] = 555.0
+    backend_sheets.touch() # Sheet bị sửa ngoài backend -> token đổi
+    assert refresher.refresh_once() == ["pom", "dim_publisher"]
+    assert _po_amount(backend._load_snapshot("pom"), worksheet.rows[1][1]) == 555.0
+
+
+def test_refresher_reloads_after_max_age(backend, backend_sheets):
+    refresher = _refresher(backend)
+    refresher.refresh_once()
+    backend._snapshots["pom"]["loaded_at"] -= 301
+    assert refresher.refresh_once() == ["pom"]
+
+
+def test_refresher_marks_unchanged_snapshot_checked(client, backend):
+    refresher = _refresher(backend)
+    refresher.refresh_once()
+    for snap in backend._snapshots.values():
+        snap["checked_at"] -= 100
+    refresher.refresh_once()
+    assert float(client.get("/api/data-version").headers["X-Data-Age"]) < 100
@@ -0,0 +1,68 @@
+from conftest import N_POS, make_sheets_storage
+from storage import SheetSyncJob, SqliteStorage
+
+NEW_PO = [1, 9001, "C000001_001_260101", 5000, 5000, "2026-01-01 10:00:00", "Pending", "Voucher", "normal"]
+
+
+def _local(tmp_path, spreadsheet):
+    remote = make_sheets_storage(spreadsheet)
+    local = SqliteStorage(str(tmp_path / "local.db"), seed_from=remote)
+    return local, remote, SheetSyncJob(local, remote, ["pom"], interval_seconds=0)
+
+
+def test_seed_append_and_update(tmp_path, spreadsheet):
+    local, _, _ = _local(tmp_path, spreadsheet)
+    assert len(local.load_df("pom")) == N_POS
+    assert local.pending_changes("pom") == (N_POS + 1, [])
+
+    first_row = local.append_rows("pom", [NEW_PO])
+    assert first_row == N_POS + 2
+    local.update_cells("pom", [(2, 4, 42)])
+    df = local.load_df("pom")
+    assert df['po_id'].iloc[-1] == 9001
+    assert df['po_amount'].iloc[0] == 42
+    assert [row_num for row_num, _, _ in local.pending_changes("pom")[1]] == [2, N_POS + 2]
+
+
+def test_sync_appends_and_updates_rows(tmp_path, spreadsheet):
+    local, _, job = _local(tmp_path, spreadsheet)
+    local.append_rows("pom", [NEW_PO])
+    local.update_cells("pom", [(3, 4, 42)])
+    job.sync_once()
+
+    rows = spreadsheet.worksheets["pom"].rows
+    assert len(rows) == N_POS + 2
+    assert rows[N_POS + 1][1] == 9001
+    assert rows[2][3] == 42
+    assert local.pending_changes("pom") == (N_POS + 2, [])
+
+    # Sửa dòng vừa đồng bộ -> ghi đè đúng dòng đó, không append lại
+    local.update_cells("pom", [(N_POS + 2, 4, 7000)])
+    job.sync_once()
+    assert len(rows) == N_POS + 2
+    assert rows[N_POS + 1][3] == 7000
+
+
+def test_sync_stops_when_sheet_rows_do_not_match(tmp_path, spreadsheet):
+    local, _, job = _local(tmp_path, spreadsheet)
+    local.load_df("pom") # Nạp bản cục bộ từ Sheet trước khi người khác thêm dòng
+    worksheet = spreadsheet.worksheets["pom"]
+    worksheet.append_rows([[2, 8000, "C000002_001_260101", 1, 1, "2026-01-01 09:00:00", "Pending", "Others", "normal"]])
+    local.append_rows("pom", [NEW_PO])
+    job.sync_once()
+
+    assert local.sync_error("pom") is not None
+    # Dòng mới chưa được đánh dấu đã đồng bộ
+    assert [row_num for row_num, _, _ in local.pending_changes("pom")[1]] == [N_POS + 2]
+
+    # Các lượt sau không append lại, không ghi sửa vào sai dòng trên Sheet
+    sheet_rows = [list(row) for row in worksheet.rows]
+    local.update_cells("pom", [(N_POS + 2, 4, 123)])
+    job.sync_once()
+    assert worksheet.rows == sheet_rows
+
+    # Lỗi được giữ qua lần mở lại file SQLite
+    reopened = SqliteStorage(str(tmp_path / "local.db"))
+    assert reopened.sync_error("pom") == local.sync_error("pom")
+    reopened.clear_sync_error("pom")
+    assert local.sync_error("pom") is None
@@ -0,0 +1,55 @@
+import pandas as pd
+
+
+def _pos(backend):
+    pom = backend.get_all_records_as_df("pom")
+    return pom.assign(po_id=pd.to_numeric(pom['po_id']), ID_phap_nhan=pd.to_numeric(pom['ID_phap_nhan']))
+
+
+def test_pos_pages_sorted_by_id(client, backend):
+    ids = sorted(_pos(backend)['po_id'], reverse=True)
+    first = client.get("/api/pos", query_string={"limit": 50, "sort": "po_id"}).get_json()
+    second = client.get("/api/pos", query_string={"limit": 50, "offset": 50, "sort": "po_id"}).get_json()
+
+    assert first["total"] == second["total"] == 200
+    assert [row["po_id"] for row in first["items"] + second["items"]] == ids[:100]
+    asc = client.get("/api/pos", query_string={"limit": 3, "sort": "po_id", "order": "asc"}).get_json()
+    assert [row["po_id"] for row in asc["items"]] == sorted(ids)[:3]
+
+
+def test_pos_column_filters(client, backend):
+    df = _pos(backend)
+    body = client.get("/api/pos", query_string={
+        "limit": 500, "ID_phap_nhan": "2", "loai_sp": "qua vat", "sort": "po_id", "order": "asc",
+    }).get_json()
+    expected = df[(df['ID_phap_nhan'] == 2) & (df['loai_sp'] == "Quà vật lý")]['po_id'].sort_values().tolist()
+    assert body["total"] == len(expected)
+    assert [row["po_id"] for row in body["items"]] == expected
+
+
+def test_pos_limit_capped_and_dates_iso(client, backend):
+    body = client.get("/api/pos", query_string={"limit": 100000}).get_json()
+    assert body["limit"] == backend.TABLE_PAGE_MAX
+    assert body["items"][0]["po_created_at"][10] == "T"
+
+
+def test_pos_without_limit_returns_all_rows(client):
+    assert len(client.get("/api/pos").get_json()) == 200
+
+
+def test_table_rejects_bad_query(client):
+    assert client.get("/api/pos", query_string={"limit": "x"}).status_code == 400
+    assert client.get("/api/pos", query_string={"sort": "po_amount"}).status_code == 400
+
+
+def test_publishers_filter_and_page(client):
+    body = client.get("/api/publishers", query_string={"ten_phap_nhan": "phap nhan", "limit": 2, "offset": 1,
+                                                        "sort": "ID_phap_nhan", "order": "asc"}).get_json()
+    assert body["total"] == 4
+    assert [row["ID_phap_nhan"] for row in body["items"]] == [2, 3]
+
+
+def test_table_page_sees_writes(client):
+    client.put("/api/po/7", json={"po_status": "Deactivate-test"})
+    body = client.get("/api/pos", query_string={"po_status": "deactivate-test", "limit": 10}).get_json()
+    assert [row["po_id"] for row in body["items"]] == [7]
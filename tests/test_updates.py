@@ -0,0 +1,80 @@
+def _sheet_row(sheets, title, column, value):
+    """Dòng (số thứ tự trên Sheet, giá trị) có `column` == value trên Sheet giả."""
+    rows = sheets.worksheets[title].rows
+    position = rows[0].index(column)
+    for row_num, row in enumerate(rows[1:], start=2):
+        if row[position] == value:
+            return row_num, dict(zip(rows[0], row))
+    raise KeyError(value)
+
+
+def test_update_finds_row_through_id_index(backend, backend_sheets):
+    backend.update_sheet_row_by_id("pom", "po_id", 1, {"po_amount": 1.0}) # Dựng chỉ mục
+    backend_sheets.calls.clear()
+
+    backend.update_sheet_row_by_id("pom", "po_id", 150, {"po_amount": 4321.0, "po_status": "Activate"})
+
+    _, row = _sheet_row(backend_sheets, "pom", "po_id", 150)
+    assert row["po_amount"] == 4321.0 and row["po_status"] == "Activate"
+    assert backend_sheets.calls["get_all_records"] == 0 # Không tải lại tab để tìm dòng
+    assert backend_sheets.calls["batch_update"] == 1
+
+
+def test_update_reloads_index_for_unknown_id(backend, backend_sheets):
+    backend.update_sheet_row_by_id("pom", "po_id", 1, {"po_amount": 1.0})
+    # Dòng thêm thẳng trên Sheet (ngoài backend): chỉ mục chưa có ID này
+    worksheet = backend_sheets.worksheets["pom"]
+    worksheet.rows.append([1, 5000, "C000001_001_260101", 10.0, 10.0, "2026-01-01 00:00:00", "Pending", "Voucher", "normal"])
+    backend_sheets.calls.clear()
+
+    backend.update_sheet_row_by_id("pom", "po_id", 5000, {"po_amount": 99.0})
+
+    row_num, row = _sheet_row(backend_sheets, "pom", "po_id", 5000)
+    assert row_num == len(worksheet.rows) and row["po_amount"] == 99.0
+    assert backend_sheets.calls["get_all_records"] == 1 # Tải lại một lần
+
+
+def test_update_missing_id_reports_error(client, backend_sheets):
+    body = client.put("/api/po/987654", json={"po_amount": 1}).get_json()
+    assert body["success"] is False
+    assert "987654" in body["message"]
+    assert backend_sheets.calls["batch_update"] == 0
+
+
+def test_update_index_follows_appended_rows(client, backend, backend_sheets):
+    body = client.post("/api/create-po", json={
+        "id_phap_nhan": 2, "po_amount": 10, "po_available_amount": 10,
+        "po_status": "Pending", "loai_sp": "Voucher", "type_po": "normal",
+    }).get_json()
+    backend_sheets.calls.clear()
+
+    assert client.put(f"/api/po/{body['new_po_id']}", json={"po_amount": 77}).get_json()["success"]
+
+    _, row = _sheet_row(backend_sheets, "pom", "po_id", body["new_po_id"])
+    assert row["po_amount"] == 77.0
+    assert backend_sheets.calls["get_all_records"] == 0
+
+
+def test_bulk_update_sends_one_batch_update(client, backend_sheets):
+    items = [{"id": po_id, "changes": {"po_amount": 1000 + po_id}} for po_id in (3, 40, 120)]
+    items += [{"id": 987654, "changes": {"po_amount": 1}}, {"id": "abc", "changes": {}}, {"id": 7}]
+    body = client.put("/api/bulk-update-po", json=items).get_json()
+
+    assert body["updated"] == [3, 40, 120]
+    assert [error["row"] for error in body["errors"]] == [4, 5, 6]
+    assert backend_sheets.calls["batch_update"] == 1
+    for po_id in (3, 40, 120):
+        assert _sheet_row(backend_sheets, "pom", "po_id", po_id)[1]["po_amount"] == 1000 + po_id
+
+
+def test_bulk_update_publisher_ignores_id_changes(client, backend, backend_sheets):
+    body = client.put("/api/bulk-update-publisher", json=[
+        {"id": 1, "changes": {"ten_phap_nhan": "Tên mới 1", "ID_phap_nhan": 999}},
+        {"id": 2, "changes": {"ten_phap_nhan": "Tên mới 2"}},
+    ]).get_json()
+
+    assert body["success"], body
+    assert backend_sheets.calls["batch_update"] == 1
+    assert _sheet_row(backend_sheets, "dim_publisher", "ID_phap_nhan", 1)[1]["ten_phap_nhan"] == "Tên mới 1"
+    df = backend.get_all_records_as_df("dim_publisher")
+    assert df.loc[df['ID_phap_nhan'] == 2, 'ten_phap_nhan'].tolist() == ["Tên mới 2"] # Snapshot ghi theo